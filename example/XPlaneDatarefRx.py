@@ -36,6 +36,9 @@ from common import *
 import struct
 import sys
 import binascii
+from ingress import Ingress, header_name
+from beacons import BeaconTable, ROLES
+from xp_profile import profile  # no-op unless the function is listed in PROFILE_FUNCS
 #import socketpool
 
 # Class downloaded from Charlylima
@@ -81,7 +84,14 @@ class XPlaneDatarefRx():
         # values from xplane
         self.BeaconData = {}
         self.xplaneValues = {}
+        self.ingress = Ingress()  # validates the packets received by FindIp()
+        self.beacons = BeaconTable(policy=os.getenv("BEACON_POLICY", "master"))  # X-Plane hosts on the LAN. See beacons.py
         self.defaultFreq = 1
+        # Short label and unit used by disp_values() for each dataref we subscribe to
+        self.dataref_labels = {
+            "sim/flightmodel/position/indicated_airspeed": ("IAS:", "kts"),
+            "sim/flightmodel/position/groundspeed": ("GS:", "m/s"),
+        }
 
     # Function created by Charlylima
     def __del__(self):
@@ -169,6 +179,7 @@ class XPlaneDatarefRx():
         self.my_DataRef_sock.sendto(message, (self.BeaconData["IP"], self.UDP_PORT))
 
     # Function created by Charlylima
+    @profile
     def GetValues(self):
         TAG = tag_adjust("dr.GetValues: ")
         try:
@@ -176,68 +187,85 @@ class XPlaneDatarefRx():
             #    print('dr.GetValues() -- We are entering GetValues', file=sys.stderr)
             # Receive packet
             data, addr = self.my_DataRef_sock.recvfrom(1024) # buffer size is 1024 bytes
-            # Decode Packet
-            retvalues = {}
-            # * Read the Header "RREF".
-            header=data[0:4]
-            if (header==b"DATA"): # 2 lines added by Paulsk. The DATA packets we handle in another function
-                pass
-            elif (header==b"RREF"):
-                # * We get 8 bytes for every dataref sent:
-                #   An integer for idx and the float value.
-                values =data[5:]
-                lenvalue = 8
-                numvalues = int(len(values)/lenvalue)
-                #if my_debug:
-                #    print('values of data packet = {}'.format(values), file=sys.stderr)
-                #    print('number of values = {}'.format(numvalues), file=sys.stderr)
-                for i in range(0,numvalues):
-                    singledata = data[(5+lenvalue*i):(5+lenvalue*(i+1))]
-                    (idx,value) = struct.unpack("<if", singledata)
-                    #if my_debug:
-                    #    print('value (unpacked) = {}'.format(value), file=sys.stderr)
-                    if idx in self.datarefs.keys():
-                       # convert -0.0 values to positive 0.0
-                       if value < 0.0 and value > -0.001 :
-                           value = 0.0
-                    retvalues[self.datarefs[idx]] = value
-                    #if my_debug:
-                    #    print('retvalues = {}'.format(retvalues), file=sys.stderr)
-            else:
-                # if(header!=b"RREF,"): # (was b"RREFO" for XPlane10)
-                print(TAG+'Unknown packet: {}'.format(binascii.hexlify(data)), file=sys.stderr) # Unknown packet: 525245462c0000000000582c460100000000000000  -- Note Paulsk: 42 digits
-            self.xplaneValues.update(retvalues)
+            self.DecodeValues(data)
         except:
             raise XPlaneTimeout()
         if my_debug:
             print(TAG+'Exiting and returning self.xplaneValues: {}\n'.format(self.xplaneValues), file=sys.stderr)
         return self.xplaneValues
 
+    # Decode part of GetValues() split off by Paulsk so that XPlanePoller can feed it
+    # with a datagram received from a non-blocking socket.
+    def DecodeValues(self, data):
+        TAG = tag_adjust("dr.DecodeValues: ")
+        # Decode Packet
+        retvalues = {}
+        # * Read the Header "RREF".
+        header=data[0:4]
+        if (header==b"DATA"): # 2 lines added by Paulsk. The DATA packets we handle in another function
+            pass
+        elif (header==b"RREF"):
+            # * We get 8 bytes for every dataref sent:
+            #   An integer for idx and the float value.
+            values =data[5:]
+            lenvalue = 8
+            numvalues = int(len(values)/lenvalue)
+            #if my_debug:
+            #    print('values of data packet = {}'.format(values), file=sys.stderr)
+            #    print('number of values = {}'.format(numvalues), file=sys.stderr)
+            for i in range(0,numvalues):
+                (idx,value) = struct.unpack_from("<if", data, 5+lenvalue*i)
+                #if my_debug:
+                #    print('value (unpacked) = {}'.format(value), file=sys.stderr)
+                if idx in self.datarefs.keys():
+                   # convert -0.0 values to positive 0.0
+                   if value < 0.0 and value > -0.001 :
+                       value = 0.0
+                   retvalues[self.datarefs[idx]] = value
+                #if my_debug:
+                #    print('retvalues = {}'.format(retvalues), file=sys.stderr)
+        else:
+            # if(header!=b"RREF,"): # (was b"RREFO" for XPlane10)
+            print(TAG+'Unknown packet: {}'.format(binascii.hexlify(data)), file=sys.stderr) # Unknown packet: 525245462c0000000000582c460100000000000000  -- Note Paulsk: 42 digits
+        self.xplaneValues.update(retvalues)
+        return retvalues
+
+    # Function created by Paulsk
+    # Show the received dataref values: in the layout of the "XPlane" page, or else on its third line.
+    def disp_values(self):
+        TAG = tag_adjust("dr.disp_values: ")
+        lo = myVars.read("xp_layout")
+        if lo is not None:
+            # datarefs bound in the layout spec, e.g. "sim/flightmodel/position/indicated_airspeed"
+            lo.render(self.xplaneValues)
+            return
+        x = myVars.read("xp")
+        if x is None or len(x) < 3:
+            return
+        s = ''
+        for k, v in self.xplaneValues.items():
+            if k in self.dataref_labels:
+                lbl, unit = self.dataref_labels[k]
+                s = '{} {} {}'.format(lbl, round(v), unit)
+                break
+        if len(s) > 0 and x[2].text != s:
+            x[2].scale = 2
+            x[2].text = s
+            if my_debug:
+                print(TAG+'showing: \'{}\''.format(s), file=sys.stderr)
 
     def packet_has_data(self, packet):
-        TAG = tag_adjust("dg.packet_has_data(): ")
-        b_cnt = 0
-        le = len(packet)
-        if not my_debug:
-            print(TAG+'packet contents= {}'.format(packet), file=sys.stderr)
-        if le >= 0:
-            for _ in range(le):
-                if not my_debug:
-                    print(TAG+'value byte nr {} is {}'.format(_, packet[_]), file=sys.stderr)
-                if packet[_] == 0:
-                    b_cnt += 1
-                if b_cnt > 5:
-                    if not my_debug:
-                        print(TAG+'{} nr of 0x00 bytes found. Packet doesn\'t contain data.'.format(b_cnt), file=sys.stderr)
-                    return False
-        return True
+        # A packet without a header (all 0x00 bytes) has no data. See ingress.py
+        return len(packet) >= 4 and header_name(packet) != ''
 
     # Function created by Charlylima
+    @profile
     def FindIp(self):
         global pool
         '''
         Find the IP of XPlane Host in the Local Area Network.
-        It takes the first one it can find.
+        Every beacon is entered in self.beacons. It returns as soon as a host fits the policy
+        (see beacons.py), e.g. a master. Beacons of external visuals and IOS are not taken by default.
         '''
         TAG = tag_adjust("dr.FindIp(): ")
         self.BeaconData = {}
@@ -264,7 +292,11 @@ class XPlaneDatarefRx():
 
             #self.my_DataRef_sock.setsockopt(pool.SOL_SOCKET, pool.SO_REUSEADDR, 1)
             ###    self.my_DataRef_sock.bind((self.MCAST_GRP, self.MCAST_PORT))     <<<<=====================
-            self.my_DataRef_sock.bind((self.udp_host, self.MCAST_PORT))
+            if self.use_udp_host:
+                self.my_DataRef_sock.bind((self.udp_host, self.MCAST_PORT))
+            else:
+                # X-Plane sends its BECN packets to multicast group 239.255.1.1, port 49707
+                bind_multicast(pool, self.my_DataRef_sock, self.MCAST_GRP, self.MCAST_PORT, self.udp_host)
 
             #self.my_DataRef_sock.connect((self.MCAST_GRP, self.MCAST_PORT))
 
@@ -300,14 +332,10 @@ class XPlaneDatarefRx():
                 #size = self.my_DataRef_sock.recv_into(packet)  # ToDo: solve the 'hanging' of this command !!!
 
                 size, addr = self.my_DataRef_sock.recvfrom_into(packet)
+                if self.ingress.check(packet, size) == 0:
+                    continue  # all-zero, wrong length, duplicate or unknown packet. See ingress.py
 
-                # Convert packet header (bytearray) to string
-                header0 = packet[:self.headerlen]
-                if not my_debug:
-                    print(TAG+'header0 = {}'.format(header0), file=sys.stderr)
-                header = ''
-                for _ in range(len(header0)):
-                    header += chr(header0[_])
+                header = header_name(packet)  # e.g. 'BECN'. The header is read as one integer
                 print(TAG+'header= {}'.format(header), file=sys.stderr)
 
                 print(TAG+'nr bytes received= {} from {}'.format(size, addr[0]), file=sys.stderr)
@@ -328,58 +356,17 @@ class XPlaneDatarefRx():
                 if header == 'DATA': # 2 lines added by Paulsk. The DATA packet we handle in the XPlaneUdpDatagram Class object.
                     pass
                 elif header == 'BECN':
-                    blink_NEO_color(neo_led_green) # blink the Neopixel led in green (see: common.py)
-                    data = packet[5:21]
-                    print(TAG+'first 8 bytes of data= {}'.format(data[:8]), file=sys.stderr)
-
-                    if not my_debug:
-                        print(TAG+'Entering...', file=sys.stderr)
-                        print('packet header = {}'.format(header), file=sys.stderr)
-                        #print('packet received = {}'.format(packet), file=sys.stderr)
-                        print('packet data part = {}'.format(data), file=sys.stderr)
-                    # * Data
-                    # data = msg[5:]  # was: packet[5:21]
-                    # struct becn_struct
-                    # {
-                    # 	uchar beacon_major_version;		// 1 at the time of X-Plane 10.40
-                    # 	uchar beacon_minor_version;		// 1 at the time of X-Plane 10.40
-                    # 	xint application_host_id;		// 1 for X-Plane, 2 for PlaneMaker
-                    # 	xint version_number;			// 104014 for X-Plane 10.40b14 - 113201 for X-Plane 11.32
-                    # 	uint role;				        // 1 for master, 2 for extern visual, 3 for IOS
-                    # 	ushort port;				    // port number X-Plane is listening on
-                    # 	xchr	computer_name[strDIM];  // the hostname of the computer
-                    # };
-                    beacon_major_version = 0
-                    beacon_minor_version = 0
-                    application_host_id = 0
-                    xplane_version_number = 0
-                    role = 0
-                    port = 0
-                    (
-                      beacon_major_version,  # 1 at the time of X-Plane 10.40
-                      beacon_minor_version,  # 1 at the time of X-Plane 10.40, 2 at the time of X-Plane 11
-                      application_host_id,   # 1 for X-Plane, 2 for PlaneMaker
-                      xplane_version_number, # 104014 for X-Plane 10.40b14 - 113201 for X-Plane 11.32
-                      role,                  # 1 for master, 2 for extern visual, 3 for IOS
-                      port,                  # port number X-Plane is listening on
-                    ) = struct.unpack("<BBiiIH", data)
-
-
-                    if my_debug:
-                        print('beacon_major_version = {}'.format(beacon_major_version), file=sys.stderr)
-                        print('beacon_minor_version = {}'.format(beacon_minor_version), file=sys.stderr)
-                        print('application_host_id = {}'.format(application_host_id), file=sys.stderr)
-
-                    # Originally beacon_minor_version was checked for a value of 1 but investigation by Paulsk revealed that X-Plane 11 returns a value of  2
-                    computer_name = packet[21:-1]   # packet[21:-1]
-                    if beacon_major_version == 1 \
-                       and beacon_minor_version == 2 \
-                       and application_host_id == 1:
-                        self.BeaconData["IP"] = sender[0]
-                        self.BeaconData["Port"] = port
-                        self.BeaconData["hostname"] = computer_name.decode()
-                        self.BeaconData["XPlaneVersion"] = xplane_version_number
-                        self.BeaconData["role"] = role
+                    leds.play('beacon') # blink the Neopixel led in green (see: led_anim.py)
+                    leds.tick()
+                    b = self.beacons.update(packet, size, addr)
+                    if b is not None and not my_debug:
+                        print(TAG+'beacon of {} ({}), role {}, X-Plane version {}'.format(
+                            b["hostname"], b["IP"], ROLES.get(b["role"], b["role"]), b["XPlaneVersion"]), file=sys.stderr)
+                    sel = self.beacons.select()
+                    if sel is not None:
+                        self.BeaconData = {}
+                        for k in ("IP", "Port", "hostname", "XPlaneVersion", "role"):
+                            self.BeaconData[k] = sel[k]
 
                         if not my_debug:
                             print('\n'+TAG+'-- Beacon UDP packet received:', file=sys.stderr)
@@ -392,7 +379,7 @@ class XPlaneDatarefRx():
                     le_BeaconData = len(self.BeaconData)
 
                 else:
-                    print(TAG+'-- Unknown packet from {]'.format(sender[0]), file=sys.stderr)
+                    print(TAG+'-- Unknown packet from {}'.format(addr[0]), file=sys.stderr)
                     print('{} bytes'.format(str(len(packet))), file=sys.stderr)
                     print(packet, file=sys.stderr)
                     print(binascii.hexlify(packet), file=sys.stderr)
@@ -0,0 +1,283 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Receive loop that polls both the UDP Datagram socket (see: XPlaneUdpDatagram.py)
+# and the DataRef (RREF) socket (see: XPlaneDatarefRx.py) without blocking.
+# Each received packet is routed to the right decoder using its 4-byte header.
+# This way the DATA group values and the RREF subscribed values update the same display.
+#
+# CircuitPython's socketpool has no select(). Both sockets are set to non-blocking.
+# A recvfrom_into() on an empty socket then raises OSError EAGAIN (errno 11),
+# which we treat as 'nothing received'.
+#
+# A third socket joins the beacon group (239.255.1.1, port 49707) in both modes (USE_UDP_HOST "0" and "1"),
+# so the table of X-Plane hosts (see beacons.py) stays filled and check_host() has a host to fail over to.
+# Only the BECN packets of that socket are used: in multicast mode the DATA packets also arrive on the dg socket.
+# If the group cannot be joined, there is no failover: the host found first is kept.
+#type:ignore
+from common import *
+from beacons import BEACON_GROUP, BEACON_PORT
+import time
+import sys
+
+EAGAIN = 11
+
+class XPlanePoller():
+
+    def __init__(self, dg, dr):
+        TAG = tag_adjust("xpoll.__init__(): ")
+        self.dg = dg  # instance of the XPlaneUdpDatagram class
+        self.dr = dr  # instance of the XPlaneDatarefRx class
+        self.dg_sock = None
+        self.dr_sock = None
+        self.dr_packet = bytearray(1024)
+        self.bcn_sock = None
+        self.bcn_packet = bytearray(256)
+        # DataRefs to subscribe to as soon as we know the IP-address of the X-Plane host
+        self.datarefs = ["sim/flightmodel/position/indicated_airspeed"]
+        self.dataref_freq = 2   # packets per second requested from X-Plane
+        self.subscribed = False
+        self.resubscribe_t = 5  # resend the RREF request if nothing received during this nr of seconds
+        self.last_rref_t = 0
+        self.loop_cnt = 0
+        self.rref_timeout_cnt = 0  # nr of times no RREF packet arrived within resubscribe_t seconds
+        self.beacons = dr.beacons  # X-Plane hosts seen on the LAN (see beacons.py)
+        self.failover_t = 1.0      # subscribe at another host if the current one sent no RREF during this nr of seconds
+        self.next_host_t = 0
+        self.failover_cnt = 0
+        self.pkt_cnt = 0
+        self.relay = None  # optional XPlaneRelay instance. See code.setup()
+        self.ingress = dg.ingress  # validates the packets and dispatches them on their header
+        self.ingress.register(b'RREF', self.on_rref)
+        self.ingress.register(b'DATA', self.on_data)
+        for h in (b'XATT', b'XGPS', b'XTRA'):
+            self.ingress.register(h, self.on_datagram)
+        self.ingress.register(b'BECN', self.on_beacon)
+        self.sensors = None  # optional SensorService instance, polled when no packet was waiting
+        self.stats = None    # optional PipelineStats instance, updated when no packet was waiting
+        self.metrics = None  # optional metrics_http.MetricsServer, served when no packet was waiting
+        self.recorder = None  # optional flight_recorder.FlightRecorder, records every DATA packet
+        self.config = None    # optional config_watch.ConfigWatch, re-reads settings.toml when no packet was waiting
+        self.h_decode = None   # latency histograms of the metrics (metrics_http.Histogram). See code.setup()
+        self.h_refresh = None
+        self.h_gc = None
+        fps = myVars.read("display_fps")
+        self.frame_interval = 1.0 / fps if fps else 0.1  # seconds between two dg.render_predicted() calls
+        self.next_frame_t = 0
+        if my_debug:
+            print(TAG+'datarefs to subscribe: {}'.format(self.datarefs), file=sys.stderr)
+
+    def open(self):
+        TAG = tag_adjust("xpoll.open(): ")
+        self.dg.use_poll = True
+        self.dg.packet = bytearray(self.dg.packet_length)
+        self.dg_sock = self.dg.OpenUDPSocket(True)
+        self.dg_sock.setblocking(False)
+        self.dr_sock = self.dr.OpenDatarefSocket()
+        self.dr_sock.setblocking(False)
+        self.open_beacons()
+        if not my_debug:
+            print(TAG+'polling UDP Datagram and DataRef sockets', file=sys.stderr)
+
+    def open_beacons(self):
+        """Join the multicast group of the X-Plane beacons. Without it there is no failover to another host"""
+        TAG = tag_adjust("xpoll.open_beacons(): ")
+        s = None
+        try:
+            a_pool = make_pool()
+            s = a_pool.socket(a_pool.AF_INET, a_pool.SOCK_DGRAM)
+            if bind_multicast(a_pool, s, BEACON_GROUP, BEACON_PORT, self.dg.udp_host):
+                s.setblocking(False)
+                self.bcn_sock = s
+                return True
+        except OSError as e:
+            print(TAG+'{}'.format(e), file=sys.stderr)
+        if s is not None:
+            s.close()
+        print(TAG+'no beacons received: failover to another X-Plane host is not possible', file=sys.stderr)
+        return False
+
+    def reopen_dg(self):
+        """Close and reopen the UDP Datagram socket with the host/group and port now in myVars"""
+        TAG = tag_adjust("xpoll.reopen_dg(): ")
+        self.dg.CloseUDPSocket()
+        self.dg.set_mcast()
+        self.dg_sock = self.dg.OpenUDPSocket(True)
+        self.dg_sock.setblocking(False)
+        if not my_debug:
+            print(TAG+'socket bound again, port {}'.format(self.dg.MCAST_PORT), file=sys.stderr)
+
+    def close(self):
+        self.dg.CloseUDPSocket()
+        if self.relay is not None:
+            self.relay.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.recorder is not None:
+            self.recorder.close()  # writes the last, partly filled, block
+        if self.dr_sock is not None:
+            self.dr.CloseDatarefSocket(self.dr_sock)
+            self.dr_sock = None
+        if self.bcn_sock is not None:
+            self.bcn_sock.close()
+            self.bcn_sock = None
+        self.dg.use_poll = False
+
+    def recv(self, sock, buf):
+        """Return (size, addr). size is 0 if there was nothing to receive"""
+        try:
+            return sock.recvfrom_into(buf)
+        except OSError as e:
+            if e.errno == EAGAIN:
+                return 0, None
+            raise
+
+    def subscribe(self, host_ip, port=None):
+        TAG = tag_adjust("xpoll.subscribe(): ")
+        self.dr.BeaconData["IP"] = host_ip
+        if port:
+            self.dr.UDP_PORT = port
+        for dref in self.datarefs:
+            self.dr.AddDataRef(dref, freq=self.dataref_freq)
+        self.subscribed = True
+        self.last_rref_t = time.monotonic()
+        if not my_debug:
+            print(TAG+'subscribed to {} dataref(s) at {}'.format(len(self.datarefs), host_ip), file=sys.stderr)
+
+    def unsubscribe(self):
+        """Ask the current host to stop sending our datarefs (frequency 0)"""
+        TAG = tag_adjust("xpoll.unsubscribe(): ")
+        for dref in self.datarefs:
+            try:
+                self.dr.AddDataRef(dref, freq=0)
+            except OSError as e:
+                print(TAG+'{}: {}'.format(dref, e), file=sys.stderr)
+        self.subscribed = False
+
+    def check_host(self, now):
+        """Fail over to another host when the current one is silent,
+        or move to the host selected by the policy when the current one is not allowed (e.g. an external visual)"""
+        TAG = tag_adjust("xpoll.check_host(): ")
+        cur = self.dr.BeaconData.get("IP")
+        silent = now - self.last_rref_t > self.failover_t
+        if not silent:
+            b = self.beacons.hosts.get(cur)
+            if b is None or self.beacons.accepts(b):
+                return False
+        sel = self.beacons.select(now, exclude=cur if silent else None)
+        if sel is None or sel["IP"] == cur:
+            return False
+        if not my_debug:
+            print(TAG+'{} {}. Moving to {} ({})'.format(cur, "is silent" if silent else "is not allowed",
+                sel["hostname"], sel["IP"]), file=sys.stderr)
+        self.unsubscribe()
+        self.subscribe(sel["IP"], sel["Port"])
+        self.failover_cnt += 1
+        return True
+
+    def route(self, packet, size, addr, path=0):
+        """Hand the packet to the decoder belonging to its header. Bad and duplicate packets are dropped by the ingress stage.
+        path: the socket the packet came from (0 = dg_sock, 1 = dr_sock, 2 = bcn_sock), a copy on another path is a duplicate"""
+        TAG = tag_adjust("xpoll.route(): ")
+        if not self.ingress.dispatch(packet, size, addr, path) and my_debug:
+            print(TAG+'Packet of {} bytes from {} rejected or not handled'.format(size, addr), file=sys.stderr)
+
+    def on_rref(self, packet, size, addr):
+        self.last_rref_t = time.monotonic()
+        self.dr.DecodeValues(packet[:size])
+        self.dr.disp_values()
+
+    def on_datagram(self, packet, size, addr):
+        if packet is not self.dg.packet:
+            self.dg.packet[:size] = packet[:size]
+        self.dg.size = size
+        self.dg.sender = addr
+        t0 = time.monotonic_ns()
+        self.dg.DecodePacket()
+        if self.h_decode is not None:
+            self.h_decode.observe((time.monotonic_ns() - t0) / 1e9)
+            self.h_gc.observe(self.dg.gc_pause_s)
+        if self.relay is not None:
+            self.relay.publish(self.dg.GetFields())
+        if not self.subscribed and addr is not None:
+            # The sender of the UDP Datagrams is our X-Plane host. No need to wait for a BECN packet.
+            # If the beacons show that it is not allowed by the policy, check_host() moves away from it.
+            self.subscribe(addr[0])
+
+    def on_data(self, packet, size, addr):
+        self.on_datagram(packet, size, addr)
+        if self.recorder is not None:
+            self.recorder.record(self.dg.GetFields())  # into RAM. Whole blocks are written to the file
+
+    def on_beacon(self, packet, size, addr):
+        now = time.monotonic()
+        if self.beacons.update(packet, size, addr, now) is None:
+            return
+        if not self.subscribed:
+            sel = self.beacons.select(now)
+            if sel is not None:
+                self.subscribe(sel["IP"], sel["Port"])
+
+    def poll(self):
+        """One non-blocking pass over the sockets. Returns the nr of packets handled"""
+        n = 0
+        size, addr = self.recv(self.dg_sock, self.dg.packet)
+        if size > 0:
+            self.route(self.dg.packet, size, addr)
+            n += 1
+        size, addr = self.recv(self.dr_sock, self.dr_packet)
+        if size > 0:
+            self.route(self.dr_packet, size, addr, 1)
+            n += 1
+        if self.bcn_sock is not None:
+            size, addr = self.recv(self.bcn_sock, self.bcn_packet)
+            if size > 0 and self.bcn_packet[:4] == b'BECN':
+                self.route(self.bcn_packet, size, addr, 2)
+                n += 1
+        now = time.monotonic()
+        if n > 0 and not leds.busy():
+            leds.play('heartbeat')
+        leds.tick(now)
+        if now >= self.next_frame_t:
+            # frame scheduler: the display follows the predicted values, not the packets
+            self.next_frame_t = now + self.frame_interval
+            t0 = time.monotonic_ns()
+            if self.dg.render_predicted(now) and self.h_refresh is not None:
+                self.h_refresh.observe((time.monotonic_ns() - t0) / 1e9)  # only frames that changed the display
+        elif n == 0:
+            if self.stats is not None:
+                self.stats.update(now)
+            if self.sensors is not None:
+                self.sensors.poll(now)  # at most one I2C read, and only when both sockets were empty
+            if self.metrics is not None:
+                self.metrics.poll(now)
+            if self.recorder is not None:
+                self.recorder.poll(now)
+            if self.config is not None:
+                self.config.poll(now)  # reads at most one setting
+        if self.subscribed and now >= self.next_host_t:
+            self.next_host_t = now + 0.25
+            self.check_host(now)
+        if self.subscribed and now - self.last_rref_t >= self.resubscribe_t:
+            self.rref_timeout_cnt += 1
+            self.subscribe(self.dr.BeaconData["IP"])
+        self.loop_cnt += 1
+        self.pkt_cnt += n
+        return n
+
+    def run(self):
+        TAG = tag_adjust("xpoll.run(): ")
+        if self.dg_sock is None:
+            self.open()
+        try:
+            while True:
+                self.poll()
+                if myVars.read("kbd_intr"):
+                    raise KeyboardInterrupt
+        finally:
+            if not my_debug:
+                print(TAG+'loops: {}, packets: {}'.format(self.loop_cnt, self.pkt_cnt), file=sys.stderr)
+            self.close()
@@ -0,0 +1,166 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Fan-out relay for decoded X-Plane flight data.
+# The X-Plane DATA/XGPS stream is received (and decoded) once.
+# Each downstream display (subscriber) receives a compact update containing only
+# the fields it asked for, at most at the rate set for it in the config file (default: relay.json).
+#
+# On the device the relay is fed by XPlanePoller with the values decoded by XPlaneUdpDatagram.
+# On a Linux box run() can be used with the CPython 'socket' module as pool:
+#   python XPlaneRelay.py [relay.json]
+# It joins the multicast group X-Plane sends to and decodes with an XPlaneFields (xp_fields.py, no board needed).
+# Another decoder object only needs a DecodeFields(packet, size) method that returns a dict {field name: value}
+# or None, like XPlaneFields.DecodeFields().
+#
+# Each update is a compact delta-encoded frame. See xp_frame.py for the format.
+# Every subscriber has its own frame Encoder because each one asks for other fields.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import sys
+import time
+import json
+from xp_frame import FIELD_IDS, Encoder
+from ingress import Ingress
+
+my_debug = False
+
+class XPlaneRelay():
+
+    def __init__(self, pool, decoder=None, config_file="relay.json"):
+        TAG = "relay.__init__(): "
+        self.pool = pool        # socketpool.SocketPool (CircuitPython) or the socket module (CPython)
+        self.decoder = decoder  # object with a DecodeFields(packet, size) method. Only needed by run()
+        self.ingress = Ingress()  # drops bad and duplicate packets in run()
+        self.sock = None
+        self.tx_cnt = 0
+        self.err_cnt = 0        # packets run() could not decode or publish
+        self.running = False    # run() returns within its timeout after stop()
+        self.subscribers = []
+        self.listen_port = 49707
+        self.listen_group = "239.255.1.1"  # multicast group joined by run(). "" to receive unicast only
+        self.load_config(config_file)
+        if not my_debug:
+            print(TAG+'{} subscriber(s) loaded from \'{}\''.format(len(self.subscribers), config_file), file=sys.stderr)
+
+    def load_config(self, config_file):
+        """
+        Example of a config file:
+        {"listen_port": 49707,
+         "listen_group": "239.255.1.1",
+         "subscribers": [
+            {"host": "192.168.1.121", "port": 49710, "fields": ["hding_mag", "CG_ftmsl"], "max_rate": 5},
+            {"host": "192.168.1.122", "port": 49710, "fields": ["vind_kias"], "max_rate": 2}]}
+        max_rate is in updates per second.
+        """
+        TAG = "relay.load_config(): "
+        with open(config_file, "r") as f:
+            cfg = json.load(f)
+        self.listen_port = cfg.get("listen_port", self.listen_port)
+        self.listen_group = cfg.get("listen_group", self.listen_group)
+        for s in cfg.get("subscribers", []):
+            ids = []
+            for fld in s["fields"]:
+                if fld in FIELD_IDS:
+                    ids.append(FIELD_IDS[fld])
+                else:
+                    print(TAG+'unknown field \'{}\' for {}. Skipped'.format(fld, s["host"]), file=sys.stderr)
+            rate = s.get("max_rate", 1)
+            self.subscribers.append({
+                'addr': (s["host"], int(s["port"])),
+                'enc': Encoder(ids, max(1, int(cfg.get("keyframe_interval", 50)))),
+                'interval': 1.0 / rate if rate > 0 else 0.0,
+                'last_t': -1.0e9,
+            })
+
+    def open(self):
+        if self.sock is None:
+            self.sock = self.pool.socket(self.pool.AF_INET, self.pool.SOCK_DGRAM)
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def publish(self, fields, now=None):
+        """Send the decoded fields to every subscriber whose rate limit allows it"""
+        TAG = "relay.publish(): "
+        if fields is None:
+            return 0
+        if now is None:
+            now = time.monotonic()
+        if self.sock is None:
+            self.open()
+        sent = 0
+        for sub in self.subscribers:
+            if now - sub['last_t'] < sub['interval']:
+                continue
+            enc = sub['enc']
+            le = enc.encode(fields)
+            if le == 0:
+                continue  # nothing changed for this subscriber
+            try:
+                self.sock.sendto(memoryview(enc.buf)[:le], sub['addr'])
+                sub['last_t'] = now
+                sent += 1
+            except OSError as e:
+                print(TAG+'sendto {} failed: {}'.format(sub['addr'], e), file=sys.stderr)
+        self.tx_cnt += sent
+        return sent
+
+    def open_rx(self, timeout):
+        """The socket run() receives on: bound to listen_port and joined to listen_group (CPython 'socket' module)"""
+        TAG = "relay.open_rx(): "
+        p = self.pool
+        rx_sock = p.socket(p.AF_INET, p.SOCK_DGRAM)
+        rx_sock.setsockopt(p.SOL_SOCKET, p.SO_REUSEADDR, 1)  # X-Plane clients on this PC may listen too
+        rx_sock.bind(("", self.listen_port))
+        if self.listen_group:
+            try:
+                mreq = p.inet_aton(self.listen_group) + p.inet_aton("0.0.0.0")  # struct ip_mreq, any interface
+                rx_sock.setsockopt(p.IPPROTO_IP, p.IP_ADD_MEMBERSHIP, mreq)
+                print(TAG+'joined multicast group {}, port {}'.format(self.listen_group, self.listen_port), file=sys.stderr)
+            except OSError as e:
+                print(TAG+'joining multicast group {} failed: {}. Unicast only'.format(self.listen_group, e), file=sys.stderr)
+        rx_sock.settimeout(timeout)
+        return rx_sock
+
+    def run(self, packet_length=1024, timeout=1.0):
+        """Stand-alone relay: receive X-Plane packets on listen_port and publish them until stop().
+        A packet that cannot be decoded is counted in err_cnt and skipped"""
+        TAG = "relay.run(): "
+        if self.decoder is None:
+            from xp_fields import XPlaneFields
+            self.decoder = XPlaneFields()
+        rx_sock = self.open_rx(timeout)
+        packet = bytearray(packet_length)
+        print(TAG+'relaying packets received on port {}'.format(self.listen_port), file=sys.stderr)
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    size, addr = rx_sock.recvfrom_into(packet)
+                except OSError:
+                    continue  # timeout: check self.running
+                try:
+                    if self.ingress.check(packet, size) != 0:
+                        self.publish(self.decoder.DecodeFields(packet, size))
+                except Exception as e:
+                    self.err_cnt += 1
+                    print(TAG+'packet of {} bytes from {} skipped: {}'.format(size, addr, e), file=sys.stderr)
+        finally:
+            self.running = False
+            rx_sock.close()
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+if __name__ == "__main__":
+    import socket
+    XPlaneRelay(socket, config_file=sys.argv[1] if len(sys.argv) > 1 else "relay.json").run()
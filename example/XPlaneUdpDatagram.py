@@ -39,6 +39,12 @@ import sys
 import struct
 import binascii
 import gc
+from xp_fields import XPlaneFields
+from xp_predict import Predictor
+from ingress import Ingress, header_name
+from xp_tables import DATA_GROUPS, CSV_TYPES
+from xp_decode import unpack_csv, csv_labels
+from xp_profile import profile  # no-op unless the function is listed in PROFILE_FUNCS
 
 # ==========================================
 #                                          =
@@ -81,13 +87,7 @@ class XPlaneUdpDatagram():
         self.values = {}
         self.dataFLTSTS = []
         self.udp_host = str(wifi.radio.ipv4_address)
-        self.use_udp_host = True if myVars.read("use_udp_host") == "1" else False
-        if self.use_udp_host:
-            self.MCAST_GRP = myVars.read("multicast_group1")
-            self.MCAST_PORT = myVars.read("multicast_port1")
-        else:
-            self.MCAST_GRP = myVars.read("multicast_group2")
-            self.MCAST_PORT = myVars.read("multicast_port2")
+        self.set_mcast()
         if my_debug:
             print(TAG+'self.MCAST_GRP= {}'.format(self.MCAST_GRP), file=sys.stderr)
             print(TAG+'self.MCAST_PORT= {}'.format(self.MCAST_PORT), file=sys.stderr)
@@ -103,77 +103,30 @@ class XPlaneUdpDatagram():
         self.packet_length = 149  # Update 2023-02-02: Also with X-Plane 12 the Multicast to group 239.255.1.1 destination port 49707 had a length of 149 bytes
         self.sender = None
         self.sock = None # my_sock
+        self.mcast_joined = False # See OpenUDPSocket()
         self.size = 0
         self.timeout_cnt = 0
+        self.decode_err_cnt = 0 # packets that could not be decoded. Shown on the "Stats" page
+        self.gc_pause_s = 0.0   # duration of the last gc.collect() in DecodePacket()
+        self.use_poll = False # Set by XPlanePoller. If True the display functions must not sleep
 
         if my_have_tft:
             self.hdg_alt_lst = [] # Added for use with Adafruit Feather ESP32-S2 TFT
-        self.udp_types = {
-          3:  'Speeds',
-         17: 'Pitch, roll, & headings',
-         20: 'Latitude, longitude, & altitude',
-        102: 'dme',
-        }
-        
+        # Decoded values of the DATA groups and XGPS, keyed by field name. The record layouts are generated from
+        # tools/xp_schema.json (see xp_tables.py). The decoding has no display, see xp_fields.py
+        self.xf = XPlaneFields()
+        self.values_structs = self.xf.values_structs
+        self.values_struct_3 = self.values_structs[3]      # Speeds
+        self.values_struct_17 = self.values_structs[17]    # Pitch, roll, & headings
+        self.values_struct_20 = self.values_structs[20]    # Latitude, longitude, & altitude
+        self.values_struct_102 = self.values_structs[102]  # dme
+        self.udp_types = {}
+        for idx in self.values_structs:
+            self.udp_types[idx] = DATA_GROUPS[idx][0]
+
         # Issue command 'sys.byteorder' to get the byteorder (little or big endian) that the operating system uses
         # sys.byteorder gave as result: 'little'
 
-        self. udp_unpack_str_3 = "<iffffifff"   # i = unsigned int , standard size = 4 bytes. f = float, standard size = 4 bytes
-        
-        self.values_struct_3 = { # udp_unpack_str_3 = "iffffifff"
-        'ID':          DUMMY_STR_INT,     # DATA and a NULL
-        'vind_kias':   DUMMY_STR_FLOAT,   # FLOAT vind_kias   airspeed in knots indicated air speed
-        'vind_keas':   DUMMY_STR_FLOAT,   # FLOAT vind_keas   airspeed in knots e... air speed
-        'vtrue_ktas':  DUMMY_STR_FLOAT,   # FLOAT vtrue_ktas  true airspeed in knots
-        'vtrue_ktgs':  DUMMY_STR_FLOAT,   # FLOAT vtrue_ktgs  true ground speed in knots
-        'nothing':     DUMMY_STR_INT,     # INT filling
-        'vind_mph':    DUMMY_STR_FLOAT,   # FLOAT vind_mph    indicated airspeed in miles-per-hour
-        'vtrue_mphas': DUMMY_STR_FLOAT,   # FLOAT vtrue_mphas  true airspeed in miles-per-hour
-        'vtrue_mphgs': DUMMY_STR_FLOAT    # FLOAT vtrue_mphgs  true groundspeed in miles-per-hour
-        }
-
-        self.udp_unpack_str_17 = "<ifffiffif"  # was: "iffffiiii"
-        
-        self.values_struct_17 = { # udp_unpack_str_17 = "ifffiffif"   was: "iffffiiii"
-            'ID':         DUMMY_STR_INT,
-            'pitch_deg':  DUMMY_STR_FLOAT,
-            'roll_deg':   DUMMY_STR_FLOAT,
-            'hding_true': DUMMY_STR_FLOAT,
-            'nothing1':   DUMMY_STR_INT,                   
-            'hding_mag':  DUMMY_STR_FLOAT,
-            'mavar_deg':  DUMMY_STR_FLOAT,
-            'nothing2':   DUMMY_STR_INT,
-            'mag_comp':   DUMMY_STR_FLOAT
-            }
-
-        self.udp_unpack_str_20 = "<iffffffff"
-        
-        self.values_struct_20 = { # udp_unpack_str_20 = "iffffffff"
-            'ID':          DUMMY_STR_INT,
-            'lat_deg':     DUMMY_STR_FLOAT,
-            'lon_deg':     DUMMY_STR_FLOAT,
-            'CG_ftmsl':    DUMMY_STR_FLOAT,
-            'gear_ftagl':  DUMMY_STR_FLOAT,
-            'terrn_ftmsl': DUMMY_STR_FLOAT,
-            'p-alt_ftmsl': DUMMY_STR_FLOAT,
-            'lat_orign':   DUMMY_STR_FLOAT,
-            'lon_orign':   DUMMY_STR_FLOAT
-            }
-
-        self.udp_unpack_str_102 = "<iffffffii"   # was: "iiiiiiiif"
-
-        self.values_struct_102 = { # 2019-05-01 18h23PT udp_unpack_str_102 = iiiiiiiif  --> old: "<ifffiiiff"  --> old unpack string: "ifiifffif"
-            'ID':         DUMMY_STR_INT,
-            'dme_nav01':  DUMMY_STR_FLOAT, # dme of nav1
-            'dme_mode':   DUMMY_STR_INT,   # dme mode (1 = dme1, 2= dme2)
-            'dme_found':  DUMMY_STR_INT,   # dme found  1.0000
-            'dme_dist':   DUMMY_STR_FLOAT, # dme distance (nm)
-            'dme_speed':  DUMMY_STR_FLOAT, # dme speed    (kts)
-            'dme_time':   DUMMY_STR_FLOAT, # dme_time (time-to-station)
-            'dme_n-typ':  DUMMY_STR_INT,   # dme n-typ (3.0000)
-            'dme-3_freq': DUMMY_STR_FLOAT, # dme3 freq (this is the 3rd, dme receiver (usually not reacheable)
-            }
-        
         self.udp_unpack_str5 = "<idddffffffffff"  # was: "iiiiiiiif"  4 + (3 x 8) + (10 x 4)   4 + 24 + 40 = 68 bytes
          
         self.values_struct5 = {    # udp_unpack_str5 = "ffffffffff"
@@ -198,10 +151,29 @@ class XPlaneUdpDatagram():
         self.xplaneValues = {}
         self.defaultFreq = 1
 
+        # Decoded values of the last XGPS packet. See xgps_unpack()
+        self.values_xgps = self.xf.values_xgps
+        # Vertical speed, rate of turn, track, wind component and distance flown. See xp_derived.py
+        self.derived = self.xf.derived
+        # Extrapolates heading, altitude and position between packets. See render_predicted()
+        self.predictor = Predictor()
+        # Rejects all-zero, wrongly sized, duplicate and unknown packets before they are decoded
+        self.ingress = Ingress()
+
         # The next line must be at the end, below all other constant definitions !!!
         self.LCDFill() # Print the framework on the LCD
 
     # The socket definitions in function OpenUDPSocket() were before inside the FindIp() function in Charlylima's file: XPlaneUdp.py
+    def set_mcast(self):
+        """Take the host/group and port to listen on from myVars. Used again after a settings reload"""
+        self.use_udp_host = True if myVars.read("use_udp_host") == "1" else False
+        if self.use_udp_host:
+            self.MCAST_GRP = myVars.read("multicast_group1")
+            self.MCAST_PORT = myVars.read("multicast_port1")
+        else:
+            self.MCAST_GRP = myVars.read("multicast_group2")
+            self.MCAST_PORT = myVars.read("multicast_port2")
+
     def OpenUDPSocket(self, start):
         global pool
         TAG = tag_adjust("dg.OpenUDPSocket(): ")
@@ -231,12 +203,15 @@ class XPlaneUdpDatagram():
                 print(TAG+'type(wifi)= {}'.format(type(wifi)), file=sys.stderr)
             if self.use_udp_host:
                 udp_host = self.udp_host
+                self.sock.bind((udp_host, self.MCAST_PORT))
             else:
                 #udp_host = str(wifi.radio.ipv4_address)
                 if my_debug:
                     print(TAG+'type(self.MCAST_GRP)= {}'.format(type(self.MCAST_GRP)), file=sys.stderr)
-                udp_host = self.MCAST_GRP
-            self.sock.bind((udp_host, self.MCAST_PORT))
+                # Join the multicast group instead of only binding to its address.
+                # Falls back to unicast (bind to the IP of this device) if joining is not possible.
+                self.mcast_joined = bind_multicast(pool, self.sock, self.MCAST_GRP, self.MCAST_PORT, self.udp_host)
+                udp_host = self.MCAST_GRP if self.mcast_joined else self.udp_host
             if start and not my_debug:
                 print(TAG+'waiting for packets on host {}, port {}'.format(udp_host, self.MCAST_PORT), file=sys.stderr)
 
@@ -257,6 +232,9 @@ class XPlaneUdpDatagram():
         TAG = tag_adjust("dg.CloseUDPSocket(): ")
         lResult = False
         if self.sock is not None:
+            if self.mcast_joined:
+                leave_multicast(pool, self.sock, self.MCAST_GRP, self.udp_host)
+                self.mcast_joined = False
             lResult = self.sock.close()
             if my_debug:
                 print(TAG+'result self.sock.close() = {}'.format(lResult), file=sys.stderr)
@@ -267,22 +245,8 @@ class XPlaneUdpDatagram():
         return self.sock
 
     def packet_has_data(self, packet):
-        TAG = tag_adjust("dg.packet_has_data(): ")
-        b_cnt = 0
-        le = len(packet)
-        # print(TAG+'packet contents= {}'.format(packet), file=sys.stderr)
-        if le >= 0:
-            for _ in range(le):
-                # print(TAG+'value byte nr {} is {}'.format(_, packet[_]), file=sys.stderr)
-                if packet[_] > 0:
-                    break
-                else:
-                    b_cnt += 1
-            if b_cnt == le or b_cnt == le -1:
-                if not my_debug:
-                    print(TAG+'{} nr of 0x00 bytes found. Packet doesn\'t contain data.'.format(b_cnt), file=sys.stderr)
-                return False
-        return True
+        # A packet without a header (all 0x00 bytes) has no data. See ingress.py
+        return len(packet) >= 4 and header_name(packet) != ''
 
     # Added 2023-03-27
     def datagram_test(self):
@@ -294,6 +258,7 @@ class XPlaneUdpDatagram():
         return lResult
 
     # Function created by Paulsk
+    @profile
     def GetUDPDatagram(self):
         TAG = tag_adjust("dg.GetUDPDatagram(): ")
         mcast_pack_str = "=4sl"
@@ -351,6 +316,8 @@ class XPlaneUdpDatagram():
                 self.size, self.sender = self.sock.recvfrom_into(self.packet)
                 if my_debug:
                     print(TAG+'contents received packet= {}'.format(self.packet), file=sys.stderr)
+                if self.ingress.check(self.packet, self.size) == 0:
+                    continue  # all-zero, wrong length, duplicate or unknown packet. See ingress.py
                 """The X-Plane 11 log.txt reports a message length 113 (= 0..112) but I discovered
                 that it is 0..113, thus 114 bytes"""
                 if not self.packet:
@@ -444,6 +411,7 @@ class XPlaneUdpDatagram():
             lcd.lcd_display_string_pos("ALT:       ft MSL ",4,0)
             lcd.lcd_display_string_pos('', 4, 20)
 
+    @profile
     def disp_hdg_alt(self):
         global xp, xp_grp, my_page_layout, main_group
         TAG= tag_adjust("disp_hdg_alt(): ")
@@ -457,6 +425,10 @@ class XPlaneUdpDatagram():
             if not my_debug:
                 print(TAG+'error: xp is None', file=sys.stderr)
             return
+        if self.use_poll:
+            # In poll mode XPlanePoller calls render_predicted() at the display frame rate
+            self.hdg_alt_lst = []
+            return
         if my_have_tft:
             if isinstance(self.hdg_alt_lst, list):
                 le = len(self.hdg_alt_lst)
@@ -469,214 +441,128 @@ class XPlaneUdpDatagram():
                     # Update this to change the size of the text displayed. Must be a whole number.
                     # print(TAG, file=sys.stderr,end='')
                     
-                    hdg_old = myVars.read("hdg_old")
-                    alt_old = myVars.read("alt_old")
-                    
                     try:
-                        for _ in range(le):
-                            x[_].scale = 2
-                            if _ == 0:
-                                hdg = round(int(self.hdg_alt_lst[_]))
-                                if hdg != hdg_old:
-                                    myVars.write("hdg_old", hdg)
-                                    disp_hdg_alt = True
-                                    x[_].text = "Hdg: " +str(hdg) + " mag"
-                            if _ == 1:
-                                alt = round(int(self.hdg_alt_lst[_]))
-                                if alt != alt_old:
-                                    myVars.write("alt_old", alt)
-                                    disp_hdg_alt = True
-                                    x[_].text = "Alt: " +str(alt) + " ftMSL"
-
-                            # print('{} '.format(author_lst[_]), file=sys.stderr, end='')
-                        # print('', file=sys.stderr) end='\n')
+                        if le >= 2:
+                            disp_hdg_alt = self.show_fields(self.GetFields())
                         if disp_hdg_alt:
                             my_page_layout.show_page(page_name="XPlane")
                             # tile_grid1.hidden=False
                             print(TAG+"showing page: XPlane")
                     except Exception as e:
                         print(TAG+'Error: {}'.format(e), file=sys.stderr)
-                time.sleep(2) # myVars.read("TFT_show_duration")) # in seconds
+                if not self.use_poll:
+                    time.sleep(2) # myVars.read("TFT_show_duration")) # in seconds
                 self.my_lcd_cleanup() # empty also self.hdg_alt_lst
                 print(TAG+"showing page: main")
                 
+    # Function by Paulsk
+    # Show the decoded values as set in the layout of the "XPlane" page (see xp_layout.py).
+    # Returns True if the display changed.
+    def show_fields(self, fields):
+        lo = myVars.read("xp_layout")
+        if lo is None:
+            hdg = fields.get('hding_mag')
+            alt = fields.get('CG_ftmsl')
+            if isinstance(hdg, float) and isinstance(alt, float):
+                return self.set_hdg_alt(hdg, alt)
+            return False
+        if lo.text_group.hidden:
+            x = myVars.read("xp")
+            if x is not None:
+                for lbl in x:
+                    lbl.text = ''  # the labels may still show XGPS data
+            lo.show_text(True)
+        changed = lo.render(fields)
+        if changed:
+            show_xplane_page()
+        return changed
+
+    # Function by Paulsk
+    # Show heading and altitude in the labels if their rounded values changed. Used when there is no layout.
+    # Returns True if the display changed.
+    def set_hdg_alt(self, hdg, alt):
+        x = myVars.read("xp")
+        if x is None:
+            return False
+        changed = False
+        hdg = round(hdg) % 360
+        alt = round(alt)
+        if hdg != myVars.read("hdg_old"):
+            myVars.write("hdg_old", hdg)
+            x[0].scale = 2
+            x[0].text = "Hdg: " +str(hdg) + " mag"
+            changed = True
+        if alt != myVars.read("alt_old"):
+            myVars.write("alt_old", alt)
+            x[1].scale = 2
+            x[1].text = "Alt: " +str(alt) + " ftMSL"
+            changed = True
+        if changed:
+            show_xplane_page()
+        return changed
+
+    # Function by Paulsk
+    # Feed the predictor with the values of the DATA packet just decoded.
+    def predictor_sample(self, now):
+        v17 = self.values_struct_17
+        v20 = self.values_struct_20
+        if not isinstance(v17['hding_mag'], float) or not isinstance(v20['CG_ftmsl'], float):
+            return
+        v16 = self.values_structs.get(16)  # created by msgs_unpack() when X-Plane sends group 16
+        rrad = v16['R_rad'] if v16 is not None else None
+        if isinstance(rrad, float):
+            hdg_rate = rrad * 57.29578  # yaw rate of DATA group 16 (angular velocities), rad/s to degrees/s
+        else:
+            hdg_rate = self.derived.turn_dps
+        gs = self.values_struct_3['vtrue_ktgs']
+        self.predictor.sample(now, v17['hding_mag'], v20['CG_ftmsl'], hdg_rate, self.derived.vs_fps,
+            v20['lat_deg'], v20['lon_deg'], gs if isinstance(gs, float) else 0.0, self.derived.track_deg)
+
+    # Function by Paulsk
+    # Called by XPlanePoller at the display frame rate. Shows the extrapolated heading and altitude.
+    def render_predicted(self, now):
+        if self.predictor.predict(now):
+            fields = self.GetFields()
+            fields['hding_mag'] = self.predictor.p_hdg
+            fields['CG_ftmsl'] = self.predictor.p_alt
+            return self.show_fields(fields)
+        return False
+
+    # Decode the 36 byte records of a DATA packet (without the 5 byte prologue) into self.values_structs.
+    # Each record is decoded by its group index with the layout of xp_tables.DATA_GROUPS.
+    @profile
     def msgs_unpack(self, packet):
         TAG= tag_adjust("dg.msgs_unpack(): ")
-        msg = (0,)  # create an empty tuple
-        p_bytes = [36, 36, 36, 36]
-        p_unpack_strs = ['self.udp_unpack_str_3', 'self.udp_unpack_str_17', 'self.udp_unpack_str_20', 'self.udp_unpack_str_102']
         messages = []
         if packet is not None:
             if my_debug:
                 print(TAG+'packet length= {} bytes'.format(len(packet)), file=sys.stderr)
                 print(TAG+'unpacking packet {}\n'.format(packet), file=sys.stderr)
-            for _ in range(4):
-                if _ == 0:
-                    #s = values_struct_3
-                    s = self.udp_unpack_str_3
-                elif _ == 1:
-                    #s = values_struct_17
-                    s = self.udp_unpack_str_17
-                elif _ == 2:
-                    #s = values_struct_20
-                    s = self.udp_unpack_str_20 
-                elif _ == 3:
-                    #s = values_struct_102
-                    s = self.udp_unpack_str_102
-                    
-                s_size = struct.calcsize(s)
-                
-                if my_debug:
-                    print(TAG+'using unpack string: \'{}\', size= {} bytes, value= \'{}\''.format(p_unpack_strs[_], s_size, s), file=sys.stderr)
-
-                if _ == 0:
-                    i1 = 0
-                    #i2 = s_size-1      # bytes   0 -  35
-                elif _ == 1:
-                    i1 = p_bytes[0]
-                    #i2 = (2*s_size)-1  # bytes  35 -  71
-                elif _ == 2:
-                    i1 = p_bytes[0] + p_bytes[1] 
-                    #i2 = (3*s_size)-1  # bytes  72 - 107
-                elif _ == 3:
-                    i1 = p_bytes[0] + p_bytes[1] + p_bytes[2] 
-                    #i2 = (4*s_size)-1  # bytes 108 - 143
-                
-                #p0 = packet[i1:i2] 
+            try:
+                messages = self.xf.data_unpack(packet)
+            except Exception as e:
+                print(TAG+'Error: {}'.format(e), file=sys.stderr)
+                self.decode_err_cnt += 1
+                leds.play('error')
+                raise RuntimeError
+            got_hdg = got_alt = False  # X-Plane sends the groups chosen in its Data Output screen, maybe not 17 or 20
+            for us in messages:
+                if us[0] == 17:
+                    got_hdg = True
+                elif us[0] == 20:
+                    got_alt = True
                 if my_debug:
-                    print(TAG +'unpacking from offset (i1) = {}, sub-packet= {}'.format(i1, packet[i1:]), file=sys.stderr)
-
-                try:
-                    us = struct.unpack_from(s, packet, i1)
-                    if my_debug:
-                        print(TAG+'us= {}\n'.format(us), file=sys.stderr)
-                    messages.append(us)
-                except Exception as e:
-                    print(TAG+'Error: {}'.format(e), file=sys.stderr)
-                    raise RuntimeError
-                i = 0
-                
-                if _ == 0:
-                    """
-                    self.values_struct_3 = { # udp_unpack_str01 = "iffffifff"
-                    'ID':          DUMMY_STR_INT,     # DATA and a NULL
-                    'vind_kias':   DUMMY_STR_FLOAT,   # FLOAT vind_kias   airspeed in knots indicated air speed
-                    'vind_keas':   DUMMY_STR_FLOAT,   # FLOAT vind_keas   airspeed in knots e... air speed
-                    'vtrue_ktas':  DUMMY_STR_FLOAT,   # FLOAT vtrue_ktas  true airspeed in knots
-                    'vtrue_ktgs':  DUMMY_STR_FLOAT,   # FLOAT vtrue_ktgs  true ground speed in knots
-                    'nothing':     DUMMY_STR_INT,     # INT filling
-                    'vind_mph':    DUMMY_STR_FLOAT,   # FLOAT vind_mph    indicated airspeed in miles-per-hour
-                    'vtrue_mphas': DUMMY_STR_FLOAT,   # FLOAT vtrue_mphas  true airspeed in miles-per-hour
-                    'vtrue_mphgs': DUMMY_STR_FLOAT    # FLOAT vtrue_mphgs  true groundspeed in miles-per-hour
-                    }
-                    """
-                    self.values_struct_3['ID']          = us[i]
-                    self.values_struct_3['vind_kias']   = us[i+1]
-                    self.values_struct_3['vind_keas']   = us[i+2]
-                    self.values_struct_3['vtrue_ktas']  = us[i+3]
-                    self.values_struct_3['vtrue_ktgs']  = us[i+4]
-                    self.values_struct_3['nothing']     = us[i+5]
-                    self.values_struct_3['vind_mph']    = us[i+6]
-                    self.values_struct_3['vtrue_mphas'] = us[i+7]
-                    self.values_struct_3['vtrue_mphgs'] = us[i+8]
-                    
-                    if my_debug:
-                        #print(TAG+'self.values_struct_3.keys() = {}\n'.format(self.values_struct_3.keys()), file=sys.stderr)
-                        print(TAG+'self.values_struct_3.items() = {}\n'.format(self.values_struct_3.items()), file=sys.stderr)
-                    
-                elif _ == 1:
-                    """
-                    self.values_struct_17 = { # udp_unpack_str02 = "ifffiffif"
-                    'ID':         DUMMY_STR_INT,
-                    'pitch_deg':  DUMMY_STR_FLOAT,
-                    'roll_deg':   DUMMY_STR_FLOAT,
-                    'hding_true': DUMMY_STR_FLOAT,
-                    'nothing1':   DUMMY_STR_INT,                   
-                    'hding_mag':  DUMMY_STR_FLOAT,
-                    'mavar_deg':  DUMMY_STR_FLOAT,
-                    'nothing2':   DUMMY_STR_INT,
-                    'mag_comp':   DUMMY_STR_FLOAT
-                    }
-                    """
-                    self.values_struct_17['ID']         = us[i]
-                    self.values_struct_17['pitch_deg']  = us[i+1]  
-                    self.values_struct_17['roll_deg']   = us[i+2]
-                    self.values_struct_17['hding_true'] = us[i+3]
-                    self.values_struct_17['nothing1']   = us[i+4]                
-                    self.values_struct_17['hding_mag']  = us[i+5]
-                    self.values_struct_17['mavar_deg']  = us[i+6]
-                    self.values_struct_17['nothing2']   = us[i+7]
-                    self.values_struct_17['mag_comp']   = us[i+8]
+                    print(TAG+'group {} ({}) = {}\n'.format(us[0], DATA_GROUPS[us[0]][0], self.values_structs[us[0]].items()), file=sys.stderr)
 
-                    if my_debug:
-                        #print(TAG+'self.values_struct_17.keys() = {}\n'.format(self.values_struct_17.keys()), file=sys.stderr)
-                        print(TAG+'self.values_struct_17.items() = {}\n'.format(self.values_struct_17.items()), file=sys.stderr)
-                    
-                elif _ == 2:
-                    """
-                    self.values_struct_20 = { # udp_unpack_str03 = "iffffffff"
-                    'ID':          DUMMY_STR_INT,
-                    'lat_deg':     DUMMY_STR_FLOAT,
-                    'lon_deg':     DUMMY_STR_FLOAT,
-                    'CG_ftmsl':    DUMMY_STR_FLOAT,
-                    'gear_ftagl':  DUMMY_STR_FLOAT,
-                    'terrn_ftmsl': DUMMY_STR_FLOAT,
-                    'p-alt_ftmsl': DUMMY_STR_FLOAT,
-                    'lat_orign':   DUMMY_STR_FLOAT,
-                    'lon_orign':   DUMMY_STR_FLOAT
-                    }
-                    """
-                    self.values_struct_20['ID']          = us[i]
-                    self.values_struct_20['lat_deg']     = us[i+1]
-                    self.values_struct_20['lon_deg']     = us[i+2]
-                    self.values_struct_20['CG_ftmsl']    = us[i+3]
-                    self.values_struct_20['gear_ftagl']  = us[i+4]
-                    self.values_struct_20['terrn_ftmsl'] = us[i+5]
-                    self.values_struct_20['p-alt_ftmsl'] = us[i+6]
-                    self.values_struct_20['lat_orign']   = us[i+7]
-                    self.values_struct_20['lon_orign']   = us[i+8]
-                    
-                    if my_debug:
-                        #print(TAG+'self.values_struct_20.keys() = {}\n'.format(self.values_struct_20.keys()), file=sys.stderr)
-                        print(TAG+'self.values_struct_20.items() = {}\n'.format(self.values_struct_20.items()), file=sys.stderr)
-                    
-                elif _ == 3:
-                    """
-                    self.values_struct_102 = { #  "iffffffii"  on: 2019-05-01 18h23PT udp_unpack_str04 = iiiiiiiif  --> old: "<ifffiiiff"  --> old unpack string: "ifiifffif"
-                    'ID':         DUMMY_STR_INT,
-                    'dme_nav01':  DUMMY_STR_FLOAT, # dme of nav1
-                    'dme_mode':   DUMMY_STR_FLOAT, # dme mode (1 = dme1, 2= dme2)
-                    'dme_found':  DUMMY_STR_FLOAT, # dme found  1.0000
-                    'dme_dist':   DUMMY_STR_FLOAT, # dme distance (nm)
-                    'dme_speed':  DUMMY_STR_FLOAT, # dme speed    (kts)
-                    'dme_time':   DUMMY_STR_FLOAT, # dme_time (time-to-station)
-                    'dme_n-typ':  DUMMY_STR_INT,   # dme n-typ (3.0000)
-                    'dme-3_freq': DUMMY_STR_INT,   # dme3 freq (this is the 3rd, dme receiver (usually not reacheable)
-                    }            
-                    """
-                    self.values_struct_102['ID']         = us[i]
-                    self.values_struct_102['dme_nav01']  = us[i+1]
-                    self.values_struct_102['dme_mode']   = us[i+2]
-                    self.values_struct_102['dme_found']  = us[i+3]
-                    self.values_struct_102['dme_dist']   = us[i+4]
-                    self.values_struct_102['dme_speed']  = us[i+5]
-                    self.values_struct_102['dme_time']   = us[i+6]
-                    self.values_struct_102['dme_n-typ']  = us[i+7]
-                    self.values_struct_102['dme-3_freq'] = us[i+8]    
-                    
-                    if my_debug:
-                        #print(TAG+'self.values_struct_102.keys() = {}\n'.format(self.values_struct_102.keys()), file=sys.stderr)
-                        print(TAG+'self.values_struct_102.items() = {}\n'.format(self.values_struct_102.items()), file=sys.stderr)                
- 
-                  
             le = len(messages)
             if le > 0:
-                #print(TAG+'messages = {}'.format(messages), file=sys.stderr)
-                if my_debug: 
+                if my_debug:
                     for _ in range(le):
                         print(TAG+'unpacked messege nr {} = \'{}\''.format(_+1, messages[_]), file=sys.stderr)
-                self.hdg_alt_lst.append(self.values_struct_17['hding_mag']) # mag compass heading
-                self.hdg_alt_lst.append(self.values_struct_20['CG_ftmsl']) # altitude
+                if got_hdg:
+                    self.hdg_alt_lst.append(self.values_struct_17['hding_mag']) # mag compass heading
+                if got_alt:
+                    self.hdg_alt_lst.append(self.values_struct_20['CG_ftmsl']) # altitude
                 if my_debug:
                     print(TAG+'self.hdg_alt_lst= {}'.format(self.hdg_alt_lst), file=sys.stderr)
         else:
@@ -686,8 +572,39 @@ class XPlaneUdpDatagram():
     # Two functions copied from: XPlane10UdpDataOutputReceiver.py  =
     # ==============================================================
 
+    # Function by Paulsk
+    # XGPS, XATT and XTRA packets are ASCII text, e.g.: b'XGPS1,-9.134567,38.774567,110.1234,271.1234,61.1234'
+    # The values and their labels are listed in xp_tables.CSV_TYPES.
+    def csv_unpack(self, packet, size):
+        TAG= tag_adjust("dg.csv_unpack(): ")
+        try:
+            return unpack_csv(packet, size)
+        except UnicodeError as e:
+            print(TAG+'Error: {}'.format(e), file=sys.stderr)
+            self.decode_err_cnt += 1
+        return []
+
+    # XGPS: longitude, latitude, altitude (m MSL), true heading and groundspeed (m/s)
+    def xgps_unpack(self, packet, size, lst=None):
+        if lst is None:
+            lst = self.csv_unpack(packet, size)
+        self.decode_err_cnt += self.xf.xgps_unpack(lst)
+        return self.values_xgps
+
+    # Function by Paulsk
+    # Collect the last decoded values of all DATA groups (and XGPS) into one dict, keyed by field name.
+    # The 'ID' and 'nothing' fillers are left out. The same dict object is reused. See xp_fields.py
+    def GetFields(self):
+        return self.xf.GetFields()
+
+    # Function by Paulsk
+    # Decode a packet without showing it. The relay can use an XPlaneFields directly (see XPlaneRelay.run()).
+    def DecodeFields(self, packet, size):
+        return self.xf.DecodeFields(packet, size)
+
     # Function copied from Charlylima's example file: XPlane10UdpDataOutputReceiver.py
     # Modifications, additions and documentary by Paulsk
+    @profile
     def DecodePacket(self):
         global my_debug
         TAG= tag_adjust("dg.DecodePacket(): ")
@@ -696,36 +613,49 @@ class XPlaneUdpDatagram():
         #  self.retval = []  # Do not empty the list here. It's done in dg.__init()
         headerlen = 5
         messagelen = 36
+        if not self.use_poll:
+            leds.tick()  # in poll mode XPlanePoller does this
 
-        # Convert packet header (bytearray) to string
-        header0 = self.packet[:headerlen-1]
-        header = ''
-        if my_debug:
-            print(TAG+'packet tail0 = \'{}\''.format(tail0), file=sys.stderr)
-            
-        for _ in range(len(header0)):
-            header += chr(header0[_])
+        header = header_name(self.packet)  # e.g. 'DATA'. The header is read as one integer
 
         if my_debug:
             print(TAG+'Going to decode packet with header \'{}\''.format(header), file=sys.stderr)
 
-        # Packet consists of 4 byte ASCII string header, 1 byte pad character and 9 items of each 4 bytes (=36 bytes) messages.
-        # copy message part of the parameter variable to self.packet (skip the first comma delimiter)
-        tail0 = self.packet[headerlen:]
-        if my_debug:
-            print(TAG+'going to unpack packet {}'.format(tail0), file=sys.stderr)
-        self.messages = self.msgs_unpack(tail0)
+        if header == 'DATA':
+            # Packet consists of 4 byte ASCII string header, 1 byte pad character and 9 items of each 4 bytes (=36 bytes) messages.
+            tail0 = self.packet[headerlen:self.size]
+            if my_debug:
+                print(TAG+'going to unpack packet {}'.format(tail0), file=sys.stderr)
+            self.messages = self.msgs_unpack(tail0)
+        elif header in CSV_TYPES:
+            self.messages = self.csv_unpack(self.packet, self.size)
+            if header == 'XGPS':
+                self.xgps_unpack(self.packet, self.size, self.messages)
+        else:
+            self.messages = []
         if my_debug:
             print(TAG+'unpacked messages= {}'.format(self.messages), file=sys.stderr)
 
         # We have an udp datagram!
         myVars.write("xp_lst", self.messages) # save it
 
+        if header == 'DATA':
+            now = time.monotonic()
+            self.derived.update(now, self.GetFields())
+            self.predictor_sample(now)
+            if my_debug:
+                d = self.derived
+                print(TAG+'V/S: {:.0f} ft/min, turn: {:.2f} deg/s, track: {:.0f}, wind: {:.1f} kts, dist: {:.2f} nm'.format(
+                    d.vs_fpm, d.turn_dps, d.track_deg, d.wind_kts, d.dist_nm), file=sys.stderr)
+
         self.DispMessage(header, self.messages)
+        t0 = time.monotonic_ns()
         gc.collect()
+        self.gc_pause_s = (time.monotonic_ns() - t0) / 1e9  # observed by XPlanePoller for the metrics
         return self.messages
 
 
+    @profile
     def DispMessage(self, header, msg_lst):
         # global xp, xp_grp, my_page_layout
         TAG= tag_adjust("dg.DispMessage(): ")
@@ -735,19 +665,13 @@ class XPlaneUdpDatagram():
         ptu = myVars.read("packet_types_used")
         loop_nr = myVars.read("main_loop_nr")
 
-        if 'XGPS' in ptu:
-            xgps_lst = ['LON', 'LAT', 'ALT', 'HDG',  'GS']
-            xgps_lst_2 = ['',  '',    'm',   'true', 'm/s']
-
-        if 'XATT' in ptu:
-            xatt_lst =   ['HDG', 'PITCH', 'ROLL', 'Roll-rate','Pitch-rate', 'Yaw-rate', 'SPD_TRUE_EAST', 'SPD_TRUE_UP', 'SPD_TRUE_SOUTH', 'G-Load side', 'G-Load normal', 'G-Load axial']
-            xatt_lst_2 = ['true', 'degs', 'degs', 'rad/s',    'rad/s',      'rad/s',    'm/s',           'm/s',          'm/s',           'G',           'G',             'G',]
-
-        if 'XTRA' in ptu:
-            xtra_lst   = ['LAT', 'LON', 'ALT', 'V/S',    'ON_GND',     'HDG',  'GS',  'TAIL NR']
-            xtra_lst_2 = ['',    '',    'ft',  'ft/min', 'True/False', 'true', 'kts', '']
+        labels = csv_labels(header)  # labels and units of XGPS, XATT and XTRA. See xp_tables.py
+        if labels is not None:
+            lbl_lst, lbl_lst_2 = labels
 
         le = len(msg_lst)
+        if labels is not None and le > len(lbl_lst):
+            le = len(lbl_lst)
 
         # print(TAG+'header= {}'.format(header), file=sys.stderr)
 
@@ -771,12 +695,11 @@ class XPlaneUdpDatagram():
                     for _ in range(le):
                             if my_debug:
                                 print(TAG+'first loop: index= {}'.format(_), file=sys.stderr)
-                            if header == 'XGPS':
-                                s = '\t{:14s} {:8.4f} {:s}'.format(xgps_lst[_], float(msg_lst[_]), xgps_lst_2[_])
-                            elif header == 'XATT':
-                                s = '\t{:14s} {:8.4f} {:s}'.format(xatt_lst[_], float(msg_lst[_]), xatt_lst_2[_])
-                            elif header == 'XTRA':
-                                s = '\t{:14s} {:8.4f} {:s}'.format(xtra_lst[_], float(msg_lst[_]), xtra_lst_2[_])
+                            if labels is not None:
+                                if isinstance(msg_lst[_], float):
+                                    s = '\t{:14s} {:8.4f} {:s}'.format(lbl_lst[_], msg_lst[_], lbl_lst_2[_])
+                                else:
+                                    s = '\t{:14s} {:>8s} {:s}'.format(lbl_lst[_], msg_lst[_], lbl_lst_2[_])
                             if len(s) > 0:
                                 print(s, file=sys.stderr)
                     #if header == 'XGPS':
@@ -784,6 +707,8 @@ class XPlaneUdpDatagram():
                     print(ln, file=sys.stderr)
                 except Exception as e:
                     print(TAG+'Error {}'.format(e), file=sys.stderr)
+                    self.decode_err_cnt += 1
+                    leds.play('error')
                     raise RuntimeError
                 except KeyboardInterrupt:
                     myVars.write("kbd_intr", True)
@@ -812,20 +737,20 @@ class XPlaneUdpDatagram():
                             if my_debug:
                                 print(TAG+'second loop: index= {}'.format(_), file=sys.stderr)
                             #xp[_].scale = 2
-                            if header == 'XGPS':
-                                s = '{} {} {}'.format(xgps_lst[_], msg_lst[_], xgps_lst_2[_])
-                            elif header == 'XATT':
-                                s = '{} {} {}'.format(xatt_lst[_], msg_lst[_], xatt_lst_2[_])
-                            elif header == 'XTRA':
-                                s = '{} {} {}'.format(xtra_lst[_], msg_lst[_], xtra_lst_2[_])
+                            if labels is not None:
+                                s = '{} {} {}'.format(lbl_lst[_], msg_lst[_], lbl_lst_2[_])
 
                     if header == 'XGPS':
                         hdg = round(float(msg_lst[3])) # round the heading value
                         if my_debug:
                             print(TAG+'hdg= {}'.format(hdg), file=sys.stderr)
-                        s = '{} {} {}'.format(xgps_lst[3], hdg, xgps_lst_2[3])
+                        s = '{} {} {}'.format(lbl_lst[3], hdg, lbl_lst_2[3])
                         if my_debug:
                             print(TAG+'Adding {} element {}'.format(header, s), file=sys.stderr)
+                        lo = myVars.read("xp_layout")
+                        if lo is not None:
+                            lo.show_text(False)  # the labels show XGPS data now
+                            lo.render(self.values_xgps)  # e.g. a heading tape bound to 'HDG'
                         xp[0].scale=2
                         xp[0].text = 'X-Plane ' + myVars.read('xplane_version')
                         xp[1].scale=3
@@ -835,14 +760,18 @@ class XPlaneUdpDatagram():
                         #print(TAG+'type(my_page_layout)= {}'.format(type(my_page_layout)), file=sys.stderr)
                         myVars.write("xp", xp)
 
-                        my_page_layout.show_page(page_name="XPlane")
+                        show_xplane_page()
                         blink_NEO_color(neo_led_green) # blink the Neopixel led in green (see: common.py)
-                        time.sleep(myVars.read("TFT_show_duration")) # in seconds
+                        if not self.use_poll:
+                            leds.tick()
+                            time.sleep(myVars.read("TFT_show_duration")) # in seconds
 
                 except KeyboardInterrupt:
                     myVars.write("kbd_intr", True)
                 except Exception as e:
                     print(TAG+'Error {}'.format(e), file=sys.stderr)
+                    self.decode_err_cnt += 1
+                    leds.play('error')
                     raise RuntimeError
 
     # Function by Paulsk
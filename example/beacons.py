@@ -0,0 +1,106 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Table of the X-Plane hosts on the LAN, filled from their BECN (beacon) packets.
+# X-Plane sends a beacon about once per second. An entry is kept per host IP-address with its
+# role (1 = master, 2 = external visual, 3 = IOS), X-Plane version, RREF port, hostname and the time
+# the last beacon was seen. Entries not seen for 'ttl' seconds are evicted.
+# select() picks the host to subscribe to, following 'policy' (BEACON_POLICY in settings.toml):
+#   "master"     only a master (role 1)
+#   "any"        a master if there is one, else any X-Plane host
+#   <hostname>   the host with that name if it is alive, else as "master"
+# Between equal candidates the newest X-Plane version wins, then the host heard from last.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import struct
+import time
+
+ROLE_MASTER = 1
+ROLE_VISUAL = 2
+ROLE_IOS = 3
+ROLES = {ROLE_MASTER: 'master', ROLE_VISUAL: 'visual', ROLE_IOS: 'IOS'}
+BEACON_GROUP = "239.255.1.1"  # X-Plane sends its beacons to this multicast group and port
+BEACON_PORT = 49707
+
+def parse_beacon(packet, size):
+    """Decode a BECN packet. Returns a dict or None if it is not a beacon of X-Plane (application host id 1).
+    struct becn_struct: uchar major, uchar minor, xint application_host_id, xint version_number,
+    uint role, ushort port, xchr computer_name[]"""
+    if size < 21 or packet[0:4] != b'BECN':
+        return None
+    major, minor, app_id, version, role, port = struct.unpack_from("<BBiiIH", packet, 5)
+    # X-Plane 10.40 sends minor version 1, X-Plane 11 and 12 send 2
+    if major != 1 or app_id != 1:
+        return None
+    name = bytes(packet[21:size])
+    i = name.find(b'\x00')
+    if i >= 0:
+        name = name[:i]
+    return {
+        "minor": minor,
+        "XPlaneVersion": version,
+        "role": role,
+        "Port": port,
+        "hostname": name.decode(),
+    }
+
+
+class BeaconTable():
+
+    def __init__(self, ttl=3.0, policy="master"):
+        self.ttl = ttl
+        self.policy = policy
+        self.hosts = {}  # key = IP-address, value = dict of parse_beacon() plus "IP" and "seen"
+        self.rx_cnt = 0
+        self.evict_cnt = 0
+
+    def update(self, packet, size, addr, now=None):
+        """Enter the beacon of addr in the table. Returns the entry, or None if it is not an X-Plane beacon"""
+        b = parse_beacon(packet, size)
+        if b is None or addr is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        b["IP"] = addr[0]
+        b["seen"] = now
+        self.hosts[addr[0]] = b
+        self.rx_cnt += 1
+        return b
+
+    def evict(self, now=None):
+        """Remove the hosts not heard from within ttl seconds. Returns the nr removed"""
+        if now is None:
+            now = time.monotonic()
+        old = [ip for ip, b in self.hosts.items() if now - b["seen"] > self.ttl]
+        for ip in old:
+            del self.hosts[ip]
+        self.evict_cnt += len(old)
+        return len(old)
+
+    def accepts(self, b):
+        """True if the policy allows the host of entry b"""
+        return b["role"] == ROLE_MASTER or b["hostname"] == self.policy or self.policy == "any"
+
+    def select(self, now=None, exclude=None):
+        """The entry of the host to use, or None. exclude: an IP-address not to choose (e.g. a silent host)"""
+        self.evict(now)
+        best = None
+        best_key = None
+        for ip, b in self.hosts.items():
+            if ip == exclude:
+                continue
+            if not self.accepts(b):
+                continue
+            k = (b["hostname"] == self.policy, b["role"] == ROLE_MASTER, b["XPlaneVersion"], b["seen"])
+            if best_key is None or k > best_key:
+                best = b
+                best_key = k
+        return best
+
+    def summary(self):
+        return ", ".join("{} {} ({}, {})".format(b["hostname"], ip, ROLES.get(b["role"], b["role"]), b["XPlaneVersion"])
+            for ip, b in self.hosts.items())
@@ -4,3 +4,13 @@
 ##############################
 import supervisor
 supervisor.status_bar.console = True
+
+# The flight recorder (see flight_recorder.py) writes to the CIRCUITPY drive.
+# That needs the drive to be writable for code.py. It is then read-only for the computer connected by USB.
+# Set FLIGHT_RECORDER="0" in settings.toml (or write to an SD card) to edit the files from the computer again.
+# The same for the results file of the benchmark mode (BENCHMARK="1", see xp_bench.py).
+import os
+if (os.getenv("FLIGHT_RECORDER") == "1" and not os.getenv("RECORDER_PATH", "/flight.rec").startswith("/sd")) or \
+        (os.getenv("BENCHMARK") == "1" and not os.getenv("BENCHMARK_FILE", "/bench.json").startswith("/sd")):
+    import storage
+    storage.remount("/", readonly=False)
@@ -35,6 +35,9 @@
 # The Feather ESP32-S2 TFT is often receiving a different LAN IP-address
 # for this we have to alter the IP-address in XPlane-12 !
 # Resolution could be: have the feather device obtain a fixed IP-address
+# Update: with USE_UDP_HOST="0" the device joins the multicast group MULTICAST_GROUP2.
+# Set the X-Plane data output IP to that group. Then the DHCP address of the device
+# does not matter and any number of displays can share one X-Plane output stream.
 # ---------------------------------------------------------
 # 2023-04-22 Changed WiFi SSID and PW in secrets.py and in settings.toml because of new Vodafone router & Vodafone WiFi extender
 #type:ignore
@@ -59,6 +62,15 @@ from adafruit_lc709203f import LC709203F
 from common import *
 from XPlaneDatarefRx import *
 from XPlaneUdpDatagram import *
+from XPlanePoller import XPlanePoller
+from XPlaneRelay import XPlaneRelay
+from xp_layout import XPLayout, load_spec
+from sensors import SensorService
+from stats import PipelineStats
+from metrics_http import MetricsRegistry, MetricsServer
+from flight_recorder import FlightRecorder
+from config_watch import ConfigWatch
+from xp_bench import canned_data, run as xp_bench_run
 
 # Most global flags moved to common.py
 
@@ -78,6 +90,7 @@ def scan_i2c():
 
 led = digitalio.DigitalInOut(board.LED)
 led.direction = digitalio.Direction.OUTPUT
+leds.led = led  # the red LED is animated together with the NeoPixel
 
 i2c = board.I2C()
 
@@ -85,6 +98,26 @@ scan_i2c()
 
 bat_sensor = LC709203F(i2c)
 
+# I2C sensors are read on their own interval by sensors.poll(). The display reads the cache.
+sensors = SensorService()
+low_bat_pct = int(os.getenv("LOW_BAT_PCT", "15"))
+
+def read_bat():
+    bat = (bat_sensor.cell_voltage, bat_sensor.cell_percent)
+    leds.set_condition('low_battery', bat[1] < low_bat_pct)  # blink orange until the battery is charged
+    return bat
+
+sensors.register("battery", read_bat, int(os.getenv("BAT_INTERVAL", "30")))
+if use_tmp_sensor:
+    try:
+        import adafruit_tmp117
+        tmp117 = adafruit_tmp117.TMP117(i2c)
+        temp_sensor_present = True
+        sensors.register("temp", lambda: tmp117.temperature, int(os.getenv("TEMP_INTERVAL", "10")))
+    except (ImportError, ValueError, OSError) as e:
+        temp_sensor_present = False
+        print("TMP117 sensor not available: {}".format(e), file=sys.stderr)
+
 if use_wifi:
     #import wifi        # Already imported in common.py
     #import socketpool  # idem
@@ -193,23 +226,10 @@ def disp_logo(choice):
     #    myVars.write("kbd_intr", True)
 
 def blink():
-    for _ in range(blink_cycles):
-        led.value = True
-        time.sleep(0.1)
-        led.value = False
-        time.sleep(0.5)
+    leds.play('led')  # non-blocking, see led_anim.py
 
 def blink_NEO():
-    br = 50  # was 255
-    pixel.brightness = 0.3
-    for _ in range(blink_cycles):
-        pixel.fill((br, 0, 0))
-        time.sleep(0.5)
-        pixel.fill((0, br, 0))
-        time.sleep(0.5)
-        pixel.fill((0, 0, br))
-        time.sleep(0.5)
-    pixel.fill((0, 0, 0))
+    leds.play('rgb')
 
 def wifi_is_connected():
     global ip, s_ip
@@ -228,7 +248,7 @@ def wifi_is_connected():
 def create_groups():
     global main_group, ba_grp, dt_grp, ta1_grp, ta2_grp, te_grp, logo1_grp, logo2_grp, tile_grid0, tile_grid1
     global tile_grid2, ba, dt, ta1, ta2, te, xp, my_page_layout, img_lst
-    global xp_grp #, xp_xgps_grp, xp_xtra_grp
+    global xp_grp, st, st_grp #, xp_xgps_grp, xp_xtra_grp
     TAG= tag_adjust("create_groups(): ")
     tmp_grp = None
     k = ''
@@ -236,13 +256,14 @@ def create_groups():
         ax = 156
     else:
         ax = 120
-    grp_dict = {  # ba = battery, dt = datetime, ta1 = ID, ta2 = Author, xp = XPlane
+    grp_dict = {  # ba = battery, dt = datetime, ta1 = ID, ta2 = Author, xp = XPlane, st = Stats
         'ba': {'nr_items': 1, 'scale': 2, 'anchor_point': (0.5, 0.5),
             'anchored_position': (display.width // 2, display.height // 2), 'vpos_increase': 0},
         'dt':  {'nr_items': 2, 'scale': 3, 'anchor_point': (0.5, 0.5), 'anchored_position': (120, 50), 'vpos_increase': 40},
         'ta1': {'nr_items': 3, 'scale': 3, 'anchor_point': (0.5, 0.5), 'anchored_position': (120, 40), 'vpos_increase': 30},
         'ta2': {'nr_items': 3, 'scale': 3, 'anchor_point': (0.5, 0.5), 'anchored_position': (ax,  40), 'vpos_increase': 30},
         'xp':  {'nr_items': 3, 'scale': 2, 'anchor_point': (0.5, 0.5), 'anchored_position': (120, 40), 'vpos_increase': 40},
+        'st':  {'nr_items': 1, 'scale': 1, 'anchor_point': (0.0, 0.0), 'anchored_position': (4, 4), 'vpos_increase': 0},
     }
 
     for _ in range(len(img_lst)):
@@ -318,8 +339,17 @@ def create_groups():
             elif grp_lst[i] == 'xp':
                 xp = tmp
                 myVars.write("xp", xp) # to be used in dg.DispMessage()
+                # Flight values of DATA packets, placed as set in the layout spec (see xp_layout.py)
+                xp_layout = XPLayout(load_spec(os.getenv("XP_LAYOUT", ""), dg.dme3_or_gs), display.width)
+                xp_layout.show_text(False)  # shown by dg.show_fields()
+                tmp_grp.append(xp_layout.group)
+                myVars.write("xp_layout", xp_layout)
                 xp_grp = tmp_grp
                 my_page_layout.add_content(xp_grp, "XPlane")
+            elif grp_lst[i] == 'st':      #  used by stats.PipelineStats
+                st = tmp
+                st_grp = tmp_grp
+                my_page_layout.add_content(st_grp, "Stats")
 
         # add it to the group that is showing on the display
         main_group.append(my_page_layout)
@@ -331,10 +361,14 @@ def disp_bat(warn):
         print(TAG+"LC709203F test", file=sys.stderr)
         print(TAG+"Make sure LiPoly battery is plugged into the board!", file=sys.stderr)
         print(TAG+"Battery IC version:", hex(bat_sensor.ic_version), file=sys.stderr)
+    bat = sensors.get("battery", refresh=True)  # (cell_voltage, cell_percent), from the cache if not stale
+    if bat is None:
+        print(TAG+"no battery reading", file=sys.stderr)
+        return
     s1 = "Battery:\n{:.1f} Volts \n{}%"
     s2 = "Battery: {:.1f} Volts, {}% charged"
-    s3 = s1.format(bat_sensor.cell_voltage, bat_sensor.cell_percent)
-    s4 = s2.format(bat_sensor.cell_voltage, bat_sensor.cell_percent)
+    s3 = s1.format(bat[0], bat[1])
+    s4 = s2.format(bat[0], bat[1])
     ba[0].text = s3
     my_page_layout.show_page(page_name="Battery")
     if not my_debug:
@@ -343,16 +377,27 @@ def disp_bat(warn):
     print(TAG+s4, file=sys.stderr)
     time.sleep(myVars.read("TFT_show_duration")) # in seconds
 
+def disp_temp():
+    global ba, old_temp, temp_update_cnt
+    TAG= tag_adjust("disp_temp(): ")
+    t = sensors.get("temp")
+    if t is None:
+        return
+    t = round(t, 1)
+    if t != old_temp:
+        old_temp = t
+        temp_update_cnt += 1
+        ba[0].text = "Temperature:\n{:.1f} C".format(t)
+        my_page_layout.show_page(page_name="Battery")
+        print(TAG+"temperature: {:.1f} C".format(t), file=sys.stderr)
+        time.sleep(myVars.read("TFT_show_duration")) # in seconds
+
 def get_options():
     TAG= tag_adjust("get_options(): ")
     m_grp = m_port = None
     hlp = None
     sHlp = ''
-    sDme = ''
-    sGs = ''
-    dme = None
-    gs = None
-    for i in range(0, 1):
+    for i in range(0, 2):
         if i == 0:
             sHlp = os.getenv("HELP") # secrets.get("HELP", None)
             if my_debug:
@@ -364,23 +409,26 @@ def get_options():
                     return True
 
         if i == 1:
-            sDme = os.getenv("lDME") # secrets.get("lDME", None) # Boolean
-            sGs = os.getenv("lGROUNDSPEED") # secrets.get("lGROUNDSPEED", None) # Boolean
-            assert(sDme is not None), f"settings.toml: lDME cannot be None. Got {sDme}"
-            assert(sGs is not None), f"settings.toml: lGROUNDSPEED cannont be None. Got {sGs}"
-
-            dme = int(sDme)
-            gs = int(sGs)
-            if dme == True:
-                dg.dme3_or_gs = dme # The flag is set. We're going to display the DME3 frequency.
-            elif gs == True:
-                dg.dme3_or_gs = False  # The flag is cleared. We're going to display the groundspeed.
+            get_dme_option()
 
     return True
 
+def get_dme_option():
+    sDme = os.getenv("lDME") # secrets.get("lDME", None) # Boolean
+    sGs = os.getenv("lGROUNDSPEED") # secrets.get("lGROUNDSPEED", None) # Boolean
+    assert(sDme is not None), f"settings.toml: lDME cannot be None. Got {sDme}"
+    assert(sGs is not None), f"settings.toml: lGROUNDSPEED cannont be None. Got {sGs}"
+
+    dme = int(sDme)
+    gs = int(sGs)
+    if dme == True:
+        dg.dme3_or_gs = dme # The flag is set. We're going to display the DME3 frequency.
+    elif gs == True:
+        dg.dme3_or_gs = False  # The flag is cleared. We're going to display the groundspeed.
+
 
 def setup():
-    global lcd, uart, ssid, ADAFRUIT_IO_USERNAME, ADAFRUIT_IO_KEY, TIME_URL, location, tz_offset, author_lst, ssid, password, dg, dr
+    global lcd, uart, ssid, ADAFRUIT_IO_USERNAME, ADAFRUIT_IO_KEY, TIME_URL, location, tz_offset, author_lst, ssid, password, dg, dr, xpoll
     TAG = tag_adjust("setup(): ")
     if my_debug:
         print(TAG+"...", file=sys.stderr)
@@ -388,6 +436,12 @@ def setup():
     dg = XPlaneUdpDatagram()  # Create an instance of the XPlaneUdpDatagram class object
     #main(sys.argv[1:]
     dr = XPlaneDatarefRx()    # Create an instance of the XPlaneDatarefRx class object
+    xpoll = XPlanePoller(dg, dr)  # Polls the sockets of both dg and dr without blocking
+    xpoll.sensors = sensors       # sensors are read between the packets
+    if os.getenv("RELAY") == "1":
+        # Re-publish the decoded values to the displays listed in the relay config file
+        relay_cfg = os.getenv("RELAY_CONFIG")
+        xpoll.relay = XPlaneRelay(make_pool(), dg, relay_cfg if relay_cfg else "relay.json")
 
     # Get our username, key and desired timezone
     ADAFRUIT_IO_USERNAME = os.getenv("ADAFRUIT_IO_USERNAME")
@@ -458,6 +512,97 @@ def setup():
             print(TAG+"cmd line options successfully loaded from file \'settings.toml\'", file=sys.stderr)
 
     create_groups()
+    # Packet rates, drops, errors, loop rate and free heap on the "Stats" page (BOOT button) and the serial output
+    xpoll.stats = PipelineStats(xpoll, st[0], print_interval=int(os.getenv("STATS_PRINT_INTERVAL", "10")))
+    if os.getenv("FLIGHT_RECORDER") == "1":
+        # Needs a writable filesystem: see boot.py
+        rec = FlightRecorder(os.getenv("RECORDER_FIELDS", "hding_mag,CG_ftmsl").split(','),
+            os.getenv("RECORDER_PATH", "/flight.rec"), nr_blocks=int(os.getenv("RECORDER_BLOCKS", "64")),
+            flush_interval=int(os.getenv("RECORDER_FLUSH", "10")), compress=os.getenv("RECORDER_COMPRESS") == "1")
+        if rec.open():
+            xpoll.recorder = rec
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if metrics_port > 0:
+        xpoll.metrics = MetricsServer(make_pool(), create_metrics(), metrics_port)
+    xpoll.config = create_config_watch()
+
+def create_config_watch():
+    # Settings that are reapplied while running when settings.toml is edited (see config_watch.py).
+    # A long press of the BOOT button reloads at once.
+    cw = ConfigWatch(int(os.getenv("CONFIG_WATCH_INTERVAL", "30")))
+    cw.watch("socket", ("USE_UDP_HOST", "MULTICAST_GROUP1", "MULTICAST_GROUP2", "MULTICAST_PORT1", "MULTICAST_PORT2"),
+        reload_socket)
+    cw.watch("packet types", ("PACKET_TYPES_USED",), lambda c: myVars.write("packet_types_used", c["PACKET_TYPES_USED"]))
+    cw.watch("show duration", ("TFT_SHOW_DURATION",),
+        lambda c: myVars.write("TFT_show_duration", int(c["TFT_SHOW_DURATION"] or "5")))
+    cw.watch("layout", ("lDME", "lGROUNDSPEED", "XP_LAYOUT"), reload_layout)
+    cw.watch("frame rate", ("DISPLAY_FPS",), reload_fps)
+    cw.watch("stats", ("STATS_PRINT_INTERVAL",),
+        lambda c: setattr(xpoll.stats, "print_interval", int(c["STATS_PRINT_INTERVAL"] or "0")))
+    cw.watch("sensors", ("BAT_INTERVAL", "TEMP_INTERVAL"), reload_sensors)
+    xpoll.stats.on_long_press = cw.request
+    return cw
+
+def reload_socket(changed):
+    myVars.write("use_udp_host", os.getenv("USE_UDP_HOST"))
+    myVars.write("multicast_group1", os.getenv("MULTICAST_GROUP1"))
+    myVars.write("multicast_group2", os.getenv("MULTICAST_GROUP2"))
+    myVars.write("multicast_port1", int(os.getenv("MULTICAST_PORT1")))
+    myVars.write("multicast_port2", int(os.getenv("MULTICAST_PORT2")))
+    grp, port = dg.MCAST_GRP, dg.MCAST_PORT
+    dg.set_mcast()
+    if (dg.MCAST_GRP, dg.MCAST_PORT) != (grp, port):  # only the settings of the other mode changed: keep the socket
+        xpoll.reopen_dg()
+
+def reload_layout(changed):
+    global xp_grp
+    get_dme_option()
+    old = myVars.read("xp_layout")
+    lo = XPLayout(load_spec(os.getenv("XP_LAYOUT", ""), dg.dme3_or_gs), display.width)
+    lo.show_text(False)
+    if old is not None:
+        xp_grp.remove(old.group)
+    xp_grp.append(lo.group)
+    myVars.write("xp_layout", lo)
+
+def reload_fps(changed):
+    fps = int(changed["DISPLAY_FPS"] or "10")
+    myVars.write("display_fps", fps)
+    xpoll.frame_interval = 1.0 / fps if fps else 0.1
+
+def reload_sensors(changed):
+    if "BAT_INTERVAL" in changed:
+        sensors.set_interval("battery", int(changed["BAT_INTERVAL"] or "30"))
+    if "TEMP_INTERVAL" in changed and "temp" in sensors.sensors:
+        sensors.set_interval("temp", int(changed["TEMP_INTERVAL"] or "10"))
+
+def create_metrics():
+    # The metrics served by metrics_http.MetricsServer, for scraping by Prometheus
+    t_start = time.monotonic()
+    reg = MetricsRegistry()
+    ingress = xpoll.ingress
+    reg.counter("packets_total", "Packets accepted per header type", lambda: ingress.type_cnt, label="type")
+    reg.counter("packets_rejected_total", "Packets dropped by the ingress stage per reason",
+        lambda: {k: ingress.counters[k] for k in ('dup', 'zero', 'short', 'bad_len', 'unknown')}, label="reason")
+    reg.counter("decode_errors_total", "Packets that could not be decoded", lambda: dg.decode_err_cnt)
+    reg.counter("rref_timeouts_total", "Times no RREF packet arrived in time", lambda: xpoll.rref_timeout_cnt)
+    reg.counter("host_failovers_total", "Times the RREF subscription moved to another X-Plane host",
+        lambda: xpoll.failover_cnt)
+    reg.gauge("xplane_hosts", "X-Plane hosts heard from (BECN)", lambda: len(xpoll.beacons.hosts))
+    reg.counter("loops_total", "Passes of the receive loop", lambda: xpoll.loop_cnt)
+    reg.gauge("heap_free_bytes", "Free heap", gc.mem_free)
+    reg.gauge("wifi_rssi_dbm", "RSSI of the WiFi access point",
+        lambda: wifi.radio.ap_info.rssi if wifi.radio.ap_info is not None else None)
+    reg.gauge("battery_volts", "Battery voltage (cached reading)",
+        lambda: sensors.get("battery")[0] if sensors.get("battery") is not None else None)
+    reg.gauge("uptime_seconds", "Seconds since start", lambda: time.monotonic() - t_start)
+    xpoll.h_decode = reg.histogram("decode_seconds", "Time to decode and show a UDP Datagram",
+        (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5))
+    xpoll.h_refresh = reg.histogram("refresh_seconds", "Time of a display frame that changed the display",
+        (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1))
+    xpoll.h_gc = reg.histogram("gc_pause_seconds", "Duration of gc.collect() after a packet",
+        (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05))
+    return reg
 
 def disp_id():
     global ta1
@@ -758,6 +903,46 @@ if my_have_lcd:
 # The 4th class moved to file XPlaneUpdDatagram.py      =
 # =======================================================
 
+def benchmark():
+    # Times the stages of the display pipeline on this board instead of running main(). See xp_bench.py
+    TAG = tag_adjust("benchmark(): ")
+    n = max(1, int(os.getenv("BENCHMARK_ITERATIONS", "100")))
+    payload = canned_data()
+    lbl = xp[0]
+    colors = (0x000010, 0x100000)
+    pages = ("XPlane", "Stats")
+    port = 49999
+    ip = str(wifi.radio.ipv4_address) if wifi_is_connected() else "127.0.0.1"
+    a_pool = make_pool()
+    rx = a_pool.socket(a_pool.AF_INET, a_pool.SOCK_DGRAM)
+    rx.bind((ip, port))
+    rx.settimeout(1.0)
+    tx = a_pool.socket(a_pool.AF_INET, a_pool.SOCK_DGRAM)
+    rx_buf = bytearray(len(payload) + 5)
+    tx_buf = b'DATA\x00' + payload
+
+    def udp_loopback(i):
+        tx.sendto(tx_buf, (ip, port))
+        rx.recvfrom_into(rx_buf)
+
+    stages = [
+        ("msgs_unpack", lambda i: dg.msgs_unpack(payload)),
+        ("label_text", lambda i: setattr(lbl, "text", str(i))),
+        ("display_refresh", lambda i: display.refresh()),
+        ("show_page", lambda i: my_page_layout.show_page(page_name=pages[i & 1])),
+        ("udp_sendto_recvfrom_into", udp_loopback),
+        ("i2c_battery", lambda i: bat_sensor.cell_voltage),
+        ("neopixel", lambda i: pixel.__setitem__(0, colors[i & 1])),
+    ]
+    print(TAG+"{} stages, {} iterations each".format(len(stages), n), file=sys.stderr)
+    display.auto_refresh = False
+    try:
+        xp_bench_run(stages, n, os.getenv("BENCHMARK_FILE", "/bench.json"), {"loopback_ip": ip})
+    finally:
+        display.auto_refresh = True
+        rx.close()
+        tx.close()
+
 # =======================
 #   Start of main()     =
 # =======================
@@ -792,7 +977,8 @@ def main():
     stop = False
     opts = []
     do_dr_test = False
-    do_dg_test = True
+    do_dg_test = False
+    do_poll = True   # poll both the datagram and the dataref socket. See XPlanePoller.py
 
     if not my_debug:
         # print(TAG+'We entered main()', file=sys.stderr)
@@ -875,7 +1061,7 @@ def main():
         time.sleep(delay)
         if use_tmp_sensor:
             if temp_sensor_present:
-                # disp_temp()
+                disp_temp()
                 if myVars.read("kbd_intr"):
                     stop = True
                     # break
@@ -918,8 +1104,11 @@ def main():
             #if not my_debug:
             #    print(TAG+'Loop nr: {:03d}'.format(cnt), file=sys.stderr)
             if not my_debug:
-                print(TAG+'We are going to run a data{} test...'.format("ref" if do_dr_test else "gram" if do_dg_test else " ?"), file=sys.stderr)
+                print(TAG+'We are going to run a data{} test...'.format("ref" if do_dr_test else "gram" if do_dg_test else " poll" if do_poll else " ?"), file=sys.stderr)
             try:
+                if do_poll:
+                    xpoll.run() # Loops until a KeyboardInterrupt
+
                 if do_dr_test:
                     print(TAG+'type(dr)= {}'.format(type(dr)), file=sys.stderr)
                     print(TAG+'contents dr= {}'.format(dr), file=sys.stderr)
@@ -1085,7 +1274,11 @@ if __name__ == "__main__":
 
     #dr = XPlaneDatarefRx()    # Create an instance of the XPlaneDatarefRx class object
 
-    main()
+    if os.getenv("BENCHMARK") == "1":
+        setup()
+        benchmark()
+    else:
+        main()
 
 
 ### END OF THIS PYTHON SCRIPT ###
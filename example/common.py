@@ -19,6 +19,7 @@ import board
 # import busio
 from adafruit_displayio_layout.layouts.page_layout import PageLayout
 import neopixel
+from led_anim import LedAnimator
 
 id = board.board_id # 'adafruit_feather_esp32s2_tft'
 
@@ -33,6 +34,8 @@ uart = None
 display = board.DISPLAY
 
 pixel = neopixel.NeoPixel(board.NEOPIXEL, 1)
+# Blinks the NeoPixel (and the red LED, see code.py) without sleeping. Advanced by leds.tick()
+leds = LedAnimator(pixel)
 
 # Define which type of LCD is connected:
 # a) the Hitachi LCD 4x20 in the enclosure with the custom made Raspberry Pi CMIO and the CM3 connected;
@@ -78,6 +81,7 @@ page_dict = {
     4: 'Datetime',
     5: 'Author',
     6: 'XPlane',
+    7: 'Stats',
 }
 
 if my_have_lcd:
@@ -133,6 +137,8 @@ dg = None
 
 dr = None
 
+xpoll = None
+
 udp_packet_types = {
     0: b"BECN",
     1: b"DATA",
@@ -175,6 +181,7 @@ ta1_grp = None
 ta2_grp = None
 te_grp = None
 xp_grp = None
+st_grp = None
 tmp117 = None
 author_lst = None
 # hdg_alt_lst = None
@@ -187,6 +194,7 @@ ta1 = None
 ta2 = None
 te = None
 xp = None
+st = None
 
 neo_brill = 50
 neo_led_red = 1
@@ -225,6 +233,11 @@ def get_page_name(page_index):
             return page_dict[page_index]
     return ''
 
+def show_xplane_page():
+    # Show the "XPlane" page for new flight data, unless it or the "Stats" page (see stats.py) is showing
+    if get_page_name(my_page_layout.showing_page_index) not in ("XPlane", "Stats"):
+        my_page_layout.show_page(page_name="XPlane")
+
 def make_pool():
     global pool
     TAG= tag_adjust("common.make_pool(): ")
@@ -240,37 +253,60 @@ def make_pool():
 
     return pool
 
-def blink_NEO_color(color):
-
-    pixel.brightness = 0.3
+def ip_to_bytes(s):
+    # "239.255.1.1" --> b'\xef\xff\x01\x01' (like socket.inet_aton())
+    return bytes([int(_) for _ in s.split('.')])
+
+def bind_multicast(a_pool, sock, group, port, iface_ip):
+    """
+    Bind sock to port and join the multicast group on the interface with IP iface_ip.
+    Several sockets (and several displays) can then receive the same X-Plane stream.
+    If the socketpool of this CircuitPython build does not support IP_ADD_MEMBERSHIP,
+    fall back to unicast: bind to iface_ip. In that case X-Plane has to send to the IP of this device.
+    Returns True if the group was joined.
+    """
+    TAG= tag_adjust("common.bind_multicast(): ")
+    reuse = getattr(a_pool, "SO_REUSEADDR", None)
+    if reuse is not None:
+        try:
+            sock.setsockopt(a_pool.SOL_SOCKET, reuse, 1)  # more than one socket may listen on this port
+        except (OSError, AttributeError) as e:
+            if my_debug:
+                print(TAG+'SO_REUSEADDR not set: {}'.format(e), file=sys.stderr)
+    add_membership = getattr(a_pool, "IP_ADD_MEMBERSHIP", None)
+    if add_membership is not None:
+        try:
+            mreq = ip_to_bytes(group) + ip_to_bytes(iface_ip)  # struct ip_mreq
+            sock.setsockopt(a_pool.IPPROTO_IP, add_membership, mreq)
+            sock.bind(("0.0.0.0", port))
+            print(TAG+'joined multicast group {}, port {}'.format(group, port), file=sys.stderr)
+            return True
+        except (OSError, AttributeError, TypeError) as e:
+            print(TAG+'joining multicast group {} failed: {}'.format(group, e), file=sys.stderr)
+    print(TAG+'falling back to unicast on {}, port {}'.format(iface_ip, port), file=sys.stderr)
+    sock.bind((iface_ip, port))
+    return False
+
+def leave_multicast(a_pool, sock, group, iface_ip):
+    drop_membership = getattr(a_pool, "IP_DROP_MEMBERSHIP", None)
+    if drop_membership is not None:
+        try:
+            sock.setsockopt(a_pool.IPPROTO_IP, drop_membership, ip_to_bytes(group) + ip_to_bytes(iface_ip))
+        except (OSError, AttributeError, TypeError):
+            pass
 
+def blink_NEO_color(color):
+    # Queue a blink pattern. The blinking is done by leds.tick(): this function returns at once.
     if color is None:
-        for _ in range(blink_cycles):
-            pixel.fill(neo_red)
-            time.sleep(0.5)
-            pixel.fill(neo_green)
-            time.sleep(0.5)
-            pixel.fill(neo_blue)
-            time.sleep(0.5)
-        pixel.fill((0, 0, 0))
+        leds.play('rgb')
+    elif color == neo_led_red:
+        leds.play('red')
+    elif color == neo_led_green:
+        leds.play('green')
+    elif color == neo_led_blue:
+        leds.play('blue')
     else:
-        if color == neo_led_red:
-            c = neo_led_red # red
-        elif color == neo_led_green:
-            c = neo_green  # green
-        elif color == neo_led_blue:
-            c = neo_blue  # blue
-        else:
-            print('blink_NEO_color(): color undefine. Got {}'.format(color), file=sys.stderr)
-            return
-
-        if color > 0:
-            # blink in the chosen color
-            for _ in range(blink_cycles):
-                pixel.fill(c)
-                time.sleep(0.5)
-                pixel.fill(neo_black)
-                time.sleep(0.5)
+        print('blink_NEO_color(): color undefine. Got {}'.format(color), file=sys.stderr)
 
 # +-------------------------------------------------------+
 # | Definition for variables in the past defined as global|
@@ -300,7 +336,9 @@ class gVars:
             14: "xplane_version",
             15: "main_loop_nr",
             16: "hdg_old",
-            17: "alt_old"
+            17: "alt_old",
+            18: "display_fps",
+            19: "xp_layout"
         }
 
         self.gVars_rDict = {
@@ -321,7 +359,9 @@ class gVars:
             "xplane_version": 14,
             "main_loop_nr": 15,
             "hdg_old": 16,
-            "alt_old": 17
+            "alt_old": 17,
+            "display_fps": 18,
+            "xp_layout": 19
         }
 
         self.g_vars = {}
@@ -372,7 +412,9 @@ class gVars:
             14: None,
             15: None,
             16: None,
-            17: None
+            17: None,
+            18: None,
+            19: None
     }
 
     def list(self):
@@ -397,7 +439,7 @@ myVars.write("disp_width", display.width)
 myVars.write("disp_height", display.height)
 myVars.write("xp", None)
 myVars.write("xp_lst", None)
-myVars.write("TFT_show_duration", 5)
+myVars.write("TFT_show_duration", int(os.getenv("TFT_SHOW_DURATION", "5")))  # seconds a page is shown
 myVars.write("kbd_intr", False)
 myVars.write("use_udp_host", os.getenv("USE_UDP_HOST"))
 myVars.write("multicast_group1", os.getenv("MULTICAST_GROUP1"))
@@ -410,3 +452,5 @@ myVars.write("xplane_version", os.getenv("XPLANE_VERSION"))
 myVars.write("main_loop_nr", 0)
 myVars.write("hdg_old",0)
 myVars.write("alt_old",0)
+myVars.write("xp_layout", None)
+myVars.write("display_fps", int(os.getenv("DISPLAY_FPS", "10")))  # frame rate of the XPlane page in poll mode
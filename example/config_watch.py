@@ -0,0 +1,100 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Hot reload of settings.toml. On CircuitPython os.getenv() reads settings.toml at every call,
+# so an edited file is seen without a restart.
+# Each subsystem is registered with watch(): a name, the settings keys it depends on and an apply function.
+# poll() is called by XPlanePoller in its idle passes. Once per 'interval' seconds (or after request(),
+# e.g. by a long press of the BOOT button) it starts a round: one key is read per poll() call, so the
+# file parsing is spread between the packets. At the end of a round the values are compared with the
+# values in use. Only the subsystems of which a key changed are reapplied: apply(changed) gets a dict
+# {key: new value (str or None)} of its changed keys.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import os
+import sys
+import time
+
+class ConfigWatch():
+
+    def __init__(self, interval=30.0, getenv=None):
+        self.getenv = os.getenv if getenv is None else getenv
+        self.interval = interval  # seconds between two rounds. 0 = only after request()
+        self.subsystems = []  # [name, keys, apply function]
+        self.keys = []        # all watched keys, in the order they are read
+        self.values = {}      # key = settings key, value = the value in use
+        self.pending = {}     # values read in the running round
+        self.idx = -1         # next key to read. -1 = no round running
+        self.next_t = time.monotonic() + interval if interval else None
+        self.round_cnt = 0
+        self.reload_cnt = 0   # nr of times a subsystem was reapplied
+        self.err_cnt = 0
+
+    def watch(self, name, keys, apply):
+        """Call apply(changed) when one of keys changed. The current values are taken as in use"""
+        for k in keys:
+            if k not in self.values:
+                self.values[k] = self.getenv(k)
+                self.keys.append(k)
+        self.subsystems.append([name, tuple(keys), apply])
+
+    def request(self):
+        """Start a round at the next poll()"""
+        if self.idx < 0:
+            self.next_t = 0
+
+    def poll(self, now=None):
+        """Read one key. Returns a list of the names of the reapplied subsystems at the end of a round, else None"""
+        if not self.keys:
+            return None
+        if now is None:
+            now = time.monotonic()
+        if self.idx < 0:
+            if self.next_t is None or now < self.next_t:
+                return None
+            self.idx = 0
+            self.pending = {}
+        k = self.keys[self.idx]
+        self.pending[k] = self.getenv(k)
+        self.idx += 1
+        if self.idx < len(self.keys):
+            return None
+        self.idx = -1
+        self.next_t = now + self.interval if self.interval else None
+        self.round_cnt += 1
+        return self.apply(self.diff())
+
+    def diff(self):
+        """The keys read in the last round of which the value differs from the value in use"""
+        changed = {}
+        for k, v in self.pending.items():
+            if v != self.values[k]:
+                changed[k] = v
+        return changed
+
+    def apply(self, changed):
+        done = []
+        if not changed:
+            return done
+        for name, keys, func in self.subsystems:
+            c = {}
+            for k in keys:
+                if k in changed:
+                    c[k] = changed[k]
+            if not c:
+                continue
+            print("config: {} changed: {}".format(name, c), file=sys.stderr)
+            try:
+                func(c)
+                done.append(name)
+                self.reload_cnt += 1
+            except (ValueError, TypeError, KeyError, OSError) as e:
+                # a bad value is not tried again until the setting is changed once more
+                self.err_cnt += 1
+                print("config: reapplying {} failed: {}".format(name, e), file=sys.stderr)
+        self.values.update(changed)
+        return done
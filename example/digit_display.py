@@ -0,0 +1,92 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Numeric display widget built on a TileGrid.
+# The sprite sheet is the glyph bitmap of the font (terminalio.FONT by default), which is already
+# in memory. There is one tile per character position: the prefix and suffix (e.g. "Hdg: " and " mag")
+# are set once. set_value() only changes the tile index of the digit positions whose digit changed.
+# Nothing is re-rendered, unlike setting the text of a bitmap_label.Label.
+#type:ignore
+import displayio
+import terminalio
+from array import array
+
+class DigitDisplay(displayio.Group):
+
+    def __init__(self, nr_digits, prefix='', suffix='', font=terminalio.FONT, scale=2, color=0xFFFFFF):
+        super().__init__(scale=scale)
+        self.font = font
+        self.tile_w, self.tile_h = font.get_bounding_box()[:2]
+        palette = displayio.Palette(2)
+        palette[0] = 0x000000
+        palette[1] = color
+        palette.make_transparent(0)
+        self.nr_digits = nr_digits
+        self.first = len(prefix)  # tile index of the first digit position
+        self.width = len(prefix) + nr_digits + len(suffix)
+        self.space = self.tile(' ')
+        self.minus = self.tile('-')
+        self.digits = array('H', [self.tile(c) for c in '0123456789'])
+        self.grid = displayio.TileGrid(font.bitmap, pixel_shader=palette, width=self.width, height=1,
+            tile_width=self.tile_w, tile_height=self.tile_h, default_tile=self.space)
+        for i in range(len(prefix)):
+            self.grid[i] = self.tile(prefix[i])
+        for i in range(len(suffix)):
+            self.grid[self.first + nr_digits + i] = self.tile(suffix[i])
+        self.cur = array('H', [self.space] * nr_digits)  # tile index now shown in each digit position
+        self.value = None
+        self.append(self.grid)
+
+    def tile(self, c):
+        g = self.font.get_glyph(ord(c))
+        return g.tile_index if g is not None else self.font.get_glyph(ord('?')).tile_index
+
+    def center_on(self, cx, cy):
+        """Position the widget with its center at (cx, cy), like anchor_point (0.5, 0.5) of a Label"""
+        self.x = cx - (self.width * self.tile_w * self.scale) // 2
+        self.y = cy - (self.tile_h * self.scale) // 2
+
+    def put(self, pos, t):
+        if self.cur[pos] != t:
+            self.cur[pos] = t
+            self.grid[self.first + pos] = t
+            return True
+        return False
+
+    def set_value(self, v):
+        """Show round(v), right aligned. Returns True if a tile changed"""
+        v = int(round(v))
+        if v == self.value:
+            return False
+        self.value = v
+        neg = v < 0
+        if neg:
+            v = -v
+        need = 1 + neg
+        t = v // 10
+        while t > 0:
+            need += 1
+            t //= 10
+        changed = False
+        if need > self.nr_digits:
+            # does not fit: show dashes
+            for i in range(self.nr_digits):
+                changed |= self.put(i, self.minus)
+            return changed
+        pos = self.nr_digits - 1
+        while True:
+            changed |= self.put(pos, self.digits[v % 10])
+            v //= 10
+            pos -= 1
+            if v == 0:
+                break
+        if neg:
+            changed |= self.put(pos, self.minus)
+            pos -= 1
+        while pos >= 0:
+            changed |= self.put(pos, self.space)
+            pos -= 1
+        return changed
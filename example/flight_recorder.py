@@ -0,0 +1,235 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Flight recorder: keeps selected decoded fields with a time stamp.
+# record() appends a sample to a block buffer in RAM. Only whole blocks are written to the file:
+# when the block is full, or after 'flush_interval' seconds (then the partly filled block is written).
+# The file is created once with 'nr_blocks' empty blocks of 'block_size' bytes. The blocks are written
+# in turn (a ring): the same flash sectors are not rewritten by every sample and the file never grows.
+# After a restart the recorder continues after the block with the highest sequence nr.
+#
+# Block layout (little endian):
+#   offset  size
+#      0     4   magic b'XFR1'
+#      4     4   block sequence nr (uint32). 0 = empty block
+#      8     8   t0: time of the first sample (double, seconds)
+#     16     2   nr of samples in the block
+#     18     1   nr of fields (n)
+#     19     n   field ids (see xp_frame.FIELDS)
+#    ...         padding to a multiple of 4
+#    ...         samples: float32 time since t0, then n float32 values (NaN if the field was not received)
+#
+# With compress=True (RECORDER_COMPRESS="1") the magic is b'XFR2' and the samples are compressed (see xp_tsz.py):
+#    ...     2   nr of bytes of the compressed samples, then 2 bytes padding and the compressed samples
+#                (time stamps in ms since t0)
+#
+# The CIRCUITPY drive is read-only for code.py unless boot.py remounts it (FLIGHT_RECORDER="1" in settings.toml).
+# An SD card mounted at /sd can be used with e.g. RECORDER_PATH="/sd/flight.rec".
+# read_blocks() reads a recorder file back, also on a PC.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import struct
+import sys
+import time
+from xp_frame import FIELDS, FIELD_IDS
+from xp_tsz import BlockEncoder, decode_block
+
+MAGIC = b'XFR1'
+MAGIC_TSZ = b'XFR2'
+HEAD_FMT = "<4sIdHB"
+HEAD_LEN = 19
+NAN = float('nan')
+
+def data_offset(nr_fields):
+    n = HEAD_LEN + nr_fields
+    return (n + 3) & ~3
+
+class FlightRecorder():
+
+    def __init__(self, fields, path="/flight.rec", block_size=4096, nr_blocks=64, flush_interval=10.0, compress=False):
+        self.ids = []
+        for f in fields:
+            if f in FIELD_IDS:
+                self.ids.append(FIELD_IDS[f])
+            else:
+                print("recorder: unknown field \'{}\'. Skipped".format(f), file=sys.stderr)
+        self.names = [FIELDS[i] for i in self.ids]
+        self.path = path
+        self.block_size = block_size
+        self.nr_blocks = nr_blocks
+        self.flush_interval = flush_interval
+        self.sample_len = 4 * (1 + len(self.ids))
+        self.data_ofs = data_offset(len(self.ids))
+        self.max_samples = (block_size - self.data_ofs) // self.sample_len
+        self.buf = bytearray(block_size)  # the block being filled
+        self.sample_fmt = "<" + "f" * (1 + len(self.ids))
+        self.enc = None
+        if compress:
+            self.enc = BlockEncoder(len(self.ids))
+            self.vals = [NAN] * len(self.ids)
+        self.f = None
+        self.slot = 0   # block of the file to write next
+        self.seq = 0    # sequence nr of the block being filled
+        self.nr_samples = 0
+        self.t0 = 0.0
+        self.next_flush_t = 0.0
+        self.write_cnt = 0
+        self.sample_cnt = 0
+        self.err_cnt = 0
+
+    def open(self):
+        """Open (or create) the recorder file and find the block to write next. Returns False on an error"""
+        try:
+            try:
+                self.f = open(self.path, "r+b")
+                self.f.seek(0, 2)
+                if self.f.tell() != self.block_size * self.nr_blocks:
+                    self.f.close()
+                    self.f = None
+            except OSError:
+                self.f = None
+            if self.f is None:
+                self.create()
+            self.find_slot()
+        except OSError as e:
+            print("recorder.open(): \'{}\': {}".format(self.path, e), file=sys.stderr)
+            self.f = None
+            return False
+        print("recorder: writing {} fields to \'{}\', block {} of {}".format(
+            len(self.ids), self.path, self.slot, self.nr_blocks), file=sys.stderr)
+        return True
+
+    def create(self):
+        # Allocate the whole file at once, with empty blocks (sequence nr 0)
+        self.f = open(self.path, "w+b")
+        zero = bytearray(self.block_size)
+        for _ in range(self.nr_blocks):
+            self.f.write(zero)
+        self.f.flush()
+
+    def find_slot(self):
+        head = bytearray(8)
+        best_seq = 0
+        best_slot = -1
+        for i in range(self.nr_blocks):
+            self.f.seek(i * self.block_size)
+            self.f.readinto(head)
+            magic, seq = struct.unpack_from("<4sI", head, 0)
+            if (magic == MAGIC or magic == MAGIC_TSZ) and seq > best_seq:
+                best_seq = seq
+                best_slot = i
+        self.slot = (best_slot + 1) % self.nr_blocks
+        self.seq = best_seq + 1
+
+    def close(self):
+        if self.f is not None:
+            self.flush()
+            self.f.close()
+            self.f = None
+
+    def record(self, fields, now=None):
+        """Append a sample of the recorded fields from the dict fields. Writes the block when it is full"""
+        if self.f is None:
+            return False
+        if now is None:
+            now = time.monotonic()
+        if self.nr_samples == 0:
+            self.start_block(now)
+        if self.enc is not None:
+            return self.record_tsz(fields, now)
+        ofs = self.data_ofs + self.nr_samples * self.sample_len
+        struct.pack_into("<f", self.buf, ofs, now - self.t0)
+        ofs += 4
+        for name in self.names:
+            v = fields.get(name)
+            struct.pack_into("<f", self.buf, ofs, v if isinstance(v, float) else NAN)
+            ofs += 4
+        self.nr_samples += 1
+        self.sample_cnt += 1
+        if self.nr_samples >= self.max_samples:
+            self.flush()
+        return True
+
+    def start_block(self, now):
+        self.t0 = now
+        self.next_flush_t = now + self.flush_interval
+        if self.enc is not None:
+            self.enc.start(self.buf, self.data_ofs + 4, self.block_size)
+
+    def record_tsz(self, fields, now):
+        vals = self.vals
+        for i in range(len(self.names)):
+            v = fields.get(self.names[i])
+            vals[i] = v if isinstance(v, float) else NAN
+        t_ms = int((now - self.t0) * 1000.0 + 0.5)
+        if not self.enc.add(t_ms, vals):
+            self.flush()
+            self.start_block(now)
+            self.enc.add(0, vals)
+        self.nr_samples += 1
+        self.sample_cnt += 1
+        return True
+
+    def poll(self, now=None):
+        """Write the partly filled block when flush_interval has passed. Called in idle time"""
+        if self.nr_samples > 0:
+            if now is None:
+                now = time.monotonic()
+            if now >= self.next_flush_t:
+                self.flush()
+
+    def flush(self):
+        if self.f is None or self.nr_samples == 0:
+            return
+        if self.enc is not None:
+            nbytes = self.enc.finish()
+            struct.pack_into("<H", self.buf, self.data_ofs, nbytes)
+            end = self.data_ofs + 4 + nbytes
+        else:
+            end = self.data_ofs + self.nr_samples * self.sample_len
+        struct.pack_into(HEAD_FMT, self.buf, 0, MAGIC if self.enc is None else MAGIC_TSZ, self.seq, self.t0,
+            self.nr_samples, len(self.ids))
+        self.buf[HEAD_LEN:HEAD_LEN + len(self.ids)] = bytes(self.ids)
+        # clear the rest of a partly filled block: an old block may be in the file there
+        self.buf[end:] = bytes(self.block_size - end)
+        try:
+            self.f.seek(self.slot * self.block_size)
+            self.f.write(self.buf)
+            self.f.flush()
+            self.write_cnt += 1
+        except OSError as e:
+            self.err_cnt += 1
+            print("recorder.flush(): {}".format(e), file=sys.stderr)
+        self.slot = (self.slot + 1) % self.nr_blocks
+        self.seq += 1
+        self.nr_samples = 0
+
+
+def read_blocks(path, block_size=4096):
+    """Read a recorder file. Yields (seq, t0, field names, list of samples) per block, oldest block first.
+    A sample is a tuple (time, value, value, ...)"""
+    blocks = []
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(block_size)
+            if len(buf) < block_size:
+                break
+            magic, seq, t0, nr_samples, nr_fields = struct.unpack_from(HEAD_FMT, buf, 0)
+            if (magic == MAGIC or magic == MAGIC_TSZ) and seq > 0:
+                blocks.append((seq, t0, nr_samples, nr_fields, magic, buf))
+    blocks.sort(key=lambda b: b[0])
+    for seq, t0, nr_samples, nr_fields, magic, buf in blocks:
+        ids = buf[HEAD_LEN:HEAD_LEN + nr_fields]
+        names = [FIELDS[i] for i in ids]
+        ofs = data_offset(nr_fields)
+        if magic == MAGIC_TSZ:
+            samples = [(s[0] / 1000.0,) + s[1:] for s in decode_block(buf, ofs + 4, nr_fields, nr_samples)]
+        else:
+            fmt = "<" + "f" * (1 + nr_fields)
+            sl = 4 * (1 + nr_fields)
+            samples = [struct.unpack_from(fmt, buf, ofs + i * sl) for i in range(nr_samples)]
+        yield seq, t0, names, samples
@@ -0,0 +1,90 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Heading tape for the "XPlane" page.
+# The whole compass rose is drawn once, at start, into a 1-bit strip bitmap:
+# a tick every 5 degrees, a long tick every 10 degrees and a label every 30 degrees
+# (N 3 6 E 12 15 S 21 24 W 30 33). The strip is shown in a TileGrid with one tile.
+# To show a heading only the x position of the TileGrid changes: x = -hdg * ppd.
+# Nothing is redrawn per frame.
+# The strip is 360 degrees plus one screen width long, so that the part left and right
+# of 0/360 degrees is already there and no second tile is needed to wrap around.
+# A fixed pointer marks the heading in the center of the screen.
+#type:ignore
+import displayio
+import terminalio
+
+class HeadingTape(displayio.Group):
+
+    LABELS = {0: 'N', 30: '3', 60: '6', 90: 'E', 120: '12', 150: '15',
+              180: 'S', 210: '21', 240: '24', 270: 'W', 300: '30', 330: '33'}
+
+    def __init__(self, width=240, height=22, ppd=2, font=terminalio.FONT, color=0xFFFFFF, pointer_color=0xFFFF00):
+        super().__init__()
+        self.view_w = width
+        self.ppd = ppd  # pixels per degree
+        self.half = width // 2
+        self.strip_w = 360 * ppd + width
+        self.x_old = None
+        palette = displayio.Palette(2)
+        palette[0] = 0x000000
+        palette[1] = color
+        palette.make_transparent(0)
+        self.strip = displayio.Bitmap(self.strip_w, height, 2)
+        self.draw(font, height)
+        self.grid = displayio.TileGrid(self.strip, pixel_shader=palette)
+        self.append(self.grid)
+        # Pointer: a 3 pixel wide bar over the full height, in the center of the view
+        p_palette = displayio.Palette(1)
+        p_palette[0] = pointer_color
+        self.append(displayio.TileGrid(displayio.Bitmap(3, height, 1), pixel_shader=p_palette, x=self.half - 1, y=0))
+
+    def column(self, deg):
+        """x in the strip of heading deg, with deg in [-half/ppd, 360 + half/ppd)"""
+        return deg * self.ppd + self.half
+
+    def draw(self, font, height):
+        tile_w, tile_h = font.get_bounding_box()[:2]
+        first = -(self.half // self.ppd)
+        last = 360 + (self.half // self.ppd)
+        for deg in range(first - (first % 5), last + 1, 5):
+            x = self.column(deg)
+            if x < 0 or x >= self.strip_w:
+                continue
+            tick = 8 if deg % 10 == 0 else 4
+            for y in range(height - tick, height):
+                self.strip[x, y] = 1
+            lbl = self.LABELS.get(deg % 360) if deg % 30 == 0 else None
+            if lbl is not None:
+                x0 = x - (len(lbl) * tile_w) // 2
+                y0 = height - 8 - tile_h
+                for i in range(len(lbl)):
+                    self.blit_glyph(font, lbl[i], x0 + i * tile_w, y0 if y0 > 0 else 0, tile_w, tile_h)
+
+    def blit_glyph(self, font, c, x0, y0, tile_w, tile_h):
+        g = font.get_glyph(ord(c))
+        if g is None:
+            return
+        src = g.bitmap
+        cols = src.width // tile_w
+        sx = (g.tile_index % cols) * tile_w
+        sy = (g.tile_index // cols) * tile_h
+        for y in range(tile_h):
+            if y0 + y >= self.strip.height:
+                break
+            for x in range(tile_w):
+                if 0 <= x0 + x < self.strip_w and src[sx + x, sy + y]:
+                    self.strip[x0 + x, y0 + y] = 1
+
+    def set_heading(self, hdg):
+        """Scroll the strip so that hdg (degrees, may be fractional) is under the pointer.
+        Returns True if the strip moved"""
+        x = -int(round((hdg % 360.0) * self.ppd))
+        if x == self.x_old:
+            return False
+        self.x_old = x
+        self.grid.x = x
+        return True
@@ -0,0 +1,145 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Ingress stage for the received X-Plane packets. Every packet passes check() before a decoder sees it:
+#   header     the 4 byte header is read as one integer (struct "<I") and looked up in a table
+#   zero       a packet with a zero header is rejected (all-zero packets, e.g. a stale buffer)
+#   length     the size must fit the packet type: DATA is 5 + n * 36 bytes, RREF is 5 + n * 8 bytes, ...
+#   duplicate  the crc32 of the packet is compared with the last 'ring_len' packets received within
+#              'dup_window' seconds. X-Plane can send the same packet to both the unicast address and
+#              the multicast group. Only a copy that arrived on another path (the caller numbers its
+#              sockets) is dropped: a paused sim sends identical packets on one path, those are all kept.
+#              The times are integer ms since the Ingress was made (time.monotonic_ns()), so that the
+#              window does not lose precision after hours of running.
+# Each rejection increments a counter (see counters). Rejected packets never reach the decoders.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import struct
+import time
+from array import array
+try:
+    from binascii import crc32
+except ImportError:
+    from zlib import crc32
+
+def tag(name):
+    """The header name (e.g. b'DATA') as the integer used by check()"""
+    return struct.unpack("<I", name)[0]
+
+H_BECN = tag(b'BECN')
+H_DATA = tag(b'DATA')
+H_DSEL = tag(b'DSEL')
+H_RREF = tag(b'RREF')
+H_XATT = tag(b'XATT')
+H_XGPS = tag(b'XGPS')
+H_XTRA = tag(b'XTRA')
+
+# key = header, value = (name, minimum size, size of a record after the 5 byte prologue or 0)
+PACKET_TYPES = {
+    H_BECN: ('BECN', 21, 0),
+    H_DATA: ('DATA', 41, 36),
+    H_RREF: ('RREF', 13, 8),
+    H_XATT: ('XATT', 6, 0),
+    H_XGPS: ('XGPS', 6, 0),
+    H_XTRA: ('XTRA', 6, 0)
+}
+
+COUNTERS = ('rx', 'ok', 'zero', 'short', 'bad_len', 'unknown', 'dup')
+
+def header_name(packet):
+    """The header of packet as str, e.g. 'DATA'. '' if the header is not known"""
+    if len(packet) < 4:
+        return ''
+    t = PACKET_TYPES.get(struct.unpack_from("<I", packet, 0)[0])
+    return t[0] if t is not None else ''
+
+
+class Ingress():
+
+    def __init__(self, ring_len=16, dup_window=0.1):
+        self.handlers = {}  # key = header, value = function(packet, size, addr)
+        self.counters = {}
+        for k in COUNTERS:
+            self.counters[k] = 0
+        self.type_cnt = {}  # accepted packets per header name
+        for t in PACKET_TYPES.values():
+            self.type_cnt[t[0]] = 0
+        self.dup_window = dup_window
+        self.dup_window_ms = int(dup_window * 1000)
+        self.t_ref = time.monotonic_ns()
+        self.ring_crc = array('L', [0] * ring_len)
+        self.ring_t = array('q', [-(1 << 62)] * ring_len)  # ms since t_ref
+        self.ring_path = array('B', [0] * ring_len)
+        self.ring_idx = 0
+
+    def register(self, name, handler):
+        """Call handler(packet, size, addr) for the accepted packets with header name (e.g. b'DATA')"""
+        self.handlers[tag(name)] = handler
+
+    def count(self, k):
+        self.counters[k] += 1
+        return 0
+
+    def now_ms(self):
+        return (time.monotonic_ns() - self.t_ref) // 1000000
+
+    def is_dup(self, packet, size, now_ms, path=0):
+        """True if the same packet arrived on another path within dup_window"""
+        c = crc32(memoryview(packet)[:size]) & 0xFFFFFFFF
+        ring = self.ring_crc
+        same = -1
+        for i in range(len(ring)):
+            if ring[i] == c and now_ms - self.ring_t[i] <= self.dup_window_ms:
+                if self.ring_path[i] != path:
+                    return True
+                same = i  # a repeat on the same path: refresh its entry
+        i = same
+        if i < 0:
+            i = self.ring_idx
+            self.ring_idx = (i + 1) % len(ring)
+        ring[i] = c
+        self.ring_t[i] = now_ms
+        self.ring_path[i] = path
+        return False
+
+    def check(self, packet, size, now_ms=None, path=0):
+        """Returns the header (int) of an accepted packet, or 0 if rejected.
+        path: nr (0..255) of the socket the packet was received on, see is_dup()"""
+        self.counters['rx'] += 1
+        if size < 5:
+            return self.count('short')
+        h = struct.unpack_from("<I", packet, 0)[0]
+        if h == 0:
+            return self.count('zero')
+        t = PACKET_TYPES.get(h)
+        if t is None:
+            return self.count('unknown')
+        if size < t[1]:
+            return self.count('short')
+        if t[2] and (size - 5) % t[2] != 0:
+            return self.count('bad_len')
+        if self.dup_window > 0:
+            if self.is_dup(packet, size, self.now_ms() if now_ms is None else now_ms, path):
+                return self.count('dup')
+        self.counters['ok'] += 1
+        self.type_cnt[t[0]] += 1
+        return h
+
+    def dispatch(self, packet, size, addr=None, path=0):
+        """check() the packet and hand it to the handler of its header. Returns True if handled"""
+        h = self.check(packet, size, path=path)
+        if h == 0:
+            return False
+        f = self.handlers.get(h)
+        if f is None:
+            return False
+        f(packet, size, addr)
+        return True
+
+    def rejected(self):
+        c = self.counters
+        return c['rx'] - c['ok']
@@ -0,0 +1,113 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Non-blocking animation of the NeoPixel and the red status LED.
+# A pattern is a list of steps: (NeoPixel color or None, LED on/off, duration in seconds).
+# play() queues a pattern. tick(), called from the main loop, changes the LEDs when the
+# current step has expired. Nothing sleeps, so no packets are missed while an LED blinks.
+# The pattern with the highest priority plays first. A new pattern with a higher priority
+# interrupts the one playing. A pattern already queued is not queued again (e.g. heartbeats).
+# Conditions (e.g. low battery) repeat their pattern for as long as they are set.
+#type:ignore
+import time
+
+BLACK = (0, 0, 0)
+
+def _blink(color, cycles, on_t, off_t, led=False):
+    steps = []
+    for _ in range(cycles):
+        steps.append((color, led, on_t))
+        steps.append((BLACK, False, off_t))
+    return steps
+
+# key = name, value = (priority, steps)
+PATTERNS = {
+    'heartbeat':   (1, _blink((0, 8, 0), 1, 0.03, 0.0)),         # a packet was received
+    'led':         (1, _blink(None, 2, 0.1, 0.5, led=True)),      # red LED only, was code.blink()
+    'rgb':         (1, [((50, 0, 0), False, 0.5), ((0, 50, 0), False, 0.5), ((0, 0, 50), False, 0.5)] * 2 + [(BLACK, False, 0.0)]),
+    'green':       (2, _blink((0, 50, 0), 2, 0.5, 0.5)),          # was blink_NEO_color(neo_led_green)
+    'blue':        (2, _blink((0, 0, 50), 2, 0.5, 0.5)),
+    'red':         (2, _blink((50, 0, 0), 2, 0.5, 0.5)),
+    'beacon':      (2, _blink((0, 50, 0), 2, 0.5, 0.5)),          # a BECN packet was received
+    'low_battery': (3, _blink((50, 20, 0), 1, 0.2, 2.0)),
+    'error':       (4, _blink((50, 0, 0), 3, 0.1, 0.1, led=True))
+}
+
+class LedAnimator():
+
+    def __init__(self, pixel, led=None, brightness=0.3):
+        self.pixel = pixel
+        self.led = led  # digitalio.DigitalInOut of the red LED. Set by code.py
+        self.pixel.brightness = brightness
+        self.queue = []       # names of the patterns waiting
+        self.conditions = []  # names of the patterns that repeat
+        self.cur = None       # name of the pattern playing
+        self.steps = None
+        self.step = 0
+        self.step_end = 0
+        self.color = None     # what the LEDs show now, to write only changes
+        self.led_on = None
+
+    def play(self, name):
+        """Queue pattern name. Returns False if it does not exist"""
+        if name not in PATTERNS:
+            return False
+        if name != self.cur and name not in self.queue:
+            self.queue.append(name)
+        if self.cur is not None and PATTERNS[name][0] > PATTERNS[self.cur][0]:
+            self.step_end = 0  # interrupt the pattern playing at the next tick
+            self.steps = None
+        return True
+
+    def set_condition(self, name, on):
+        if on and name not in self.conditions:
+            self.conditions.append(name)
+        elif not on and name in self.conditions:
+            self.conditions.remove(name)
+
+    def next_pattern(self):
+        for name in self.conditions:
+            if name not in self.queue and name != self.cur:
+                self.queue.append(name)
+        if len(self.queue) == 0:
+            return None
+        best = 0
+        for i in range(1, len(self.queue)):
+            if PATTERNS[self.queue[i]][0] > PATTERNS[self.queue[best]][0]:
+                best = i
+        return self.queue.pop(best)
+
+    def show(self, color, led_on):
+        if color is not None and color != self.color:
+            self.color = color
+            self.pixel.fill(color)
+        if self.led is not None and led_on != self.led_on:
+            self.led_on = led_on
+            self.led.value = led_on
+
+    def tick(self, now=None):
+        """Advance the animation. Returns True while a pattern is playing"""
+        if now is None:
+            now = time.monotonic()
+        if now < self.step_end:
+            return True
+        if self.steps is not None:
+            self.step += 1
+        if self.steps is None or self.step >= len(self.steps):
+            self.cur = self.next_pattern()
+            if self.cur is None:
+                self.steps = None
+                self.show(BLACK, False)
+                return False
+            self.steps = PATTERNS[self.cur][1]
+            self.step = 0
+        color, led_on, duration = self.steps[self.step]
+        self.show(color, led_on)
+        self.step_end = now + duration
+        return True
+
+    def busy(self):
+        return self.cur is not None or len(self.queue) > 0
@@ -0,0 +1,176 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Metrics of the device in the Prometheus text exposition format, served over HTTP (GET /metrics).
+# MetricsRegistry holds the metrics: counters and gauges read their value from a function
+# when the page is requested, histograms count observations in fixed buckets.
+# MetricsServer serves the registry without blocking: the listening socket and the client sockets
+# are non-blocking and poll() does one step of accept / receive / send per call.
+# XPlanePoller calls poll() in its idle passes. At most 'max_clients' connections are open at once.
+#
+# It runs on the port set with METRICS_PORT in settings.toml, not on CIRCUITPY_WEB_API_PORT
+# which is used by the CircuitPython web workflow.
+# This module does not import common.py: with the CPython 'socket' module as pool it can be tested
+# on a PC with e.g. curl http://localhost:9100/metrics
+#type:ignore
+import time
+import sys
+from array import array
+
+EAGAIN = 11
+EINPROGRESS = 115
+
+class Histogram():
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)  # upper bounds, ascending. +Inf is added
+        self.counts = array('L', [0] * (len(self.buckets) + 1))
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        i = 0
+        for b in self.buckets:
+            if v <= b:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += v
+        self.count += 1
+
+
+class MetricsRegistry():
+
+    def __init__(self, prefix="xp_"):
+        self.prefix = prefix
+        self.metrics = []  # [name, type, help, function or Histogram, label name]
+
+    def counter(self, name, help_txt, func, label=None):
+        """func() returns a number or, with label set, a dict {label value: number}"""
+        self.metrics.append([self.prefix + name, 'counter', help_txt, func, label])
+
+    def gauge(self, name, help_txt, func, label=None):
+        self.metrics.append([self.prefix + name, 'gauge', help_txt, func, label])
+
+    def histogram(self, name, help_txt, buckets):
+        h = Histogram(buckets)
+        self.metrics.append([self.prefix + name, 'histogram', help_txt, h, None])
+        return h
+
+    def render(self):
+        """The metrics in the Prometheus text format, as a list of str"""
+        out = []
+        for name, typ, help_txt, src, label in self.metrics:
+            out.append("# HELP {} {}\n# TYPE {} {}\n".format(name, help_txt, name, typ))
+            if typ == 'histogram':
+                acc = 0
+                for i in range(len(src.buckets)):
+                    acc += src.counts[i]
+                    out.append('{}_bucket{{le="{}"}} {}\n'.format(name, src.buckets[i], acc))
+                out.append('{}_bucket{{le="+Inf"}} {}\n{}_sum {}\n{}_count {}\n'.format(
+                    name, src.count, name, src.sum, name, src.count))
+                continue
+            try:
+                v = src()
+            except Exception as e:  # a failing source must not break the page
+                print("metrics.render(): {}: {}".format(name, e), file=sys.stderr)
+                continue
+            if v is None:
+                continue
+            if label is None:
+                out.append("{} {}\n".format(name, v))
+            else:
+                for k, n in v.items():
+                    out.append('{}{{{}="{}"}} {}\n'.format(name, label, k, n))
+        return out
+
+
+class MetricsServer():
+
+    def __init__(self, pool, registry, port=9100, max_clients=2, client_timeout=2.0):
+        self.pool = pool  # socketpool.SocketPool (CircuitPython) or the socket module (CPython)
+        self.registry = registry
+        self.port = port
+        self.max_clients = max_clients
+        self.client_timeout = client_timeout
+        self.sock = None
+        self.clients = []  # [socket, receive buffer, nr of bytes received, response, nr of bytes sent, start time]
+        self.rx_buf_len = 512
+        self.req_cnt = 0
+
+    def open(self):
+        s = self.pool.socket(self.pool.AF_INET, self.pool.SOCK_STREAM)
+        try:
+            s.setsockopt(self.pool.SOL_SOCKET, self.pool.SO_REUSEADDR, 1)
+        except (AttributeError, OSError):
+            pass
+        s.bind(("0.0.0.0", self.port))
+        s.listen(self.max_clients)
+        s.setblocking(False)
+        self.sock = s
+        print("metrics: serving http://<device ip>:{}/metrics".format(self.port), file=sys.stderr)
+
+    def close(self):
+        for c in self.clients:
+            c[0].close()
+        self.clients = []
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def poll(self, now=None):
+        """One non-blocking step: accept a connection, then read or write every open connection"""
+        if self.sock is None:
+            self.open()
+        if now is None:
+            now = time.monotonic()
+        if len(self.clients) < self.max_clients:
+            try:
+                conn, addr = self.sock.accept()
+                conn.setblocking(False)
+                self.clients.append([conn, bytearray(self.rx_buf_len), 0, None, 0, now])
+            except OSError as e:
+                if e.errno not in (EAGAIN, EINPROGRESS):
+                    raise
+        for c in self.clients[:]:
+            try:
+                done = self.step(c)
+            except OSError as e:
+                if e.errno in (EAGAIN, EINPROGRESS):
+                    done = False
+                else:
+                    done = True
+            if done or now - c[5] > self.client_timeout:
+                c[0].close()
+                self.clients.remove(c)
+
+    def step(self, c):
+        """Returns True when the connection can be closed"""
+        conn = c[0]
+        if c[3] is None:
+            if c[2] >= len(c[1]):
+                c[3] = self.response("431 Request Header Fields Too Large", b"")
+            else:
+                n = conn.recv_into(memoryview(c[1])[c[2]:])
+                if n == 0:
+                    return True  # closed by the client
+                c[2] += n
+                req = bytes(c[1][:c[2]])
+                if req.find(b"\r\n\r\n") < 0:
+                    return False
+                if req.startswith(b"GET /metrics") or req.startswith(b"GET / "):
+                    self.req_cnt += 1
+                    c[3] = self.response("200 OK", "".join(self.registry.render()).encode())
+                else:
+                    c[3] = self.response("404 Not Found", b"")
+        n = conn.send(memoryview(c[3])[c[4]:])
+        c[4] += n
+        return c[4] >= len(c[3])
+
+    def response(self, status, body):
+        head = "HTTP/1.1 {}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+            status, len(body))
+        return head.encode() + body
@@ -0,0 +1,84 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Scheduled, cached reading of I2C sensors (battery gauge LC709203F, temperature sensor TMP117).
+# Each sensor is registered with a read function, an interval and a time-to-live (TTL).
+# poll() is called from the receive loop and does at most one I2C read per call: the sensor
+# that is most overdue. An I2C transaction blocks the single core, so they are spread out
+# between the packets instead of all being done at once.
+# The display and telemetry read the cache with get(). A reading older than its TTL is not returned.
+#type:ignore
+import time
+import sys
+
+class SensorService():
+
+    def __init__(self):
+        self.sensors = {}  # key = name, value = [read function, interval, ttl, value, time of reading, next read time]
+        self.read_cnt = 0
+        self.err_cnt = 0
+
+    def register(self, name, read_func, interval, ttl=None):
+        """read_func() returns the value of the sensor. ttl defaults to 3 times the interval"""
+        if ttl is None:
+            ttl = 3 * interval
+        self.sensors[name] = [read_func, interval, ttl, None, 0, 0]
+
+    def set_interval(self, name, interval, ttl=None):
+        """Change the interval (and TTL) of a registered sensor. The cached value is kept"""
+        s = self.sensors[name]
+        s[1] = interval
+        s[2] = 3 * interval if ttl is None else ttl
+        s[5] = min(s[5], time.monotonic() + interval)
+
+    def read_now(self, name):
+        """Read the sensor now and cache the value. Returns the value or None on an error"""
+        s = self.sensors[name]
+        now = time.monotonic()
+        s[5] = now + s[1]
+        try:
+            s[3] = s[0]()
+            s[4] = now
+            self.read_cnt += 1
+        except (OSError, RuntimeError, ValueError) as e:
+            self.err_cnt += 1
+            print("sensors.read_now(): error reading \'{}\': {}".format(name, e), file=sys.stderr)
+            return None
+        return s[3]
+
+    def poll(self, now=None):
+        """Read the most overdue sensor, if any. Returns True if a sensor was read"""
+        if now is None:
+            now = time.monotonic()
+        due = None
+        due_t = now
+        for name, s in self.sensors.items():
+            if s[5] <= due_t:
+                due = name
+                due_t = s[5]
+        if due is None:
+            return False
+        self.read_now(due)
+        return True
+
+    def get(self, name, refresh=False):
+        """The cached value of sensor name, or None if there is no reading within its TTL.
+        With refresh=True a missing or stale value is read at once"""
+        s = self.sensors.get(name)
+        if s is None:
+            return None
+        if s[3] is not None and time.monotonic() - s[4] <= s[2]:
+            return s[3]
+        if refresh:
+            return self.read_now(name)
+        return None
+
+    def age(self, name):
+        """Seconds since the last reading of sensor name, or None"""
+        s = self.sensors.get(name)
+        if s is None or s[3] is None:
+            return None
+        return time.monotonic() - s[4]
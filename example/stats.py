@@ -0,0 +1,128 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Diagnostics of the receive pipeline, shown on the "Stats" page and printed to the serial output:
+#   packets per second for each header type (counted by the ingress stage, see ingress.py)
+#   dropped packets: duplicates and bad packets (all-zero, wrong length, unknown header)
+#   decode errors (dg.decode_err_cnt), socket timeouts (dg.timeout_cnt) and RREF timeouts
+#   loops of XPlanePoller per second and the free heap
+# update() is called by XPlanePoller in its idle passes and does its work once per 'interval' seconds.
+# The page text is only rebuilt while the "Stats" page is showing.
+# The serial summary is followed by the table of xp_profile.py if PROFILE_FUNCS is set.
+# The BOOT button toggles between the "XPlane" and the "Stats" page.
+# A long press (LONG_PRESS seconds) calls on_long_press() instead, e.g. to reload settings.toml.
+#type:ignore
+from common import *
+import time
+import sys
+import gc
+import digitalio
+import xp_profile
+
+TYPES = ('DATA', 'XGPS', 'XATT', 'XTRA', 'RREF', 'BECN')
+LONG_PRESS = 1.0  # seconds
+
+class PipelineStats():
+
+    def __init__(self, poller, label=None, interval=1.0, print_interval=10):
+        self.poller = poller
+        self.ingress = poller.ingress
+        self.label = label  # bitmap_label of the "Stats" page
+        self.interval = interval
+        self.print_interval = print_interval  # seconds between two serial summaries. 0 = none
+        self.next_t = 0
+        self.next_print_t = 0
+        self.last_t = None
+        self.last_type_cnt = {}
+        self.last_loop_cnt = 0
+        self.rates = {}
+        for k in TYPES:
+            self.last_type_cnt[k] = 0
+            self.rates[k] = 0.0
+        self.loop_rate = 0.0
+        self.mem_free = 0
+        self.button = None
+        self.button_old = True
+        self.press_t = 0
+        self.on_long_press = None  # function called when the button is held LONG_PRESS seconds
+        try:
+            self.button = digitalio.DigitalInOut(board.BUTTON)
+            self.button.switch_to_input(pull=digitalio.Pull.UP)
+        except (AttributeError, ValueError) as e:
+            print("stats.__init__(): no button to toggle the Stats page: {}".format(e), file=sys.stderr)
+
+    def check_button(self, now):
+        """Toggle between the XPlane and the Stats page when the button is released (active low)"""
+        if self.button is None:
+            return
+        v = self.button.value
+        if v != self.button_old:
+            self.button_old = v
+            if not v:
+                self.press_t = now
+            elif now - self.press_t >= LONG_PRESS and self.on_long_press is not None:
+                self.on_long_press()
+            else:
+                if self.showing():
+                    my_page_layout.show_page(page_name="XPlane")
+                else:
+                    my_page_layout.show_page(page_name="Stats")
+                    self.next_t = 0  # fill the page at once
+
+    def showing(self):
+        return get_page_name(my_page_layout.showing_page_index) == "Stats"
+
+    def update(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.check_button(now)
+        if now < self.next_t:
+            return False
+        self.next_t = now + self.interval
+        if self.last_t is not None:
+            dt = now - self.last_t
+            if dt > 0:
+                tc = self.ingress.type_cnt
+                for k in TYPES:
+                    self.rates[k] = (tc[k] - self.last_type_cnt[k]) / dt
+                    self.last_type_cnt[k] = tc[k]
+                self.loop_rate = (self.poller.loop_cnt - self.last_loop_cnt) / dt
+        self.last_loop_cnt = self.poller.loop_cnt
+        self.last_t = now
+        try:
+            self.mem_free = gc.mem_free()
+        except AttributeError:
+            self.mem_free = 0  # CPython
+        if self.label is not None and self.showing():
+            self.label.text = self.page_text()
+        if self.print_interval and now >= self.next_print_t:
+            self.next_print_t = now + self.print_interval
+            print(self.summary(), file=sys.stderr)
+            xp_profile.dump(sys.stderr)  # nothing unless PROFILE_FUNCS is set
+        return True
+
+    def dropped(self):
+        c = self.ingress.counters
+        return c['dup'], c['zero'] + c['short'] + c['bad_len'] + c['unknown']
+
+    def page_text(self):
+        r = self.rates
+        dup, bad = self.dropped()
+        dg = self.poller.dg
+        return "Packets/s\n DATA {:4.1f}  XGPS {:4.1f}  RREF {:4.1f}\n XATT {:4.1f}  XTRA {:4.1f}  BECN {:4.1f}\n".format(
+            r['DATA'], r['XGPS'], r['RREF'], r['XATT'], r['XTRA'], r['BECN']) + \
+            "Dropped: dup {}  bad {}\nDecode err: {}  Timeouts: {}/{}\nLoops/s: {:.0f}  Heap: {}".format(
+            dup, bad, dg.decode_err_cnt, dg.timeout_cnt, self.poller.rref_timeout_cnt, self.loop_rate, self.mem_free)
+
+    def summary(self):
+        r = self.rates
+        dup, bad = self.dropped()
+        s = "stats: "
+        for k in TYPES:
+            s += "{} {:.1f}/s, ".format(k, r[k])
+        return s + "dup {}, bad {}, decode err {}, timeouts {}/{}, loops {:.0f}/s, heap {}".format(
+            dup, bad, self.poller.dg.decode_err_cnt, self.poller.dg.timeout_cnt, self.poller.rref_timeout_cnt,
+            self.loop_rate, self.mem_free)
@@ -0,0 +1,79 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Micro-benchmark of the stages of the display pipeline on the device itself.
+# With BENCHMARK="1" in settings.toml, code.py runs benchmark() instead of main(): every stage
+# (a function called with the iteration nr) is run BENCHMARK_ITERATIONS times and timed with time.monotonic_ns().
+# Per stage: nr of iterations, total ms, mean/min/max us and heap bytes allocated per iteration (gc.mem_alloc()).
+# A stage that raises an exception is reported with its error; the other stages still run.
+# The results are printed as one JSON line to the serial output and written to BENCHMARK_FILE.
+# Writing to the CIRCUITPY drive needs it to be writable for code.py (see boot.py).
+# This module does not import common.py so that it can be used outside CircuitPython.
+import sys
+import time
+import gc
+import json
+import struct
+from xp_tables import DATA_GROUPS
+
+def canned_data(groups=(3, 17, 20)):
+    """A DATA payload (without the 5 byte prologue) with one record of each group, as msgs_unpack() gets it"""
+    buf = b''
+    for idx in groups:
+        fmt = DATA_GROUPS[idx][1]
+        vals = []
+        for i in range(8):
+            vals.append(i + 1 if fmt[i + 2] == 'i' else 100.5 + i)
+        buf += struct.pack(fmt, idx, *vals)
+    return buf
+
+def _no_mem_alloc():
+    return 0
+
+_mem_alloc = getattr(gc, "mem_alloc", _no_mem_alloc)
+
+def time_stage(name, fn, n):
+    """Run fn(i) for i in range(n). Returns the result dict of the stage"""
+    gc.collect()
+    t_min = None
+    t_max = 0
+    total = 0
+    a0 = _mem_alloc()
+    for i in range(n):
+        t0 = time.monotonic_ns()
+        fn(i)
+        dt = time.monotonic_ns() - t0
+        total += dt
+        if t_min is None or dt < t_min:
+            t_min = dt
+        if dt > t_max:
+            t_max = dt
+    da = _mem_alloc() - a0  # negative if the garbage collector ran
+    return {"stage": name, "n": n, "total_ms": round(total / 1e6, 3), "mean_us": round(total / n / 1e3, 1),
+        "min_us": round(t_min / 1e3, 1), "max_us": round(t_max / 1e3, 1), "alloc_b": da // n if da >= 0 else None}
+
+def run(stages, n=100, path=None, meta=None):
+    """stages: list of (name, function). Returns the results and prints/writes them as JSON"""
+    results = []
+    for name, fn in stages:
+        try:
+            results.append(time_stage(name, fn, n))
+        except Exception as e:
+            results.append({"stage": name, "error": repr(e)})
+        print("bench: {}".format(results[-1]), file=sys.stderr)
+    out = {"platform": sys.platform, "version": ".".join(str(v) for v in sys.version_info[:3]), "results": results}
+    if meta:
+        out.update(meta)
+    s = json.dumps(out)
+    print(s)
+    if path:
+        try:
+            with open(path, "w") as f:
+                f.write(s)
+                f.write("\n")
+        except OSError as e:
+            print("bench: results not written to {}: {}".format(path, e), file=sys.stderr)
+    return out
@@ -0,0 +1,51 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Table driven decoding of X-Plane packets, using the generated tables of xp_tables.py.
+#   DATA        5 byte prologue, then records of 36 bytes: int32 group index + 8 values.
+#               Each record is decoded by its own index, so the order and the choice of groups
+#               set in X-Plane's Data Output screen do not matter. Unknown groups are skipped.
+#   XGPS, XATT, XTRA  ASCII text: header + simulator name, then comma separated values.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import struct
+from xp_tables import DATA_GROUPS, CSV_TYPES
+
+REC_LEN = 36
+
+def unpack_data(packet, size, ofs=5):
+    """The records of a DATA packet: a list of tuples (index, value, ...) of the groups in DATA_GROUPS.
+    ofs is the offset of the first record (5 after the 'DATA' prologue)"""
+    out = []
+    while ofs + REC_LEN <= size:
+        g = DATA_GROUPS.get(struct.unpack_from("<i", packet, ofs)[0])
+        if g is not None:
+            out.append(struct.unpack_from(g[1], packet, ofs))
+        ofs += REC_LEN
+    return out
+
+def fill_group(values, rec):
+    """Put the values of record rec (as returned by unpack_data()) into the dict values, by field name"""
+    names = DATA_GROUPS[rec[0]][2]
+    values['ID'] = rec[0]
+    for i in range(8):
+        values[names[i]] = rec[i + 1]
+
+def unpack_csv(packet, size):
+    """The values of an XGPS, XATT or XTRA packet as a list: a float where possible, else a str"""
+    s_lst = bytes(packet[:size]).decode().split(',')
+    out = []
+    for s in s_lst[1:]:
+        try:
+            out.append(float(s))
+        except ValueError:
+            out.append(s.strip())
+    return out
+
+def csv_labels(header):
+    """(labels, units) of packet type header (e.g. 'XGPS'), or None"""
+    return CSV_TYPES.get(header)
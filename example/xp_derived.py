@@ -0,0 +1,145 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Values derived from consecutive X-Plane DATA samples, computed on the device
+# instead of asking X-Plane for more DATA groups:
+#   vs_fpm     vertical speed (ft/min)        from CG_ftmsl   (group 20), alpha-beta filter
+#   turn_dps   rate of turn (degrees/s)       from hding_true (group 17), alpha-beta filter
+#   track_deg  ground track (degrees true)    from lat_deg, lon_deg (group 20), smoothed
+#   wind_kts   wind component (kts)           vtrue_ktas - vtrue_ktgs (group 3), EMA. > 0 = headwind
+#   dist_nm    distance flown (nm)            sum of the great circle steps between positions
+# Each update() costs O(1) and the state is a fixed set of floats.
+# Every channel is seeded by the first sample that has its field and keeps the time of its own last sample,
+# so a DATA group enabled later in X-Plane's Data Output does not look like a jump from 0.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import math
+
+EARTH_RADIUS_NM = 3440.065
+DERIVED_FIELDS = ['vs_fpm', 'turn_dps', 'track_deg', 'wind_kts', 'dist_nm']
+
+def wrap180(a):
+    while a > 180.0:
+        a -= 360.0
+    while a <= -180.0:
+        a += 360.0
+    return a
+
+def haversine_nm(lat1, lon1, lat2, lon2):
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    h = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * math.asin(min(1.0, math.sqrt(h)))
+
+def bearing_deg(lat1, lon1, lat2, lon2):
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dl = math.radians(lon2 - lon1)
+    y = math.sin(dl) * math.cos(p2)
+    x = math.cos(p1) * math.sin(p2) - math.sin(p1) * math.cos(p2) * math.cos(dl)
+    return math.degrees(math.atan2(y, x)) % 360.0
+
+
+class DerivedValues():
+
+    def __init__(self, alpha=0.5, beta=0.1, ema=0.2, min_step_nm=0.005):
+        self.alpha = alpha    # alpha-beta filter gains
+        self.beta = beta
+        self.ema = ema        # weight of a new sample in the exponential moving averages
+        self.min_step_nm = min_step_nm  # a ground track needs at least this much movement
+        self.reset()
+
+    def reset(self):
+        self.t = None        # time of the last sample
+        self.alt = None      # filtered altitude (ft). None until the first sample with CG_ftmsl
+        self.alt_t = None
+        self.vs_fps = 0.0    # filtered vertical speed (ft/s)
+        self.hdg = None      # filtered true heading (degrees). None until the first sample with hding_true
+        self.hdg_t = None
+        self.turn_dps = 0.0
+        self.lat = None      # last position used for track and distance
+        self.lon = None
+        self.pos_t = None
+        self.trk_x = 0.0     # smoothed track as a unit vector (avoids the 359 -> 0 jump)
+        self.trk_y = 0.0
+        self.track_deg = 0.0
+        self.wind_kts = 0.0
+        self.dist_nm = 0.0
+        self.vs_fpm = 0.0
+        self.sample_cnt = 0
+
+    def update(self, t, fields):
+        """t: time of the sample in seconds (time.monotonic()). fields: dict like dg.GetFields()"""
+        alt = fields.get('CG_ftmsl')
+        hdg = fields.get('hding_true')
+        lat = fields.get('lat_deg')
+        lon = fields.get('lon_deg')
+        tas = fields.get('vtrue_ktas')
+        gs = fields.get('vtrue_ktgs')
+        if self.t is not None and t <= self.t:
+            return self
+        self.t = t
+        self.sample_cnt += 1
+
+        if isinstance(alt, float):
+            if self.alt is None:
+                self.alt = alt
+            else:
+                dt = t - self.alt_t
+                pred = self.alt + self.vs_fps * dt
+                r = alt - pred
+                self.alt = pred + self.alpha * r
+                self.vs_fps += self.beta * r / dt
+            self.alt_t = t
+            self.vs_fpm = self.vs_fps * 60.0
+
+        if isinstance(hdg, float):
+            if self.hdg is None:
+                self.hdg = hdg
+            else:
+                dt = t - self.hdg_t
+                pred = self.hdg + self.turn_dps * dt
+                r = wrap180(hdg - pred)
+                self.hdg = (pred + self.alpha * r) % 360.0
+                self.turn_dps += self.beta * r / dt
+            self.hdg_t = t
+
+        if isinstance(lat, float) and isinstance(lon, float):
+            if self.lat is None:
+                self.lat = lat
+                self.lon = lon
+                self.pos_t = t
+            else:
+                dt = t - self.pos_t
+                step = haversine_nm(self.lat, self.lon, lat, lon)
+                if step >= self.min_step_nm:
+                    # ignore jumps (e.g. a new flight or a position reset in X-Plane)
+                    max_step = (gs if isinstance(gs, float) else 600.0) * 2.0 * dt / 3600.0 + 0.1
+                    if step <= max_step:
+                        self.dist_nm += step
+                        b = math.radians(bearing_deg(self.lat, self.lon, lat, lon))
+                        self.trk_x += self.ema * (math.cos(b) - self.trk_x)
+                        self.trk_y += self.ema * (math.sin(b) - self.trk_y)
+                        self.track_deg = math.degrees(math.atan2(self.trk_y, self.trk_x)) % 360.0
+                    self.lat = lat
+                    self.lon = lon
+                    self.pos_t = t
+
+        if isinstance(tas, float) and isinstance(gs, float):
+            self.wind_kts += self.ema * ((tas - gs) - self.wind_kts)
+        return self
+
+    def fill(self, fields):
+        """Add the derived values to the dict fields"""
+        fields['vs_fpm'] = self.vs_fpm
+        fields['turn_dps'] = self.turn_dps
+        fields['track_deg'] = self.track_deg
+        fields['wind_kts'] = self.wind_kts
+        fields['dist_nm'] = self.dist_nm
+        return fields
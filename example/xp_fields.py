@@ -0,0 +1,89 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# The decoded X-Plane values, without any display: DATA records and XGPS packets are decoded with
+# xp_decode.py into dicts keyed by field name, and GetFields() collects them into one dict.
+# XPlaneUdpDatagram keeps its values here and adds the display; XPlaneRelay.run() uses an
+# XPlaneFields as decoder when it runs on a PC.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import time
+from xp_tables import DATA_GROUPS, CSV_TYPES
+from xp_decode import unpack_data, fill_group, unpack_csv
+from xp_derived import DerivedValues
+
+class XPlaneFields():
+
+    def __init__(self):
+        # Decoded values of the DATA groups, keyed by field name. The dicts of these groups exist from the start,
+        # those of other groups are added when the group is first received. See data_unpack()
+        self.values_structs = {}
+        for idx in (3, 17, 20, 102):
+            self.values_structs[idx] = self.new_values_struct(idx)
+        # Decoded values of the last XGPS packet. See xgps_unpack()
+        self.values_xgps = {'LON': 0.0, 'LAT': 0.0, 'ALT': 0.0, 'HDG': 0.0, 'GS': 0.0}
+        # All decoded field values by name. See GetFields()
+        self.fields = {}
+        # Vertical speed, rate of turn, track, wind component and distance flown. See xp_derived.py
+        self.derived = DerivedValues()
+        self.decode_err_cnt = 0  # packets and values that could not be decoded by DecodeFields()
+
+    def new_values_struct(self, idx):
+        # The fields of DATA group idx, with placeholders until the group is received
+        d = {'ID': ' ' * 4}
+        for name in DATA_GROUPS[idx][2]:
+            d[name] = ' ' * 4
+        return d
+
+    def data_unpack(self, payload):
+        """Decode the 36 byte records of a DATA packet (without the 5 byte prologue) into values_structs.
+        Returns the records as unpack_data()"""
+        messages = unpack_data(payload, len(payload), 0)
+        for us in messages:
+            vs = self.values_structs.get(us[0])
+            if vs is None:
+                vs = self.new_values_struct(us[0])
+                self.values_structs[us[0]] = vs
+            fill_group(vs, us)
+        return messages
+
+    def xgps_unpack(self, lst):
+        """Put the values of an XGPS packet (as returned by unpack_csv()) into values_xgps.
+        Returns the nr of values that are not a number"""
+        names = CSV_TYPES['XGPS'][0]
+        bad = 0
+        if len(lst) >= len(names):
+            for i in range(len(names)):
+                if isinstance(lst[i], float):
+                    self.values_xgps[names[i]] = lst[i]
+                else:
+                    bad += 1
+        return bad
+
+    def GetFields(self):
+        """The last decoded values of all DATA groups (and XGPS) in one dict, keyed by field name.
+        The 'ID' and 'nothing' fillers are left out. The same dict object is reused"""
+        for vs in self.values_structs.values():
+            for k, v in vs.items():
+                if k != 'ID' and not k.startswith('nothing'):
+                    self.fields[k] = v
+        for k, v in self.values_xgps.items():
+            self.fields[k] = v
+        self.derived.fill(self.fields)
+        return self.fields
+
+    def DecodeFields(self, packet, size, now=None):
+        """Decode a DATA or XGPS packet. Returns GetFields(), or None for other packets"""
+        header = packet[0:4]
+        if header == b'DATA':
+            self.data_unpack(packet[5:size])
+            self.derived.update(time.monotonic() if now is None else now, self.GetFields())
+        elif header == b'XGPS':
+            self.decode_err_cnt += self.xgps_unpack(unpack_csv(packet, size))
+        else:
+            return None
+        return self.GetFields()
@@ -0,0 +1,302 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Compact binary frame for moving already decoded X-Plane values between our devices and tools.
+#
+# Frame layout (little endian):
+#   offset  size
+#      0     2   magic b'XF'
+#      2     1   flags: bit 0 set = keyframe, bits 4..7 = FORMAT_VERSION
+#      3     2   sequence nr (ushort, wraps at 65535). Used by the receiver to detect lost frames.
+#      5     8   bitmap, bit n set = field id n (index in FIELDS) follows. Room for MAX_FIELDS field ids,
+#                so adding a field does not move the values of the frames that do not have it.
+#     13    ...  values, in field id order:
+#                keyframe: int32 = round(value * scale)
+#                other:    int16 = change of the quantized value since the previous frame.
+#                          Only fields that changed are sent.
+# A keyframe is sent every 'keyframe_interval' frames, when a change does not fit in an int16,
+# and as first frame. After a lost frame the decoder ignores delta frames until the next keyframe.
+# A frame of another FORMAT_VERSION, or with bits of field ids this side does not know, is ignored.
+# Change FORMAT_VERSION when the layout changes.
+#
+# Encoder and Decoder work in preallocated buffers and arrays. encode() and decode() do not create
+# lists, dicts or tuples. On CPython frames_to_array() decodes many frames at once with numpy array operations.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import struct
+from array import array
+
+try:
+    import numpy as np  # CPython (or ulab.numpy on some CircuitPython builds)
+except ImportError:
+    np = None
+
+# Field ids used on the wire. Append new fields at the end (at most MAX_FIELDS), never reorder.
+# Each field: (name, scale). The value sent is round(value * scale).
+FIELD_SPECS = [
+    ('vind_kias', 10), ('vind_keas', 10), ('vtrue_ktas', 10), ('vtrue_ktgs', 10),            # group 3
+    ('vind_mph', 10), ('vtrue_mphas', 10), ('vtrue_mphgs', 10),
+    ('pitch_deg', 10), ('roll_deg', 10), ('hding_true', 10), ('hding_mag', 10),               # group 17
+    ('mavar_deg', 10), ('mag_comp', 10),
+    ('lat_deg', 1000000), ('lon_deg', 1000000), ('CG_ftmsl', 10), ('gear_ftagl', 10),         # group 20
+    ('terrn_ftmsl', 10), ('p-alt_ftmsl', 10), ('lat_orign', 1000000), ('lon_orign', 1000000),
+    ('dme_nav01', 100), ('dme_mode', 1), ('dme_found', 1), ('dme_dist', 100),                  # group 102
+    ('dme_speed', 10), ('dme_time', 10), ('dme_n-typ', 1), ('dme-3_freq', 100),
+    ('LON', 1000000), ('LAT', 1000000), ('ALT', 10), ('HDG', 10), ('GS', 10),                 # XGPS
+    ('vs_fpm', 1), ('turn_dps', 100), ('track_deg', 10), ('wind_kts', 10), ('dist_nm', 100),  # xp_derived.py
+]
+
+FIELDS = []
+SCALES = []
+FIELD_IDS = {}
+for _ in range(len(FIELD_SPECS)):
+    FIELDS.append(FIELD_SPECS[_][0])
+    SCALES.append(FIELD_SPECS[_][1])
+    FIELD_IDS[FIELD_SPECS[_][0]] = _
+
+MAGIC0 = 0x58  # 'X'
+MAGIC1 = 0x46  # 'F'
+FLAG_KEYFRAME = 0x01
+FORMAT_VERSION = 1
+MAX_FIELDS = 64
+BITMAP_LEN = MAX_FIELDS // 8
+HEAD_LEN = 5 + BITMAP_LEN
+POPCOUNT = bytes(bin(_).count('1') for _ in range(256))  # nr of bits set in a bitmap byte
+# per bitmap byte: the bits of field ids not (yet) in FIELDS
+UNKNOWN_BITS = bytes((0xFF << max(0, min(8, len(FIELDS) - 8 * _))) & 0xFF for _ in range(BITMAP_LEN))
+if len(FIELDS) > MAX_FIELDS:
+    raise ValueError("xp_frame: more than {} fields".format(MAX_FIELDS))
+
+def max_frame_size(nr_fields):
+    return HEAD_LEN + 4 * nr_fields
+
+def _i16(buf, o):
+    v = buf[o] | (buf[o+1] << 8)
+    return v - 0x10000 if v & 0x8000 else v
+
+def _i32(buf, o):
+    b3 = buf[o+3]
+    if b3 & 0x80:
+        b3 -= 256
+    return buf[o] | (buf[o+1] << 8) | (buf[o+2] << 16) | (b3 << 24)
+
+
+class Encoder():
+    """Encodes the fields with ids 'ids' (see FIELD_IDS) of a dict {field name: value}"""
+
+    def __init__(self, ids, keyframe_interval=50):
+        self.ids = sorted(ids)  # values go on the wire in field id order
+        self.keyframe_interval = max(1, int(keyframe_interval))  # 0 or less: every frame is a keyframe
+        self.prev = array('l', [0] * len(ids))   # last quantized values sent
+        self.cur = array('l', [0] * len(ids))
+        self.present = bytearray(len(ids))       # 1 if the field had a numeric value in this call
+        self.sent = bytearray(len(ids))          # 1 if the field was sent in a keyframe
+        self.seq = 0
+        self.frame_cnt = 0
+        self.primed = False
+        self.buf = bytearray(max_frame_size(len(ids)))
+
+    def force_keyframe(self):
+        self.primed = False
+
+    def encode(self, fields):
+        """Encode into self.buf. Returns the nr of bytes used (0 if there is nothing to send)"""
+        ids = self.ids
+        n = len(ids)
+        key = not self.primed or self.frame_cnt % self.keyframe_interval == 0
+        for i in range(n):
+            v = fields.get(FIELDS[ids[i]])
+            if isinstance(v, (int, float)):
+                q = int(round(v * SCALES[ids[i]]))
+                self.cur[i] = q
+                self.present[i] = 1
+                d = q - self.prev[i]
+                if d > 32767 or d < -32768 or not self.sent[i]:
+                    key = True
+            else:
+                self.present[i] = 0
+        buf = self.buf
+        for i in range(5, HEAD_LEN):
+            buf[i] = 0
+        o = HEAD_LEN
+        cnt = 0
+        for i in range(n):
+            if not self.present[i]:
+                continue
+            q = self.cur[i]
+            if key:
+                struct.pack_into("<l", buf, o, q)
+                o += 4
+                self.sent[i] = 1
+            else:
+                d = q - self.prev[i]
+                if d == 0:
+                    continue
+                struct.pack_into("<h", buf, o, d)
+                o += 2
+            fid = ids[i]
+            buf[5 + (fid >> 3)] |= 1 << (fid & 7)
+            self.prev[i] = q
+            cnt += 1
+        if cnt == 0 and not key:
+            return 0  # nothing changed
+        buf[0] = MAGIC0
+        buf[1] = MAGIC1
+        buf[2] = (FORMAT_VERSION << 4) | (FLAG_KEYFRAME if key else 0)
+        buf[3] = self.seq & 0xFF
+        buf[4] = self.seq >> 8
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.frame_cnt += 1
+        if key:
+            self.primed = True
+            self.frame_cnt = 1
+        return o
+
+
+class Decoder():
+    """Keeps the last quantized value of every field. Use value() or get() to read them"""
+
+    def __init__(self):
+        self.q = array('l', [0] * len(FIELDS))
+        self.have = bytearray(len(FIELDS))
+        self.last_seq = -1
+        self.synced = False
+        self.lost_cnt = 0     # nr of frames lost (sequence gaps)
+        self.skipped_cnt = 0  # nr of delta frames ignored while waiting for a keyframe
+        self.frame_cnt = 0
+
+    def decode(self, buf, size):
+        """Apply one frame. Returns the nr of fields updated, or -1 if the frame was not applied"""
+        if size < HEAD_LEN or buf[0] != MAGIC0 or buf[1] != MAGIC1 or buf[2] >> 4 != FORMAT_VERSION:
+            return -1
+        key = buf[2] & FLAG_KEYFRAME
+        # A frame that is cut off or has bits of unknown fields changes nothing, not even the sequence nr.
+        # The next frame then shows a gap and delta frames are ignored until a keyframe, as in frames_to_array().
+        nr = 0
+        unknown = 0
+        for b in range(BITMAP_LEN):
+            nr += POPCOUNT[buf[5 + b]]
+            unknown |= buf[5 + b] & UNKNOWN_BITS[b]
+        if unknown or size < HEAD_LEN + nr * (4 if key else 2):
+            self.synced = False
+            return -1
+        seq = buf[3] | (buf[4] << 8)
+        if self.last_seq >= 0:
+            gap = (seq - self.last_seq - 1) & 0xFFFF
+            if gap:
+                self.lost_cnt += gap
+                self.synced = False
+        self.last_seq = seq
+        if key:
+            self.synced = True
+        elif not self.synced:
+            self.skipped_cnt += 1
+            return -1
+        o = HEAD_LEN
+        cnt = 0
+        for b in range(BITMAP_LEN):
+            bits = buf[5 + b]
+            if bits == 0:
+                continue
+            for j in range(8):
+                if not bits & (1 << j):
+                    continue
+                fid = (b << 3) + j
+                if key:
+                    self.q[fid] = _i32(buf, o)
+                    self.have[fid] = 1
+                    o += 4
+                else:
+                    self.q[fid] += _i16(buf, o)
+                    o += 2
+                cnt += 1
+        self.frame_cnt += 1
+        return cnt
+
+    def value(self, fid):
+        return self.q[fid] / SCALES[fid] if self.have[fid] else None
+
+    def get(self, name):
+        return self.value(FIELD_IDS[name])
+
+
+def frames_to_array(frames):
+    """
+    CPython/numpy: decode a sequence of frames (bytes objects, in order) at once, without a Python loop per frame.
+    Returns (seq, values): seq is an int array, values a float array with one row per frame
+    and one column per field in FIELDS (NaN = not yet known, or the frame was not applied).
+    A frame with a bad magic or version, cut off or with bits of unknown fields is skipped; the next frames are then out of sync
+    as after a lost frame (as Decoder.decode())
+      1. the frames are joined; headers and bitmaps are gathered with fancy indexing
+      2. every (frame, field) bit gets its byte offset from its rank in the frame (np.repeat / np.cumsum)
+      3. a delta frame is applied if the last keyframe is not older than the last sequence gap
+      4. per field: value = value in its last keyframe + cumsum of the deltas since then
+    """
+    if np is None:
+        raise ImportError("frames_to_array() needs numpy")
+    nf = len(FIELDS)
+    nr = len(frames)
+    out = np.full((nr, nf), np.nan)
+    seqs = np.zeros(nr, dtype=np.int32)
+    if nr == 0:
+        return seqs, out
+    buf = np.frombuffer(b''.join(frames) + bytes(HEAD_LEN), dtype=np.uint8)  # padded: headers of short frames
+    lens = np.fromiter((len(fr) for fr in frames), dtype=np.int64, count=nr)
+    offs = np.cumsum(lens) - lens
+    ok = (lens >= HEAD_LEN) & (buf[offs] == MAGIC0) & (buf[offs + 1] == MAGIC1) & (buf[offs + 2] >> 4 == FORMAT_VERSION)
+    key = (buf[offs + 2] & FLAG_KEYFRAME).astype(bool)
+    seq = buf[offs + 3].astype(np.int32) | (buf[offs + 4].astype(np.int32) << 8)
+    bitmaps = buf[offs[:, None] + 5 + np.arange(BITMAP_LEN)]
+    bits = np.unpackbits(bitmaps, axis=1, bitorder='little').astype(bool)
+    ok &= ~bits[:, nf:].any(axis=1)  # bits of unknown fields
+    bits = bits[:, :nf]
+    width = np.where(key, 4, 2)
+    ok &= HEAD_LEN + bits.sum(axis=1) * width <= lens  # cut off frames
+    bits &= ok[:, None]
+    seqs[ok] = seq[ok]
+
+    # sync state over the valid frames: a gap in the sequence nrs drops the sync until the next keyframe
+    v = np.nonzero(ok)[0]
+    gap = np.zeros(len(v), dtype=bool)
+    gap[1:] = ((seq[v][1:] - seq[v][:-1] - 1) & 0xFFFF) != 0
+    pos = np.arange(len(v))
+    last_key = np.maximum.accumulate(np.where(key[v], pos, -1))
+    last_gap = np.maximum.accumulate(np.where(gap, pos, -1))
+    applied = np.zeros(nr, dtype=bool)
+    applied[v] = (last_key >= 0) & (last_key >= last_gap)
+
+    # the value of every set bit, read at its offset in its frame
+    r, f = np.nonzero(bits)  # row major: per frame in field id order, as on the wire
+    counts = bits.sum(axis=1)
+    k = np.arange(len(r)) - np.repeat(np.cumsum(counts) - counts, counts)  # rank of the value in its frame
+    o = offs[r] + HEAD_LEN + k * width[r]
+    b0 = buf[o].astype(np.int64)
+    b1 = buf[o + 1].astype(np.int64)
+    kr = key[r]
+    val = np.where(kr, b0 | (b1 << 8) | (buf[o + 2].astype(np.int64) << 16) | (buf[o + 3].astype(np.int64) << 24),
+        b0 | (b1 << 8))
+    val = np.where(kr, (val ^ 0x80000000) - 0x80000000, (val ^ 0x8000) - 0x8000)  # sign extend int32 / int16
+    use = applied[r]
+
+    keyval = np.zeros((nr, nf), dtype=np.int64)
+    iskey = np.zeros((nr, nf), dtype=bool)
+    delta = np.zeros((nr, nf), dtype=np.int64)
+    m = use & kr
+    keyval[r[m], f[m]] = val[m]
+    iskey[r[m], f[m]] = True
+    m = use & ~kr
+    delta[r[m], f[m]] = val[m]
+    csum = np.cumsum(delta, axis=0)
+    last = np.maximum.accumulate(np.where(iskey, np.arange(nr)[:, None], -1), axis=0)  # row of the last keyframe
+    known = last >= 0
+    li = np.where(known, last, 0)
+    cols = np.arange(nf)
+    q = keyval[li, cols] + csum - csum[li, cols]
+    scales = np.array(SCALES, dtype=np.float64)
+    res = np.where(known, q / scales, np.nan)
+    out[applied] = res[applied]
+    return seqs, out
@@ -0,0 +1,142 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Declarative layout of the decoded flight values on the "XPlane" page.
+# A layout spec is a list of slots. Each slot binds a field (a key of dg.GetFields(),
+# of dg.values_xgps or a dataref of dr.xplaneValues) to a place on the screen:
+#
+#   {"field": "hding_mag", "kind": "digits", "digits": 3, "label": "Hdg: ", "unit": " mag", "scale": 2, "pos": [120, 40]}
+#
+#   field   str, or a list of str: the first one present in the values is used
+#   kind    "text"   a bitmap_label, text = label + fmt.format(value) + unit   (default)
+#           "digits" a DigitDisplay of 'digits' positions, only changed digits are redrawn
+#           "tape"   a HeadingTape, 'height' pixels high at the top of the page
+#   fmt     format of the value for kind "text" (default "{:.0f}")
+#   mod     kind "digits": show round(value) % mod, e.g. 360 for a heading
+#   scale   text scale (default 2)
+#   pos     center of the slot (x, y). Tapes use y as the top.
+#
+# compile() is called once at start. It creates the widgets and a binding table.
+# render() walks the binding table: no anchors, fonts or format strings are looked up per frame.
+# The spec can be read from a JSON file (setting XP_LAYOUT), see xp_layout.json.
+#type:ignore
+import displayio
+import terminalio
+from adafruit_display_text import bitmap_label
+from digit_display import DigitDisplay
+from heading_tape import HeadingTape
+
+K_TEXT = 0
+K_DIGITS = 1
+K_TAPE = 2
+KINDS = {'text': K_TEXT, 'digits': K_DIGITS, 'tape': K_TAPE}
+
+def default_spec(dme3_or_gs=False):
+    """The layout used without a layout file. The third line shows the DME-3 frequency or the groundspeed"""
+    if dme3_or_gs:
+        third = {"field": "dme-3_freq", "label": "DME3: ", "fmt": "{}", "unit": " MHz", "pos": [120, 120]}
+    else:
+        third = {"field": "vtrue_ktgs", "label": "GS: ", "unit": " kts", "pos": [120, 120]}
+    return [
+        {"field": ["hding_mag", "HDG"], "kind": "tape", "height": 22, "pos": [0, 0]},
+        {"field": "hding_mag", "kind": "digits", "digits": 3, "mod": 360, "label": "Hdg: ", "unit": " mag", "pos": [120, 40]},
+        {"field": "CG_ftmsl", "kind": "digits", "digits": 5, "label": "Alt: ", "unit": " ftMSL", "pos": [120, 80]},
+        third
+    ]
+
+def load_spec(fn, dme3_or_gs=False):
+    """Read a layout spec from the JSON file fn. Returns the default spec if fn is empty or cannot be read"""
+    if fn:
+        try:
+            import json
+            with open(fn, "r") as f:
+                spec = json.load(f)
+            if isinstance(spec, dict):
+                spec = spec.get("slots", [])
+            if len(spec) > 0:
+                return spec
+        except (OSError, ValueError) as e:
+            print("xp_layout.load_spec(): error reading \'{}\': {}. Using the default layout".format(fn, e))
+    return default_spec(dme3_or_gs)
+
+
+class XPLayout():
+
+    def __init__(self, spec, width=240, font=terminalio.FONT):
+        self.group = displayio.Group()        # all widgets
+        self.text_group = displayio.Group()   # widgets of kind text and digits (hidden while XGPS data is shown)
+        self.group.append(self.text_group)
+        self.bindings = []  # [kind, widget, keys, fmt, last value, mod]
+        self.compile(spec, width, font)
+
+    def compile(self, spec, width, font):
+        for slot in spec:
+            field = slot.get("field")
+            if field is None:
+                continue
+            keys = (field,) if isinstance(field, str) else tuple(field)
+            kind = KINDS.get(slot.get("kind", "text"), K_TEXT)
+            pos = slot.get("pos", [width // 2, 40])
+            sc = slot.get("scale", 2)
+            label = slot.get("label", "")
+            unit = slot.get("unit", "")
+            fmt = None
+            if kind == K_TAPE:
+                w = HeadingTape(width, slot.get("height", 22), font=font)
+                w.x = pos[0]
+                w.y = pos[1]
+                self.group.append(w)
+            elif kind == K_DIGITS:
+                w = DigitDisplay(slot.get("digits", 3), label, unit, font=font, scale=sc)
+                w.center_on(pos[0], pos[1])
+                self.text_group.append(w)
+            else:
+                # label, format and unit are joined once: render() does one format() call
+                fmt = label.replace('{', '{{').replace('}', '}}') + slot.get("fmt", "{:.0f}") + unit.replace('{', '{{').replace('}', '}}')
+                w = bitmap_label.Label(font, text='', scale=sc)
+                w.anchor_point = (0.5, 0.5)
+                w.anchored_position = (pos[0], pos[1])
+                self.text_group.append(w)
+            self.bindings.append([kind, w, keys, fmt, None, slot.get("mod", 0)])
+
+    def fields(self):
+        """The keys used by this layout"""
+        lst = []
+        for b in self.bindings:
+            for k in b[2]:
+                if k not in lst:
+                    lst.append(k)
+        return lst
+
+    def render(self, values):
+        """Show the values of the bound fields present in the dict values. Returns True if a widget changed"""
+        changed = False
+        for b in self.bindings:
+            v = None
+            for k in b[2]:
+                v = values.get(k)
+                if v is not None and not isinstance(v, str):  # str: a DUMMY value, not received yet
+                    break
+                v = None
+            if v is None or v == b[4]:
+                continue
+            b[4] = v
+            kind = b[0]
+            if kind == K_DIGITS:
+                if b[5]:
+                    v = round(v) % b[5]
+                changed = b[1].set_value(v) or changed
+            elif kind == K_TAPE:
+                changed = b[1].set_heading(v) or changed
+            else:
+                t = b[3].format(v)
+                if b[1].text != t:
+                    b[1].text = t
+                    changed = True
+        return changed
+
+    def show_text(self, show):
+        self.text_group.hidden = not show
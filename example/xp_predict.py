@@ -0,0 +1,89 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Dead-reckoning of heading, altitude and position between two X-Plane packets.
+# sample() stores the last real values and rates. predict() extrapolates them to 'now'.
+# When a new sample arrives, the difference between what was shown and the real value
+# is not applied at once: it is blended out during 'blend_t' seconds, so the display
+# does not jump back. Extrapolation stops after 'max_extrap_t' seconds without packets.
+#
+# Rates used:
+#   heading:  yaw rate R_rad (rad/s) of DATA group 16 (angular velocities) if X-Plane sends that group,
+#             otherwise the rate of turn of xp_derived.DerivedValues.
+#   altitude: vertical speed of xp_derived.DerivedValues.
+#   position: groundspeed (kts) along the ground track.
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import math
+
+class Predictor():
+
+    def __init__(self, blend_t=0.5, max_extrap_t=2.0):
+        self.blend_t = blend_t
+        self.max_extrap_t = max_extrap_t
+        self.valid = False
+        self.t = 0.0
+        self.hdg = 0.0       # values of the last sample
+        self.alt = 0.0
+        self.lat = 0.0
+        self.lon = 0.0
+        self.hdg_rate = 0.0  # degrees/s
+        self.vs = 0.0        # ft/s
+        self.gs = 0.0        # kts
+        self.trk = 0.0       # degrees
+        self.err_hdg = 0.0   # shown minus real at the moment of the last sample
+        self.err_alt = 0.0
+        self.err_lat = 0.0
+        self.err_lon = 0.0
+        # results of the last predict()
+        self.p_hdg = 0.0
+        self.p_alt = 0.0
+        self.p_lat = 0.0
+        self.p_lon = 0.0
+
+    def sample(self, t, hdg, alt, hdg_rate_dps, vs_fps, lat=None, lon=None, gs_kts=0.0, trk_deg=0.0):
+        if self.valid:
+            self.predict(t)
+            d = (self.p_hdg - hdg) % 360.0
+            self.err_hdg = d - 360.0 if d > 180.0 else d
+            self.err_alt = self.p_alt - alt
+            if lat is not None:
+                self.err_lat = self.p_lat - lat
+                self.err_lon = self.p_lon - lon
+        self.t = t
+        self.hdg = hdg
+        self.alt = alt
+        self.hdg_rate = hdg_rate_dps
+        self.vs = vs_fps
+        if lat is not None:
+            self.lat = lat
+            self.lon = lon
+        self.gs = gs_kts
+        self.trk = trk_deg
+        self.valid = True
+
+    def predict(self, now):
+        """Fill p_hdg, p_alt, p_lat and p_lon for time 'now'. Returns False if there is no sample yet"""
+        if not self.valid:
+            return False
+        dt = now - self.t
+        if dt < 0.0:
+            dt = 0.0
+        elif dt > self.max_extrap_t:
+            dt = self.max_extrap_t
+        f = 1.0 - dt / self.blend_t if dt < self.blend_t else 0.0  # weight of the old error
+        self.p_hdg = (self.hdg + self.hdg_rate * dt + self.err_hdg * f) % 360.0
+        self.p_alt = self.alt + self.vs * dt + self.err_alt * f
+        nm = self.gs * dt / 3600.0
+        trk = math.radians(self.trk)
+        self.p_lat = self.lat + nm * math.cos(trk) / 60.0 + self.err_lat * f
+        coslat = math.cos(math.radians(self.lat))
+        if coslat > 0.01:
+            self.p_lon = self.lon + nm * math.sin(trk) / (60.0 * coslat) + self.err_lon * f
+        else:
+            self.p_lon = self.lon
+        return True
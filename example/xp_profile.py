@@ -0,0 +1,105 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Profiling of named functions on the device (there is no cProfile in CircuitPython).
+# Functions of the receive pipeline are decorated with @profile. Only the functions listed in the
+# PROFILE_FUNCS setting (e.g. "DecodePacket,msgs_unpack,disp_hdg_alt") are wrapped; for all other
+# functions, and for all functions when PROFILE_FUNCS is empty, @profile returns the function itself.
+# PROFILE_FUNCS is read when this module is imported, i.e. before the classes are defined.
+#
+# Per function, in arrays allocated at import:
+#   calls      nr of calls
+#   total_ns   time inside the function, including the functions it calls (time.monotonic_ns())
+#   max_ns     longest call
+#   alloc      bytes allocated on the heap during the calls (gc.mem_alloc(); 0 in CPython).
+#              A call during which the garbage collector ran is not counted.
+# The time and allocation of the wrapper itself are measured once at import and subtracted by dump().
+# dump() prints the table; it is called with the serial summary of stats.py, or from the REPL:
+#   import xp_profile; xp_profile.dump()
+# This module does not import common.py so that it can be used outside CircuitPython.
+import os
+import sys
+import time
+import gc
+from array import array
+
+def parse_names(s):
+    if not s:
+        return ()
+    return tuple(n.strip() for n in s.split(',') if n.strip())
+
+NAMES = parse_names(os.getenv("PROFILE_FUNCS"))
+N = len(NAMES)
+
+# slot N is used by _calibrate()
+calls = array('L', [0] * (N + 1))
+total_ns = array('Q', [0] * (N + 1))
+max_ns = array('Q', [0] * (N + 1))
+alloc = array('Q', [0] * (N + 1))
+alloc_cnt = array('L', [0] * (N + 1))  # calls with a valid allocation delta
+
+_monotonic_ns = time.monotonic_ns
+
+def _no_mem_alloc():
+    return 0
+
+_mem_alloc = getattr(gc, "mem_alloc", _no_mem_alloc)
+
+def _wrap(func, i):
+    def wrapper(*args, **kwargs):
+        a0 = _mem_alloc()
+        t0 = _monotonic_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            dt = _monotonic_ns() - t0
+            da = _mem_alloc() - a0
+            calls[i] += 1
+            total_ns[i] += dt
+            if dt > max_ns[i]:
+                max_ns[i] = dt
+            if da >= 0:
+                alloc[i] += da
+                alloc_cnt[i] += 1
+    return wrapper
+
+def profile(func):
+    """Decorator. Returns func itself unless its name is in PROFILE_FUNCS"""
+    name = func.__name__
+    if name not in NAMES:
+        return func
+    return _wrap(func, NAMES.index(name))
+
+def _calibrate(n=20):
+    """Time and bytes per call of the wrapper around an empty function"""
+    f = _wrap(lambda: None, N)
+    for _ in range(n):
+        f()
+    base_ns = total_ns[N] // n
+    base_alloc = alloc[N] // alloc_cnt[N] if alloc_cnt[N] else 0
+    return base_ns, base_alloc
+
+BASE_NS, BASE_ALLOC = _calibrate() if N else (0, 0)
+
+def reset():
+    for i in range(N):
+        calls[i] = 0
+        total_ns[i] = 0
+        max_ns[i] = 0
+        alloc[i] = 0
+        alloc_cnt[i] = 0
+
+def dump(file=sys.stdout):
+    if not N:
+        return
+    print("profile: {:16s} {:>8s} {:>10s} {:>9s} {:>9s} {:>8s}".format(
+        'function', 'calls', 'total ms', 'mean us', 'max us', 'B/call'), file=file)
+    for i in range(N):
+        c = calls[i]
+        t = max(total_ns[i] - BASE_NS * c, 0)
+        a = max(alloc[i] // alloc_cnt[i] - BASE_ALLOC, 0) if alloc_cnt[i] else 0
+        print("profile: {:16s} {:8d} {:10.1f} {:9.1f} {:9.1f} {:8d}".format(
+            NAMES[i], c, t / 1e6, t / c / 1e3 if c else 0.0, max_ns[i] / 1e3, a), file=file)
@@ -0,0 +1,56 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Generated by tools/xp_gen.py from tools/xp_schema.json. Do not edit: change the schema and run
+#   python tools/xp_gen.py
+#
+# DATA_GROUPS: key = DATA group index,
+#   value = (title, struct format of the 36 byte record (index + 8 values), field names, units)
+# CSV_TYPES: key = header of a packet of comma separated values,
+#   value = (labels, units) of the values after the header
+#type:ignore
+
+DATA_GROUPS = {
+    0: ('Frame rate', '<iffffffff',
+        ('f_act_sec', 'f_sim_sec', 'nothing', 'frame_time', 'cpu_time', 'gpu_time', 'grnd_ratio', 'flit_ratio'),
+        ('/sec', '/sec', '', 's', 's', 's', '', '')),
+    1: ('Times', '<iffffffff',
+        ('real_time', 'totl_time', 'missn_time', 'timer_time', 'nothing', 'zulu_time', 'local_time', 'hobbs_time'),
+        ('s', 's', 's', 's', '', 'h', 'h', 'h')),
+    3: ('Speeds', '<iffffifff',
+        ('vind_kias', 'vind_keas', 'vtrue_ktas', 'vtrue_ktgs', 'nothing', 'vind_mph', 'vtrue_mphas', 'vtrue_mphgs'),
+        ('kts', 'kts', 'kts', 'kts', '', 'mph', 'mph', 'mph')),
+    4: ('Mach, VVI, g-load', '<iffffffff',
+        ('mach_ratio', 'nothing', 'vvi_fpm', 'nothing1', 'gload_norml', 'gload_axial', 'gload_side', 'nothing2'),
+        ('', '', 'ft/min', '', 'G', 'G', 'G', '')),
+    16: ('Angular velocities', '<iffffffff',
+        ('Q_rad', 'P_rad', 'R_rad', 'nothing', 'nothing1', 'nothing2', 'nothing3', 'nothing4'),
+        ('rad/s', 'rad/s', 'rad/s', '', '', '', '', '')),
+    17: ('Pitch, roll, & headings', '<ifffiffif',
+        ('pitch_deg', 'roll_deg', 'hding_true', 'nothing1', 'hding_mag', 'mavar_deg', 'nothing2', 'mag_comp'),
+        ('deg', 'deg', 'deg', '', 'deg', 'deg', '', 'deg')),
+    18: ('AoA, side-slip, & paths', '<iffffffff',
+        ('alpha_deg', 'beta_deg', 'hpath_deg', 'vpath_deg', 'nothing', 'nothing1', 'nothing2', 'slip_deg'),
+        ('deg', 'deg', 'deg', 'deg', '', '', '', 'deg')),
+    20: ('Latitude, longitude, & altitude', '<iffffffff',
+        ('lat_deg', 'lon_deg', 'CG_ftmsl', 'gear_ftagl', 'terrn_ftmsl', 'p-alt_ftmsl', 'lat_orign', 'lon_orign'),
+        ('deg', 'deg', 'ft', 'ft', 'ft', 'ft', 'deg', 'deg')),
+    21: ('Location, velocity, & distance traveled', '<iffffffff',
+        ('x_m', 'y_m', 'z_m', 'vX_ms', 'vY_ms', 'vZ_ms', 'trav_ft', 'trav_nm'),
+        ('m', 'm', 'm', 'm/s', 'm/s', 'm/s', 'ft', 'nm')),
+    102: ('dme', '<iffffffii',
+        ('dme_nav01', 'dme_mode', 'dme_found', 'dme_dist', 'dme_speed', 'dme_time', 'dme_n-typ', 'dme-3_freq'),
+        ('', '', '', 'nm', 'kts', 'min', '', '')),
+}
+
+CSV_TYPES = {
+    'XATT': (('HDG', 'PITCH', 'ROLL', 'Roll-rate', 'Pitch-rate', 'Yaw-rate', 'SPD_TRUE_EAST', 'SPD_TRUE_UP', 'SPD_TRUE_SOUTH', 'G-Load side', 'G-Load normal', 'G-Load axial'),
+        ('true', 'degs', 'degs', 'rad/s', 'rad/s', 'rad/s', 'm/s', 'm/s', 'm/s', 'G', 'G', 'G')),
+    'XGPS': (('LON', 'LAT', 'ALT', 'HDG', 'GS'),
+        ('', '', 'm', 'true', 'm/s')),
+    'XTRA': (('LAT', 'LON', 'ALT', 'V/S', 'ON_GND', 'HDG', 'GS', 'TAIL NR'),
+        ('', '', 'ft', 'ft/min', 'True/False', 'true', 'kts', '')),
+}
@@ -0,0 +1,263 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Compressed time series for the flight recorder (see flight_recorder.py), after the
+# "Gorilla" encoding of Facebook's time series database:
+#   time stamps  integer milliseconds since the start of the block, stored as delta-of-delta:
+#                  '0'                          delta equal to the previous delta
+#                  '10'   +  7 bits             delta-of-delta in [-63, 64]
+#                  '110'  +  9 bits             [-255, 256]
+#                  '1110' + 12 bits             [-2047, 2048]
+#                  '1111' + 32 bits             anything else
+#   values       float32 bits, per channel XOR-ed with the previous value of the channel:
+#                  '0'                          same value
+#                  '10'   + meaningful bits     the XOR fits within the leading/trailing zeros of the previous XOR
+#                  '11'   + 5 bits leading zeros + 5 bits (length - 1) + meaningful bits
+# The first sample of a block has time 0 and its values are stored as 32 bits each.
+# Each block starts with a fresh encoder state, so a block can be decoded on its own.
+#
+# BlockEncoder writes into a preallocated bytearray and keeps the bits in a small int, so on
+# CircuitPython it does not allocate big ints. decode_block() is used on the PC (and works on the device).
+#
+# This module does not import common.py so that it can be used outside CircuitPython.
+#type:ignore
+import struct
+
+def clz32(x):
+    """Nr of leading zero bits of the 32 bit int x (x > 0)"""
+    n = 0
+    if x <= 0x0000FFFF:
+        n += 16
+        x <<= 16
+    if x <= 0x00FFFFFF:
+        n += 8
+        x <<= 8
+    if x <= 0x0FFFFFFF:
+        n += 4
+        x <<= 4
+    if x <= 0x3FFFFFFF:
+        n += 2
+        x <<= 2
+    if x <= 0x7FFFFFFF:
+        n += 1
+    return n
+
+def ctz32(x):
+    """Nr of trailing zero bits of the 32 bit int x (x > 0)"""
+    n = 0
+    if x & 0xFFFF == 0:
+        n += 16
+        x >>= 16
+    if x & 0xFF == 0:
+        n += 8
+        x >>= 8
+    if x & 0xF == 0:
+        n += 4
+        x >>= 4
+    if x & 0x3 == 0:
+        n += 2
+        x >>= 2
+    if x & 0x1 == 0:
+        n += 1
+    return n
+
+
+class BitWriter():
+
+    def __init__(self, buf, ofs=0):
+        self.buf = buf
+        self.start = ofs
+        self.pos = ofs   # next byte to write
+        self.acc = 0     # bits not yet written, at most 7 + 16
+        self.nacc = 0
+
+    def write(self, v, n):
+        """Write the n lowest bits of v (n <= 32), most significant bit first"""
+        if n > 16:
+            self.write(v >> 16, n - 16)
+            v &= 0xFFFF
+            n = 16
+        self.acc = (self.acc << n) | (v & ((1 << n) - 1))
+        self.nacc += n
+        while self.nacc >= 8:
+            self.nacc -= 8
+            self.buf[self.pos] = (self.acc >> self.nacc) & 0xFF
+            self.pos += 1
+        self.acc &= (1 << self.nacc) - 1
+
+    def bits(self):
+        return (self.pos - self.start) * 8 + self.nacc
+
+    def finish(self):
+        """Write the last bits. Returns the nr of bytes written"""
+        if self.nacc > 0:
+            self.buf[self.pos] = (self.acc << (8 - self.nacc)) & 0xFF
+            self.pos += 1
+            self.acc = 0
+            self.nacc = 0
+        return self.pos - self.start
+
+
+class BitReader():
+
+    def __init__(self, buf, ofs=0):
+        self.buf = buf
+        self.pos = ofs
+        self.acc = 0
+        self.nacc = 0
+
+    def read(self, n):
+        if n > 16:
+            hi = self.read(n - 16)
+            return (hi << 16) | self.read(16)
+        while self.nacc < n:
+            self.acc = (self.acc << 8) | self.buf[self.pos]
+            self.pos += 1
+            self.nacc += 8
+        self.nacc -= n
+        v = (self.acc >> self.nacc) & ((1 << n) - 1)
+        self.acc &= (1 << self.nacc) - 1
+        return v
+
+
+class BlockEncoder():
+
+    def __init__(self, nr_channels):
+        self.nr_channels = nr_channels
+        self.prev_v = [0] * nr_channels
+        self.prev_lz = [0] * nr_channels
+        self.prev_tz = [0] * nr_channels
+        self.scratch = bytearray(4)
+        # bits of a sample in the worst case: time stamp and every value with a new window
+        self.max_sample_bits = 36 + nr_channels * (2 + 5 + 5 + 32)
+        self.w = None
+
+    def start(self, buf, ofs, end):
+        """Start a block in buf[ofs:end]"""
+        self.w = BitWriter(buf, ofs)
+        self.end_bits = (end - ofs) * 8
+        self.nr_samples = 0
+        self.prev_t = 0
+        self.prev_delta = 0
+        for i in range(self.nr_channels):
+            self.prev_lz[i] = 33  # no window yet
+            self.prev_tz[i] = 0
+
+    def room(self):
+        """True if one more sample fits in the block"""
+        return self.w.bits() + self.max_sample_bits <= self.end_bits
+
+    def add(self, t_ms, values):
+        """Add a sample: t_ms (int, ms since the start of the block) and one float per channel.
+        Returns False if it does not fit"""
+        if not self.room():
+            return False
+        w = self.w
+        if self.nr_samples > 0:
+            delta = t_ms - self.prev_t
+            dod = delta - self.prev_delta
+            if dod == 0:
+                w.write(0, 1)
+            elif -63 <= dod <= 64:
+                w.write(0b10, 2)
+                w.write(dod + 63, 7)
+            elif -255 <= dod <= 256:
+                w.write(0b110, 3)
+                w.write(dod + 255, 9)
+            elif -2047 <= dod <= 2048:
+                w.write(0b1110, 4)
+                w.write(dod + 2047, 12)
+            else:
+                w.write(0b1111, 4)
+                w.write(dod & 0xFFFFFFFF, 32)
+            self.prev_delta = delta
+        self.prev_t = t_ms
+        for i in range(self.nr_channels):
+            struct.pack_into("<f", self.scratch, 0, values[i])
+            v = struct.unpack_from("<I", self.scratch, 0)[0]
+            if self.nr_samples == 0:
+                w.write(v, 32)
+            else:
+                x = v ^ self.prev_v[i]
+                if x == 0:
+                    w.write(0, 1)
+                else:
+                    lz = clz32(x)
+                    tz = ctz32(x)
+                    if lz > 31:
+                        lz = 31
+                    plz = self.prev_lz[i]
+                    ptz = self.prev_tz[i]
+                    if plz <= 32 and lz >= plz and tz >= ptz:
+                        w.write(0b10, 2)
+                        w.write(x >> ptz, 32 - plz - ptz)
+                    else:
+                        sig = 32 - lz - tz
+                        w.write(0b11, 2)
+                        w.write(lz, 5)
+                        w.write(sig - 1, 5)
+                        w.write(x >> tz, sig)
+                        self.prev_lz[i] = lz
+                        self.prev_tz[i] = tz
+            self.prev_v[i] = v
+        self.nr_samples += 1
+        return True
+
+    def finish(self):
+        """Returns the nr of bytes of the block"""
+        return self.w.finish()
+
+
+def decode_block(buf, ofs, nr_channels, nr_samples):
+    """Returns a list of samples (t_ms, value, value, ...) of a block written by BlockEncoder"""
+    r = BitReader(buf, ofs)
+    scratch = bytearray(4)
+    prev_v = [0] * nr_channels
+    prev_lz = [33] * nr_channels
+    prev_tz = [0] * nr_channels
+    t = 0
+    delta = 0
+    out = []
+    for n in range(nr_samples):
+        if n > 0:
+            if r.read(1) == 0:
+                dod = 0
+            elif r.read(1) == 0:
+                dod = r.read(7) - 63
+            elif r.read(1) == 0:
+                dod = r.read(9) - 255
+            elif r.read(1) == 0:
+                dod = r.read(12) - 2047
+            else:
+                dod = r.read(32)
+                if dod >= 0x80000000:
+                    dod -= 0x100000000
+            delta += dod
+            t += delta
+        sample = [t]
+        for i in range(nr_channels):
+            if n == 0:
+                v = r.read(32)
+            elif r.read(1) == 0:
+                v = prev_v[i]
+            else:
+                if r.read(1) == 0:
+                    plz = prev_lz[i]
+                    ptz = prev_tz[i]
+                    x = r.read(32 - plz - ptz) << ptz
+                else:
+                    lz = r.read(5)
+                    sig = r.read(5) + 1
+                    tz = 32 - lz - sig
+                    x = r.read(sig) << tz
+                    prev_lz[i] = lz
+                    prev_tz[i] = tz
+                v = prev_v[i] ^ x
+            prev_v[i] = v
+            struct.pack_into("<I", scratch, 0, v)
+            sample.append(struct.unpack_from("<f", scratch, 0)[0])
+        out.append(tuple(sample))
+    return out
@@ -0,0 +1,154 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Per flight statistics of recorded sessions (capture files, see xp_capture.py), computed with NumPy
+# array operations on the decoded fields (see xp_np_decode.py). There is no Python loop per sample.
+#   alt_min/alt_max   CG_ftmsl (ft)
+#   hdg_rate          mean and max absolute rate of change of hding_mag (deg/s), after unwrapping at 360
+#   climb/cruise/descent  minutes airborne with vertical speed above +CLIMB_FPM, in between, below -CLIMB_FPM.
+#                     Vertical speed is vvi_fpm (group 4) if recorded, else the derivative of CG_ftmsl.
+#                     Airborne: gear_ftagl above GROUND_FT (group 20); all samples if it is not recorded.
+#   dist_nm           great circle distance along lat_deg/lon_deg (vectorized haversine)
+#   landing_fpm       vertical speed in the LANDING_S seconds before each touchdown (gear_ftagl dropping
+#                     to GROUND_FT), the last landing of the session is shown
+#
+#   python tools/xp_analytics.py session1.xpcap session2.xpcap ...     [--csv summary.csv]
+import argparse
+import os
+import sys
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from xp_np_decode import decode_file, fields_table  # noqa: E402
+
+CLIMB_FPM = 300.0
+GROUND_FT = 5.0
+LANDING_S = 2.0
+EARTH_NM = 3440.065  # mean earth radius in nautical miles
+MAX_GAP_S = 5.0      # a longer gap between two packets is not counted as flight time
+
+USED = ('CG_ftmsl', 'hding_mag', 'vvi_fpm', 'gear_ftagl', 'lat_deg', 'lon_deg')  # fields the statistics use
+
+COLUMNS = ('session', 'duration_min', 'alt_min', 'alt_max', 'hdg_rate_mean', 'hdg_rate_max',
+    'climb_min', 'cruise_min', 'descent_min', 'dist_nm', 'landings', 'landing_fpm')
+
+def haversine_nm(lat, lon):
+    """Distances (nm) between consecutive points of the arrays lat, lon (degrees)"""
+    la = np.radians(lat)
+    lo = np.radians(lon)
+    dla = np.diff(la)
+    dlo = np.diff(lo)
+    a = np.sin(dla / 2) ** 2 + np.cos(la[:-1]) * np.cos(la[1:]) * np.sin(dlo / 2) ** 2
+    return 2 * EARTH_NM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def column(cols, name, n):
+    c = cols.get(name)
+    return c if c is not None else np.full(n, np.nan)
+
+def summarize(t, cols):
+    """Statistics of one session. t: times (s), cols: {field name: array} as returned by xp_np_decode.fields_table().
+    Rows of packets without any of the USED fields (e.g. a packet with only engine groups) are left out"""
+    keep = np.zeros(len(t), dtype=bool)
+    for name in USED:
+        if name in cols:
+            keep |= np.isfinite(cols[name])
+    if not keep.all():
+        t = t[keep]
+        cols = {k: v[keep] for k, v in cols.items()}
+    n = len(t)
+    s = dict.fromkeys(COLUMNS[1:], float('nan'))
+    s['landings'] = 0
+    if n < 2:
+        return s
+    dt = np.diff(t)
+    dt = np.where((dt > 0) & (dt <= MAX_GAP_S), dt, 0.0)  # time of each sample interval
+    s['duration_min'] = dt.sum() / 60.0
+
+    alt = column(cols, 'CG_ftmsl', n)
+    if np.isfinite(alt).any():
+        s['alt_min'] = np.nanmin(alt)
+        s['alt_max'] = np.nanmax(alt)
+
+    hdg = column(cols, 'hding_mag', n)
+    ok = np.isfinite(hdg)
+    if ok.sum() > 1:
+        h = np.degrees(np.unwrap(np.radians(hdg[ok])))
+        th = t[ok]
+        dth = np.diff(th)
+        good = (dth > 0) & (dth <= MAX_GAP_S)
+        rate = np.abs(np.diff(h)[good] / dth[good])
+        if len(rate):
+            s['hdg_rate_mean'] = rate.mean()
+            s['hdg_rate_max'] = rate.max()
+
+    vs = column(cols, 'vvi_fpm', n)
+    if not np.isfinite(vs).any() and np.isfinite(alt).sum() > 1:
+        ok = np.isfinite(alt)
+        vs = np.full(n, np.nan)
+        vs[ok] = np.gradient(alt[ok], t[ok]) * 60.0
+    agl = column(cols, 'gear_ftagl', n)
+    airborne = agl > GROUND_FT if np.isfinite(agl).any() else np.ones(n, dtype=bool)
+    v = vs[:-1]
+    air = airborne[:-1] & np.isfinite(v)
+    s['climb_min'] = dt[air & (v > CLIMB_FPM)].sum() / 60.0
+    s['descent_min'] = dt[air & (v < -CLIMB_FPM)].sum() / 60.0
+    s['cruise_min'] = dt[air & (np.abs(v) <= CLIMB_FPM)].sum() / 60.0
+
+    lat = column(cols, 'lat_deg', n)
+    lon = column(cols, 'lon_deg', n)
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    if ok.sum() > 1:
+        d = haversine_nm(lat[ok], lon[ok])
+        tl = t[ok]
+        dtl = np.diff(tl)
+        s['dist_nm'] = d[(dtl > 0) & (dtl <= MAX_GAP_S)].sum()
+
+    if np.isfinite(agl).any():
+        td = np.nonzero(airborne[:-1] & ~airborne[1:] & np.isfinite(agl[1:]))[0] + 1  # first sample on the ground
+        s['landings'] = len(td)
+        if len(td) and np.isfinite(vs).any():
+            last = td[-1]
+            win = (t > t[last] - LANDING_S) & (t <= t[last]) & np.isfinite(vs)
+            if win.any():
+                s['landing_fpm'] = vs[win].min()  # the sink rate at touchdown is negative
+    return s
+
+def summarize_file(path):
+    t, cols = fields_table(decode_file(path))
+    s = summarize(t, cols)
+    s['session'] = os.path.basename(path)
+    return s
+
+def format_table(rows):
+    head = "{:24s} {:>7s} {:>7s} {:>7s} {:>6s} {:>6s} {:>6s} {:>6s} {:>6s} {:>8s} {:>4s} {:>7s}".format(
+        'session', 'min', 'alt lo', 'alt hi', 'hdg/s', 'max/s', 'climb', 'cruise', 'desc', 'dist nm', 'ldg', 'ldg fpm')
+    out = [head]
+    for r in rows:
+        out.append("{:24s} {:7.1f} {:7.0f} {:7.0f} {:6.2f} {:6.1f} {:6.1f} {:6.1f} {:6.1f} {:8.1f} {:4d} {:7.0f}".format(
+            r['session'][:24], r['duration_min'], r['alt_min'], r['alt_max'], r['hdg_rate_mean'], r['hdg_rate_max'],
+            r['climb_min'], r['cruise_min'], r['descent_min'], r['dist_nm'], r['landings'], r['landing_fpm']))
+    return "\n".join(out)
+
+def write_csv(path, rows):
+    with open(path, "w") as f:
+        f.write(",".join(COLUMNS) + "\n")
+        for r in rows:
+            f.write(",".join(str(r[c]) for c in COLUMNS) + "\n")
+
+def main(argv):
+    ap = argparse.ArgumentParser(description="Flight statistics of X-Plane capture files")
+    ap.add_argument("paths", nargs="+")
+    ap.add_argument("--csv", default=None, help="also write the table to this CSV file")
+    args = ap.parse_args(argv[1:])
+    rows = [summarize_file(p) for p in args.paths]
+    print(format_table(rows))
+    if args.csv:
+        write_csv(args.csv, rows)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,168 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Decodes and summarizes a directory tree of capture files (see xp_capture.py) on all CPU cores.
+# Each capture file is one task of a concurrent.futures.ProcessPoolExecutor; a task decodes the file
+# (xp_np_decode.py, the group layouts of XPlaneUdpDatagram) and computes its statistics (xp_analytics.py).
+# The results are sorted by path, so the output does not depend on the order the tasks finish.
+#
+# Results are cached in CACHE_NAME in the directory, keyed by the sha256 of the file contents.
+# A file whose size and modification time did not change is not even read again. The cache is
+# dropped when the decoder tables (xp_tables.py), the parameters of xp_analytics.py or CACHE_VERSION change.
+# A file that cannot be read or decoded is reported on stderr and gets a row without values;
+# the other files are still analyzed and cached. Failures are not cached.
+#
+#   python tools/xp_batch.py captures/ [--jobs 8] [--csv summary.csv] [--no-cache]
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "example"))
+from xp_tables import DATA_GROUPS  # noqa: E402
+import xp_analytics  # noqa: E402
+from xp_analytics import COLUMNS, summarize_file, format_table, write_csv  # noqa: E402
+
+CACHE_NAME = ".xp_batch_cache.json"
+CACHE_VERSION = 2
+PATTERN = ".xpcap"
+
+def params_hash():
+    """Changes when the decoded layouts or the thresholds of the statistics change"""
+    a = xp_analytics
+    params = (sorted(DATA_GROUPS.items()), a.CLIMB_FPM, a.GROUND_FT, a.LANDING_S, a.EARTH_NM, a.MAX_GAP_S)
+    return hashlib.sha256(repr(params).encode()).hexdigest()[:16]
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def find_captures(top, suffix=PATTERN):
+    out = []
+    for d, dirs, files in os.walk(top):
+        dirs.sort()
+        for fn in sorted(files):
+            if fn.endswith(suffix):
+                out.append(os.path.join(d, fn))
+    return out
+
+def failed_row(error):
+    r = dict.fromkeys(COLUMNS[1:], float('nan'))
+    r['landings'] = 0
+    r['error'] = error
+    return r
+
+def analyze(path):
+    """The task run in a worker process. Returns the summary with plain Python numbers (for JSON),
+    or {'error': message} if the file cannot be analyzed"""
+    try:
+        s = summarize_file(path)
+    except Exception as e:  # one bad capture must not stop the other tasks
+        return {'error': "{}: {}".format(type(e).__name__, e)}
+    for k, v in s.items():
+        if not isinstance(v, str):
+            s[k] = int(v) if k == 'landings' else float(v)
+    return s
+
+def new_cache():
+    return {"version": CACHE_VERSION, "params": params_hash(), "files": {}, "results": {}}
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            c = json.load(f)
+        if c.get("version") == CACHE_VERSION and c.get("params") == params_hash():
+            return c
+    except (OSError, ValueError):
+        pass
+    return new_cache()
+
+def save_cache(path, cache):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=0, sort_keys=True)
+    os.replace(tmp, path)
+
+def run(top, jobs=None, use_cache=True):
+    """Returns the summaries of all capture files under top, sorted by path, and the nr of files analyzed.
+    The row of a file that failed has NaN values and its 'error'"""
+    paths = find_captures(top)
+    cache_path = os.path.join(top, CACHE_NAME)
+    cache = load_cache(cache_path) if use_cache else new_cache()
+    files = cache["files"]      # key = path relative to top, value = [size, mtime_ns, sha256]
+    results = cache["results"]  # key = sha256, value = summary
+    todo = []
+    pending = set()
+    hashes = {}
+    errors = {}  # key = path of a file that cannot be read, value = message
+    failed = {}  # key = sha256 of a file that cannot be analyzed, value = message
+    for p in paths:
+        rel = os.path.relpath(p, top)
+        try:
+            st = os.stat(p)
+            f = files.get(rel)
+            if f is not None and f[0] == st.st_size and f[1] == st.st_mtime_ns:
+                h = f[2]
+            else:
+                h = file_hash(p)
+                files[rel] = [st.st_size, st.st_mtime_ns, h]
+        except OSError as e:
+            errors[p] = "{}: {}".format(type(e).__name__, e)
+            files.pop(rel, None)
+            continue
+        hashes[p] = h
+        if h not in results and h not in pending:  # files with the same contents are analyzed once
+            todo.append(p)
+            pending.add(h)
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            for p, s in zip(todo, ex.map(analyze, todo)):
+                if 'error' in s:
+                    failed[hashes[p]] = s['error']
+                else:
+                    results[hashes[p]] = s
+    rows = []
+    for p in paths:
+        rel = os.path.relpath(p, top)
+        h = hashes.get(p)
+        if h in results:
+            r = dict(results[h])
+        else:
+            r = failed_row(errors[p] if h is None else failed[h])
+            print("xp_batch: {}: {}".format(rel, r['error']), file=sys.stderr)
+        r['session'] = rel
+        rows.append(r)
+    live = set(hashes.values())
+    cache["results"] = {h: r for h, r in results.items() if h in live}
+    cache["files"] = {os.path.relpath(p, top): files[os.path.relpath(p, top)] for p in hashes}
+    if use_cache:
+        save_cache(cache_path, cache)
+    return rows, len(todo)
+
+def main(argv):
+    ap = argparse.ArgumentParser(description="Decode and summarize a directory of X-Plane capture files in parallel")
+    ap.add_argument("dir")
+    ap.add_argument("--jobs", type=int, default=None, help="worker processes. Default: nr of CPUs")
+    ap.add_argument("--csv", default=None, help="also write the table to this CSV file")
+    ap.add_argument("--no-cache", action="store_true", help="analyze every file again")
+    args = ap.parse_args(argv[1:])
+    rows, n = run(args.dir, args.jobs, not args.no_cache)
+    print(format_table(rows))
+    bad = sum(1 for r in rows if 'error' in r)
+    print("xp_batch: {} files, {} analyzed, {} failed".format(len(rows), n, bad), file=sys.stderr)
+    if args.csv:
+        write_csv(args.csv, rows)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,217 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Random access to big capture files (see xp_capture.py) without reading them into RAM.
+# The file is mmap-ed. A sparse index holds the time and byte offset of every 'step'-th record;
+# a time range is found with a binary search in the index and a short walk from there.
+# packets() returns zero-copy memoryview slices of the mapping.
+#
+# The index is kept next to the capture in <capture>.idx:
+#   magic b'XPIX0001', uint32 step, uint64 nr of bytes of the capture indexed, uint64 nr of packets,
+#   then per entry: double time, uint64 offset of the record
+# When the capture has grown (a recording still running) only the new part is indexed.
+# A capture shorter than the indexed size is indexed again.
+#
+#   python tools/xp_capreader.py session.xpcap --from 47:00 --to 48:00      (minutes:seconds from the start)
+import argparse
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_right
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from xp_capture import MAGIC, REC_HEAD  # noqa: E402
+
+IDX_MAGIC = b'XPIX0001'
+IDX_HEAD = struct.Struct("<IQQ")
+IDX_ENTRY = struct.Struct("<dQ")
+
+class CaptureReader():
+
+    def __init__(self, path, step=256, persist=True):
+        self.path = path
+        self.step = step        # a record of every 'step' packets is in the index
+        self.persist = persist  # keep the index in <path>.idx
+        self.f = None
+        self.mm = None
+        self.idx_t = []         # time of the indexed records
+        self.idx_o = []         # offset of the indexed records
+        self.end = len(MAGIC)   # nr of bytes of the capture indexed
+        self.nr_packets = 0
+
+    def open(self):
+        self.f = open(self.path, "rb")
+        if os.fstat(self.f.fileno()).st_size < len(MAGIC):  # e.g. left empty by an interrupted xp_capture.py
+            self.close()
+            raise ValueError("{}: not an X-Plane capture file (shorter than its magic)".format(self.path))
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("{}: not an X-Plane capture file".format(self.path))
+        if not (self.persist and self.load_index()):
+            self.idx_t = []
+            self.idx_o = []
+            self.end = len(MAGIC)
+            self.nr_packets = 0
+        if self.end < len(self.mm):
+            self.build_index()
+            if self.persist:
+                self.save_index()
+        return self
+
+    def close(self):
+        """Memoryviews returned by packets() must be released first"""
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def build_index(self):
+        """Index the records from self.end to the end of the capture"""
+        mm = self.mm
+        size = len(mm)
+        o = self.end
+        n = self.nr_packets
+        hl = REC_HEAD.size
+        unpack = REC_HEAD.unpack_from
+        while o + hl <= size:
+            t, ln = unpack(mm, o)
+            if o + hl + ln > size:
+                break  # last record not complete yet
+            if n % self.step == 0:
+                self.idx_t.append(t)
+                self.idx_o.append(o)
+            o += hl + ln
+            n += 1
+        self.end = o
+        self.nr_packets = n
+
+    def load_index(self):
+        try:
+            with open(self.path + ".idx", "rb") as f:
+                b = f.read()
+        except OSError:
+            return False
+        if len(b) < len(IDX_MAGIC) + IDX_HEAD.size or b[:len(IDX_MAGIC)] != IDX_MAGIC:
+            return False
+        step, end, n = IDX_HEAD.unpack_from(b, len(IDX_MAGIC))
+        if step != self.step or end > len(self.mm):
+            return False  # other step, or the capture was replaced by a shorter one
+        o = len(IDX_MAGIC) + IDX_HEAD.size
+        cnt = (len(b) - o) // IDX_ENTRY.size
+        t_lst = []
+        o_lst = []
+        for t, ofs in IDX_ENTRY.iter_unpack(b[o:o + cnt * IDX_ENTRY.size]):
+            t_lst.append(t)
+            o_lst.append(ofs)
+        if cnt != (n + self.step - 1) // self.step:
+            return False
+        if cnt and REC_HEAD.unpack_from(self.mm, o_lst[-1])[0] != t_lst[-1]:
+            return False  # the capture was replaced by another one
+        self.idx_t = t_lst
+        self.idx_o = o_lst
+        self.end = end
+        self.nr_packets = n
+        return True
+
+    def save_index(self):
+        tmp = self.path + ".idx.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(IDX_MAGIC)
+                f.write(IDX_HEAD.pack(self.step, self.end, self.nr_packets))
+                buf = bytearray(IDX_ENTRY.size * len(self.idx_t))
+                for i in range(len(self.idx_t)):
+                    IDX_ENTRY.pack_into(buf, i * IDX_ENTRY.size, self.idx_t[i], self.idx_o[i])
+                f.write(buf)
+            os.replace(tmp, self.path + ".idx")
+        except OSError as e:
+            print("xp_capreader: index not saved: {}".format(e), file=sys.stderr)
+
+    @property
+    def t_start(self):
+        return self.idx_t[0] if self.idx_t else None
+
+    def seek(self, t):
+        """Offset of an indexed record at or before time t, to start a walk from"""
+        i = bisect_right(self.idx_t, t) - 1
+        return self.idx_o[i] if i >= 0 else len(MAGIC)
+
+    def records(self, t0=None, t1=None):
+        """Yields (time, offset of the packet bytes, size) of the packets with t0 <= time <= t1"""
+        mm = self.mm
+        o = self.seek(t0) if t0 is not None else len(MAGIC)
+        hl = REC_HEAD.size
+        unpack = REC_HEAD.unpack_from
+        while o + hl <= self.end:
+            t, ln = unpack(mm, o)
+            if t1 is not None and t > t1:
+                break
+            if t0 is None or t >= t0:
+                yield t, o + hl, ln
+            o += hl + ln
+
+    def packets(self, t0=None, t1=None):
+        """Yields (time, memoryview of the packet) of the packets with t0 <= time <= t1. No bytes are copied;
+        release() the memoryviews (or copy with bytes()) before close()"""
+        mv = memoryview(self.mm)
+        try:
+            for t, o, n in self.records(t0, t1):
+                yield t, mv[o:o + n]
+        finally:
+            mv.release()
+
+    def packet_table(self, t0=None, t1=None):
+        """(times, offsets, sizes) of a time range, as xp_capture.scan(). For xp_np_decode.decode(reader.mm, ...)"""
+        times = []
+        offsets = []
+        sizes = []
+        for t, o, n in self.records(t0, t1):
+            times.append(t)
+            offsets.append(o)
+            sizes.append(n)
+        return times, offsets, sizes
+
+def parse_mmss(s):
+    m, _, sec = s.partition(':')
+    return int(m) * 60 + float(sec or 0)
+
+def main(argv):
+    ap = argparse.ArgumentParser(description="Index a capture file and list the packets of a time range")
+    ap.add_argument("path")
+    ap.add_argument("--from", dest="t_from", default=None, help="mm:ss from the start of the capture")
+    ap.add_argument("--to", dest="t_to", default=None, help="mm:ss from the start of the capture")
+    args = ap.parse_args(argv[1:])
+    with CaptureReader(args.path) as r:
+        if r.t_start is None:
+            print("{}: empty".format(args.path))
+            return 0
+        t0 = r.t_start + parse_mmss(args.t_from) if args.t_from else None
+        t1 = r.t_start + parse_mmss(args.t_to) if args.t_to else None
+        cnt = {}
+        nbytes = 0
+        for t, p in r.packets(t0, t1):
+            h = bytes(p[:4])
+            cnt[h] = cnt.get(h, 0) + 1
+            nbytes += len(p)
+            p.release()
+        print("{}: {} packets indexed, {} in range, {} bytes".format(args.path, r.nr_packets, sum(cnt.values()), nbytes))
+        for h in sorted(cnt):
+            print("  {}: {}".format(h.decode(errors='replace'), cnt[h]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,109 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Capture files of received X-Plane UDP packets, for analysis on a PC.
+#
+# File layout (little endian):
+#   magic b'XPCAP001'
+#   records: double time of reception (seconds since the epoch), uint32 packet size, the packet bytes
+#
+# Record X-Plane's packets on a PC in the LAN (Ctrl+C stops):
+#   python tools/xp_capture.py session.xpcap --port 49707 --group 239.255.1.1
+#   python tools/xp_capture.py session.xpcap --port 49002             (unicast, as USE_UDP_HOST="1")
+import argparse
+import socket
+import struct
+import sys
+import time
+
+MAGIC = b'XPCAP001'
+REC_HEAD = struct.Struct("<dI")
+
+class CaptureWriter():
+
+    def __init__(self, path):
+        self.f = open(path, "wb")
+        self.f.write(MAGIC)
+        self.cnt = 0
+
+    def write(self, t, packet):
+        self.f.write(REC_HEAD.pack(t, len(packet)))
+        self.f.write(packet)
+        self.cnt += 1
+
+    def close(self):
+        self.f.close()
+
+def scan(buf):
+    """Walk the records of a capture in buf (bytes, mmap, ...).
+    Returns (times, offsets, sizes) as lists: offset is the position of the packet bytes in buf"""
+    if bytes(buf[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not an X-Plane capture file (magic {!r})".format(bytes(buf[:len(MAGIC)])))
+    times = []
+    offsets = []
+    sizes = []
+    o = len(MAGIC)
+    end = len(buf)
+    unpack = REC_HEAD.unpack_from
+    hl = REC_HEAD.size
+    while o + hl <= end:
+        t, n = unpack(buf, o)
+        o += hl
+        if o + n > end:
+            break  # last record cut off (capture was interrupted)
+        times.append(t)
+        offsets.append(o)
+        sizes.append(n)
+        o += n
+    return times, offsets, sizes
+
+def read_capture(path):
+    """Yields (time, packet) of every record of the capture file path"""
+    with open(path, "rb") as f:
+        buf = f.read()
+    times, offsets, sizes = scan(buf)
+    for i in range(len(times)):
+        yield times[i], buf[offsets[i]:offsets[i] + sizes[i]]
+
+def open_socket(port, group=None):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(("", port))
+    if group:
+        mreq = struct.pack("=4sl", socket.inet_aton(group), socket.INADDR_ANY)
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    s.settimeout(1.0)
+    return s
+
+def main(argv):
+    ap = argparse.ArgumentParser(description="Record X-Plane UDP packets to a capture file")
+    ap.add_argument("path")
+    ap.add_argument("--port", type=int, default=49707)
+    ap.add_argument("--group", default=None, help="multicast group to join, e.g. 239.255.1.1")
+    ap.add_argument("--duration", type=float, default=0, help="seconds to record. 0 = until Ctrl+C")
+    args = ap.parse_args(argv[1:])
+    s = open_socket(args.port, args.group)
+    w = CaptureWriter(args.path)
+    t_end = time.time() + args.duration if args.duration else None
+    buf = bytearray(2048)
+    print("xp_capture: recording port {} to {}".format(args.port, args.path), file=sys.stderr)
+    try:
+        while t_end is None or time.time() < t_end:
+            try:
+                n = s.recv_into(buf)
+            except socket.timeout:
+                continue
+            w.write(time.time(), memoryview(buf)[:n])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        w.close()
+        s.close()
+    print("xp_capture: {} packets".format(w.cnt), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,100 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Generates example/xp_tables.py from the X-Plane Data Output schema tools/xp_schema.json.
+# Run on a PC (CPython 3), then copy xp_tables.py to the CIRCUITPY drive:
+#   python tools/xp_gen.py [schema] [output]
+#
+# The schema lists per DATA group index its title and 8 fields [name, struct type ('f' or 'i'), unit],
+# and per comma separated packet type (XGPS, XATT, XTRA) its fields [label, unit].
+# The generator checks the schema (8 fields per group, known types, field names unique over all groups
+# except the 'nothing' fillers) and writes the struct format of each 36 byte record ready to use,
+# so the device does no string handling to decode a group.
+# Only groups whose labels and units are checked against X-Plane's Data Output screen belong in the schema:
+# the field names become the keys of GetFields() and the NumPy columns. Records of other groups are skipped.
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCHEMA = os.path.join(HERE, "xp_schema.json")
+OUTPUT = os.path.join(HERE, "..", "example", "xp_tables.py")
+
+HEAD = '''# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Generated by tools/xp_gen.py from tools/xp_schema.json. Do not edit: change the schema and run
+#   python tools/xp_gen.py
+#
+# DATA_GROUPS: key = DATA group index,
+#   value = (title, struct format of the 36 byte record (index + 8 values), field names, units)
+# CSV_TYPES: key = header of a packet of comma separated values,
+#   value = (labels, units) of the values after the header
+#type:ignore
+
+'''
+
+def is_filler(name):
+    return name.startswith('nothing')
+
+def check(schema):
+    """Returns a list of errors"""
+    errors = []
+    seen = {}
+    indexes = set()
+    for g in schema["data"]:
+        idx = g["index"]
+        if idx in indexes:
+            errors.append("group {}: index used twice".format(idx))
+        indexes.add(idx)
+        if len(g["fields"]) != 8:
+            errors.append("group {}: {} fields, must be 8".format(idx, len(g["fields"])))
+        for name, typ, unit in g["fields"]:
+            if typ not in ('f', 'i'):
+                errors.append("group {}: field {}: type '{}' must be 'f' or 'i'".format(idx, name, typ))
+            if is_filler(name):
+                continue
+            if name in seen:
+                errors.append("group {}: field {} is also in group {}".format(idx, name, seen[name]))
+            seen[name] = idx
+    return errors
+
+def generate(schema):
+    out = [HEAD, "DATA_GROUPS = {\n"]
+    for g in sorted(schema["data"], key=lambda g: g["index"]):
+        fmt = "<i" + "".join(f[1] for f in g["fields"])
+        names = tuple(f[0] for f in g["fields"])
+        units = tuple(f[2] for f in g["fields"])
+        out.append("    {}: ({!r}, {!r},\n        {!r},\n        {!r}),\n".format(g["index"], g["title"], fmt, names, units))
+    out.append("}\n\nCSV_TYPES = {\n")
+    for header in sorted(schema["csv"]):
+        fields = schema["csv"][header]
+        out.append("    {!r}: ({!r},\n        {!r}),\n".format(
+            header, tuple(f[0] for f in fields), tuple(f[1] for f in fields)))
+    out.append("}\n")
+    return "".join(out)
+
+def main(argv):
+    src = argv[1] if len(argv) > 1 else SCHEMA
+    dst = argv[2] if len(argv) > 2 else OUTPUT
+    with open(src) as f:
+        schema = json.load(f)
+    errors = check(schema)
+    if errors:
+        for e in errors:
+            print("xp_gen: " + e, file=sys.stderr)
+        return 1
+    with open(dst, "w") as f:
+        f.write(generate(schema))
+    print("xp_gen: {} DATA groups, {} CSV packet types written to {}".format(
+        len(schema["data"]), len(schema["csv"]), os.path.normpath(dst)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
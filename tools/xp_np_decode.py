@@ -0,0 +1,129 @@
+# _*_ coding: utf-8 _*_
+# SPDX-FileCopyrightText: 2023 Paulus Schulinck
+#
+# SPDX-License-Identifier: MIT
+##############################
+#
+# Decodes all DATA packets of a capture file (see xp_capture.py) at once into NumPy structured arrays.
+# The group layouts are the generated tables of example/xp_tables.py, the same as used by
+# XPlaneUdpDatagram.msgs_unpack(): every 36 byte record is decoded by its own group index.
+#
+#   1. the capture is mmap-ed as one buffer (xp_capreader.py); only the record headers are walked in Python
+#   2. the start of every 36 byte record of every DATA packet is computed with np.repeat / np.arange
+#   3. all records are gathered at once from a strided view of the buffer and viewed as int32 index + 8 values
+#   4. one mask per group index selects its records, viewed with the dtype of the group
+#
+#   python tools/xp_np_decode.py session.xpcap       prints the nr of records per group
+import os
+import sys
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "example"))
+from xp_tables import DATA_GROUPS  # noqa: E402
+from xp_capture import scan  # noqa: E402
+from xp_capreader import CaptureReader  # noqa: E402
+
+REC_LEN = 36
+H_DATA = np.frombuffer(b'DATA', dtype='<u4')[0]
+
+def group_dtype(idx):
+    """The dtype of a record of DATA group idx: 'index' and the 8 fields of xp_tables.DATA_GROUPS"""
+    fmt = DATA_GROUPS[idx][1]
+    names = DATA_GROUPS[idx][2]
+    fields = [('index', '<i4')]
+    for i in range(8):
+        name = names[i]
+        if name.startswith('nothing'):
+            name = '_{}'.format(i)  # fillers may share a name
+        fields.append((name, '<f4' if fmt[i + 2] == 'f' else '<i4'))
+    return np.dtype(fields)
+
+GROUP_DTYPES = {idx: group_dtype(idx) for idx in DATA_GROUPS}
+
+def packet_table(buf, index=None):
+    """Times, offsets and sizes of the packets in buf as arrays. index: (times, offsets, sizes) as returned by
+    xp_capture.scan(), if already known"""
+    if index is None:
+        index = scan(buf)
+    t, o, n = index
+    return np.asarray(t, dtype=np.float64), np.asarray(o, dtype=np.int64), np.asarray(n, dtype=np.int64)
+
+def windows(buf, width, dtype=None):
+    """A view of buf with one item of 'width' bytes starting at every byte offset (no copy).
+    Indexing it with an array of offsets gathers those items"""
+    n = len(buf) - width + 1
+    return np.ndarray((max(n, 0),), dtype=dtype or np.dtype((np.void, width)), buffer=buf, strides=(1,))
+
+def data_records(buf, times, offsets, sizes):
+    """All 36 byte records of the DATA packets. Returns (records, time per record, packet nr per record).
+    records is an array of 36 byte items"""
+    ok = sizes >= 5 + REC_LEN
+    hdr = np.zeros(len(offsets), dtype='<u4')
+    hdr[ok] = windows(buf, 4, np.dtype('<u4'))[offsets[ok]]
+    pkt = np.nonzero(ok & (hdr == H_DATA))[0]
+    counts = (sizes[pkt] - 5) // REC_LEN
+    total = int(counts.sum())
+    first = np.cumsum(counts) - counts  # index of the first record of each packet
+    k = np.arange(total) - np.repeat(first, counts)  # record nr within its packet
+    starts = np.repeat(offsets[pkt] + 5, counts) + REC_LEN * k
+    return windows(buf, REC_LEN)[starts], np.repeat(times[pkt], counts), np.repeat(pkt, counts)
+
+def decode(buf, index=None):
+    """Decode a capture held in buf. Returns {group index: structured array} with fields 't' (time of the packet),
+    'packet' (packet nr in the capture) and the fields of the group"""
+    times, offsets, sizes = packet_table(buf, index)
+    recs, t, pkt = data_records(buf, times, offsets, sizes)
+    idx = recs.view(np.dtype([('index', '<i4'), ('v', 'V32')]))['index']
+    out = {}
+    for g in np.unique(idx):
+        dt = GROUP_DTYPES.get(int(g))
+        if dt is None:
+            continue  # not in the schema, as msgs_unpack() skips it
+        mask = idx == g
+        rows = recs[mask].view(dt)
+        a = np.empty(len(rows), dtype=[('t', '<f8'), ('packet', '<i8')] + [(n, dt[n]) for n in dt.names[1:]])
+        a['t'] = t[mask]
+        a['packet'] = pkt[mask]
+        for n in dt.names[1:]:
+            a[n] = rows[n]
+        out[int(g)] = a
+    return out
+
+def decode_file(path, t0=None, t1=None):
+    """Decode the packets of capture file path with t0 <= time <= t1. The file is mmap-ed (xp_capreader.py),
+    only the records in the range are read"""
+    with CaptureReader(path) as r:
+        return decode(r.mm, r.packet_table(t0, t1))
+
+def fields_table(groups):
+    """One row per DATA packet with all decoded fields (as GetFields()). Returns (t, {field name: float64 array}).
+    A field is NaN in the rows of packets without its group"""
+    pkts = np.unique(np.concatenate([a['packet'] for a in groups.values()])) if groups else np.zeros(0, np.int64)
+    t = np.zeros(len(pkts))
+    cols = {}
+    for a in groups.values():
+        row = np.searchsorted(pkts, a['packet'])
+        t[row] = a['t']
+        for n in a.dtype.names[2:]:
+            if n.startswith('_'):
+                continue
+            col = np.full(len(pkts), np.nan)
+            col[row] = a[n]
+            cols[n] = col
+    return t, cols
+
+def main(argv):
+    if len(argv) < 2:
+        print("usage: python tools/xp_np_decode.py <capture file> ...", file=sys.stderr)
+        return 2
+    for path in argv[1:]:
+        groups = decode_file(path)
+        print(path)
+        for g, a in sorted(groups.items()):
+            print("  group {:3d} {:40s} {:8d} records".format(g, DATA_GROUPS[g][0], len(a)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))